@@ -0,0 +1,151 @@
+'''
+Activity-level student analytics for a whole school:
+1. fetch_activity_stats
+2. fetch_student_session_panels
+
+Stats for every published activity come from one sessions fetch into a
+columnar SessionBatch, aggregated with pandas; there is never a
+request per activity. Metric definitions match student_metrics:
+completed means status "completed", and time spent is over completed
+sessions. fetch_student_session_panels reuses the same batch for the
+Student page's duration histogram and engagement heatmap, so the page
+fetches its sessions once.
+'''
+from datetime import date
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from persistent_cache import disk_cached
+from records import SESSION_STATUSES, SessionBatch
+from student_distributions import bin_session_batch, heatmap_session_batch
+from students_database_fetch import (
+    COMPLETED_STATUSES,
+    fetch_activity_session_batch,
+    fetch_published_activities_by_school
+)
+
+ACTIVITY_STATS_COLUMNS = [
+    "activity_id",
+    "activity_name",
+    "sessions_attempted",
+    "sessions_completed",
+    "completion_rate",
+    "mean_time_spent",
+    "median_time_spent",
+]
+
+
+def activity_stats_from_batch(batch: SessionBatch, activities: List[Dict]) -> pd.DataFrame:
+    """
+    fetch_activity_stats rows from the sessions of `activities`.
+    """
+
+    if not activities:
+        return pd.DataFrame(columns=ACTIVITY_STATS_COLUMNS)
+
+    names = pd.Series(
+        {a["id"]: a["name"] for a in activities}, name="activity_name"
+    )
+
+    completed_codes = [SESSION_STATUSES.index(s) for s in COMPLETED_STATUSES]
+    index = np.frombuffer(batch.activity_index, dtype=np.uint32)
+
+    sessions = pd.DataFrame({
+        "activity_id": np.asarray(batch.activity_ids, dtype=object)[index],
+        "completed": np.isin(
+            np.frombuffer(batch.status_codes, dtype=np.int8), completed_codes
+        ),
+        "minutes": np.frombuffer(batch.duration_minutes, dtype=np.float64),
+    })
+
+    by_activity = sessions.groupby("activity_id")
+
+    stats = pd.DataFrame(index=names.index)
+    stats["activity_name"] = names
+    stats["sessions_attempted"] = by_activity.size()
+    stats["sessions_completed"] = by_activity["completed"].sum()
+
+    stats[["sessions_attempted", "sessions_completed"]] = (
+        stats[["sessions_attempted", "sessions_completed"]]
+        .fillna(0)
+        .astype("int64")
+    )
+
+    stats["completion_rate"] = (
+        stats["sessions_completed"]
+        / stats["sessions_attempted"].replace(0, np.nan)
+        * 100
+    ).fillna(0)
+
+    times = (
+        sessions[sessions["completed"]]
+        .dropna(subset=["minutes"])
+        .groupby("activity_id")["minutes"]
+        .agg(["mean", "median"])
+    )
+    stats["mean_time_spent"] = times["mean"]
+    stats["median_time_spent"] = times["median"]
+
+    stats[["mean_time_spent", "median_time_spent"]] = (
+        stats[["mean_time_spent", "median_time_spent"]].fillna(0)
+    )
+
+    return (
+        stats.rename_axis("activity_id")
+        .reset_index()[ACTIVITY_STATS_COLUMNS]
+    )
+
+
+@disk_cached(ttl=300)
+def fetch_activity_stats(
+    supabase,
+    school_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> pd.DataFrame:
+    """
+    One row per published activity: sessions attempted and completed,
+    completion rate (%) and mean / median minutes of completed sessions.
+    Activities without sessions are included with zeros.
+    """
+
+    activities = fetch_published_activities_by_school(
+        supabase, school_id, start_date, end_date
+    )
+
+    batch = fetch_activity_session_batch(
+        supabase, school_id, [a["id"] for a in activities], start_date, end_date
+    )
+
+    return activity_stats_from_batch(batch, activities)
+
+
+@disk_cached(ttl=300)
+def fetch_student_session_panels(
+    supabase,
+    school_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> Dict[str, pd.DataFrame]:
+    """
+    The Student page's session panels from one sessions fetch:
+    activity_stats (as fetch_activity_stats), histogram (as
+    fetch_session_duration_histogram) and heatmap (as
+    fetch_engagement_heatmap).
+    """
+
+    activities = fetch_published_activities_by_school(
+        supabase, school_id, start_date, end_date
+    )
+
+    batch = fetch_activity_session_batch(
+        supabase, school_id, [a["id"] for a in activities], start_date, end_date
+    )
+
+    return {
+        "activity_stats": activity_stats_from_batch(batch, activities),
+        "histogram": bin_session_batch(batch),
+        "heatmap": heatmap_session_batch(batch),
+    }
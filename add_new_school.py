@@ -4,13 +4,15 @@ import os
 from datetime import datetime, time
 from typing import Dict
 
+from resilience import execute, client_options
+
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
 
-supabase: Client = create_client( SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY )
+supabase: Client = create_client( SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, options=client_options() )
 
 def insert_school(
         supabase, 
@@ -43,11 +45,11 @@ def insert_school(
         "board_id": board_id,
     }
 
-    response = (
+    response = execute(
         supabase
         .table("schools")
-        .insert(payload)
-        .execute()
+        .insert(payload),
+        idempotent=False
     )
 
     if response.data is None:
@@ -0,0 +1,432 @@
+'''
+Headless JSON API over the dashboard's fetch layer:
+1. GET /schools/<school_id>/activity-stats
+2. GET /schools/<school_id>/student-metrics
+3. GET /schools/<school_id>/study-material-stats
+4. GET /schools/<school_id>/comparison
+5. GET /health
+
+Endpoints 1-3 take optional `start` / `end` (YYYY-MM-DD) parameters;
+the comparison takes `start_a`, `end_a`, `start_b` and `end_b`. Any
+other query parameter is ignored, and is not part of the cache key.
+
+The server is a small asyncio HTTP/1.1 loop (keep-alive, GET only).
+Fetch functions are blocking, so they run on a thread pool of
+API_WORKERS; the event loop only parses requests and writes replies.
+Responses are cached in memory for API_CACHE_TTL seconds, identical
+requests arriving together share one fetch, and every response
+carries an ETag so clients can revalidate with If-None-Match (304).
+Below that, the fetch functions still use the shared disk cache.
+
+Environment:
+    KIBU_API_WORKERS     fetch threads (default 16)
+    KIBU_API_CACHE_TTL   seconds a response is reused (default 60)
+
+Usage:
+    python analytics_api.py --port 8081
+    curl localhost:8081/schools/<school_id>/student-metrics?start=2025-09-01
+'''
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from http import HTTPStatus
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from cassette import CassetteMiss
+from concurrency_governor import AdmissionTimeout
+from resilience import BackendUnavailable
+
+API_WORKERS = int(os.getenv("KIBU_API_WORKERS", "16"))
+API_CACHE_TTL = float(os.getenv("KIBU_API_CACHE_TTL", "60"))
+API_CACHE_SIZE = 1024
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 64 * 1024   # GET bodies are read and discarded
+KEEP_ALIVE_TIMEOUT = 15  # seconds an idle connection is kept open
+
+logger = logging.getLogger(__name__)
+
+_SCHOOL_ROUTE = re.compile(r"^/schools/(?P<school_id>[^/]+)/(?P<view>[a-z-]+)/?$")
+
+
+class BadRequest(Exception):
+    """
+    Invalid parameters; answered with 400.
+    """
+
+
+# --------------------------------------------------
+# UTILITY: PARAMETERS AND JSON
+# --------------------------------------------------
+def _date_param(params: Dict[str, str], name: str) -> Optional[date]:
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be a date (YYYY-MM-DD)")
+
+
+def _period(params: Dict[str, str], start: str, end: str) -> Tuple[Optional[date], Optional[date]]:
+    start_date = _date_param(params, start)
+    end_date = _date_param(params, end)
+    if start_date and end_date and start_date > end_date:
+        raise BadRequest(f"{start} cannot be after {end}")
+    return start_date, end_date
+
+
+def _json_default(value: Any):
+    # numpy / pandas scalars
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def encode_json(payload: Any) -> bytes:
+    return json.dumps(
+        payload, default=_json_default, separators=(",", ":")
+    ).encode("utf-8")
+
+
+# --------------------------------------------------
+# VIEWS (BLOCKING; RUN ON THE THREAD POOL)
+# --------------------------------------------------
+def _activity_stats(supabase, school_id, params):
+    from teachers_database_fetch import fetch_school_activity_stats
+
+    start_date, end_date = _period(params, "start", "end")
+    return fetch_school_activity_stats(supabase, school_id, start_date, end_date)
+
+
+def _student_metrics(supabase, school_id, params):
+    from student_metrics import fetch_student_metrics
+
+    start_date, end_date = _period(params, "start", "end")
+    return fetch_student_metrics(supabase, school_id, start_date, end_date)
+
+
+def _study_material_stats(supabase, school_id, params):
+    from study_materials_database_fetch import fetch_study_material_stats
+
+    start_date, end_date = _period(params, "start", "end")
+    return fetch_study_material_stats(supabase, school_id, start_date, end_date)
+
+
+def _comparison(supabase, school_id, params):
+    from comparative_analysis import compare_school_performance
+
+    start_a, end_a = _period(params, "start_a", "end_a")
+    start_b, end_b = _period(params, "start_b", "end_b")
+    return compare_school_performance(
+        supabase,
+        school_id,
+        period_a={"start": start_a, "end": end_a},
+        period_b={"start": start_b, "end": end_b},
+    )
+
+
+VIEWS: Dict[str, Callable] = {
+    "activity-stats": _activity_stats,
+    "student-metrics": _student_metrics,
+    "study-material-stats": _study_material_stats,
+    "comparison": _comparison,
+}
+
+# Query parameters each view reads; the cache key is built from these
+# only, so arbitrary extra parameters cannot fill the cache
+VIEW_PARAMS: Dict[str, Tuple[str, ...]] = {
+    "activity-stats": ("start", "end"),
+    "student-metrics": ("start", "end"),
+    "study-material-stats": ("start", "end"),
+    "comparison": ("start_a", "end_a", "start_b", "end_b"),
+}
+
+
+def _content_length(headers: Dict[str, str]) -> int:
+    """
+    The request body size, or BadRequest for a malformed or oversized
+    Content-Length.
+    """
+    raw = headers.get("content-length") or "0"
+    if not re.fullmatch(r"[0-9]+", raw):
+        raise BadRequest("Invalid Content-Length")
+    length = int(raw)
+    if length > MAX_BODY_BYTES:
+        raise BadRequest("Request body too large")
+    return length
+
+
+# --------------------------------------------------
+# RESPONSE CACHE
+# --------------------------------------------------
+class ResponseCache:
+    """
+    TTL + LRU cache of encoded responses. Concurrent misses for the
+    same key wait for a single computation.
+    """
+
+    def __init__(self, ttl: float = API_CACHE_TTL, max_size: int = API_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple, Tuple[float, bytes, str]]" = OrderedDict()
+        self._pending: Dict[Tuple, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def put(self, key: Tuple, body: bytes) -> Tuple[bytes, str]:
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, body, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return body, etag
+
+    async def get_or_compute(self, key: Tuple, compute: Callable) -> Tuple[bytes, str]:
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+
+        try:
+            result = self.put(key, await compute())
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieved by waiters, if any; avoids "never retrieved" noise
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+
+# --------------------------------------------------
+# SERVER
+# --------------------------------------------------
+class AnalyticsAPI:
+    def __init__(self, supabase, workers: int = API_WORKERS, cache_ttl: float = API_CACHE_TTL):
+        self.supabase = supabase
+        self.cache = ResponseCache(ttl=cache_ttl)
+        self.requests = 0
+        self.started = time.monotonic()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="api"
+        )
+
+    async def dispatch(self, target: str) -> Tuple[int, Optional[bytes], Optional[str]]:
+        """
+        Returns (status, body, etag) for a request target.
+        """
+
+        url = urlsplit(target)
+
+        if url.path.rstrip("/") == "/health":
+            return HTTPStatus.OK, encode_json(self.health()), None
+
+        match = _SCHOOL_ROUTE.match(url.path)
+        view = VIEWS.get(match.group("view")) if match else None
+        if view is None:
+            return HTTPStatus.NOT_FOUND, encode_json({"error": "Not found"}), None
+
+        name = match.group("view")
+        school_id = match.group("school_id")
+        params = {
+            k: v for k, v in parse_qsl(url.query) if k in VIEW_PARAMS[name]
+        }
+        key = (name, school_id, tuple(sorted(params.items())))
+
+        async def compute() -> bytes:
+            result = await asyncio.get_running_loop().run_in_executor(
+                self._executor, view, self.supabase, school_id, params
+            )
+            return encode_json(result)
+
+        try:
+            body, etag = await self.cache.get_or_compute(key, compute)
+        except BadRequest as e:
+            return HTTPStatus.BAD_REQUEST, encode_json({"error": str(e)}), None
+        except (BackendUnavailable, AdmissionTimeout, CassetteMiss) as e:
+            return HTTPStatus.SERVICE_UNAVAILABLE, encode_json({"error": str(e)}), None
+        except Exception:
+            logger.exception("API request failed: %s", target)
+            return (
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+                encode_json({"error": "Internal error"}),
+                None
+            )
+
+        return HTTPStatus.OK, body, etag
+
+    def health(self) -> Dict:
+        from concurrency_governor import governor_stats
+
+        return {
+            "status": "ok",
+            "uptime": time.monotonic() - self.started,
+            "requests": self.requests,
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+            "backend": governor_stats(),
+        }
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT
+                    )
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, asyncio.LimitOverrunError):
+                    break
+
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self._reply(writer, HTTPStatus.BAD_REQUEST, b"", None, False)
+                    break
+
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = _content_length(headers)
+                except BadRequest as e:
+                    # The body cannot be framed; answer and drop the connection
+                    await self._reply(
+                        writer,
+                        HTTPStatus.BAD_REQUEST,
+                        encode_json({"error": str(e)}),
+                        None,
+                        False
+                    )
+                    break
+
+                if length:
+                    await reader.readexactly(length)
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = (
+                    connection != "close"
+                    if version == "HTTP/1.1"
+                    else connection == "keep-alive"
+                )
+
+                self.requests += 1
+
+                if method not in ("GET", "HEAD"):
+                    status, body, etag = (
+                        HTTPStatus.METHOD_NOT_ALLOWED,
+                        encode_json({"error": "Only GET is supported"}),
+                        None
+                    )
+                else:
+                    status, body, etag = await self.dispatch(target)
+
+                if etag is not None and headers.get("if-none-match") == etag:
+                    status, body = HTTPStatus.NOT_MODIFIED, None
+
+                await self._reply(
+                    writer, status, body, etag, keep_alive, head_only=method == "HEAD"
+                )
+
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _reply(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        body: Optional[bytes],
+        etag: Optional[str],
+        keep_alive: bool,
+        head_only: bool = False
+    ) -> None:
+        body = body or b""
+        headers = [
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+            f"Content-Length: {0 if status == HTTPStatus.NOT_MODIFIED else len(body)}",
+            "Connection: " + ("keep-alive" if keep_alive else "close"),
+        ]
+        if status != HTTPStatus.NOT_MODIFIED:
+            headers.append("Content-Type: application/json")
+        if etag is not None:
+            headers.append(f"ETag: {etag}")
+            headers.append(f"Cache-Control: max-age={int(self.cache.ttl)}")
+
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1"))
+        if not head_only and status != HTTPStatus.NOT_MODIFIED:
+            writer.write(body)
+        await writer.drain()
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(
+            self.handle_connection, host, port, limit=MAX_HEADER_BYTES
+        )
+        logger.info("Analytics API listening on %s:%s", host, port)
+        async with server:
+            await server.serve_forever()
+
+
+# --------------------------------------------------
+# CLI
+# --------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve dashboard KPIs as a JSON API."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--workers", type=int, default=API_WORKERS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    from students_database_fetch import supabase
+
+    api = AnalyticsAPI(supabase, workers=args.workers)
+
+    try:
+        asyncio.run(api.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+'''
+Record / replay of Supabase responses, to run the dashboard offline:
+1. Cassette
+2. cassette_mode / configure
+3. record / record_error / replay (called by resilience.execute)
+
+In record mode every successful backend call, and every API error
+the backend answered with, is stored in a cassette file, keyed by the
+normalized query (`resilience.query_key`: method, table or RPC,
+filters, columns, order, range, headers and RPC params).
+In replay mode no request leaves the process: responses come from the
+cassette, and a query that was never recorded raises CassetteMiss.
+
+A cassette is one SQLite file holding zlib-compressed JSON bodies and
+the latency observed while recording, so it can be handed to someone
+else as a reproducer of a slow page. With KIBU_CASSETTE_LATENCY=1,
+replay sleeps for the recorded latency, for profiling with realistic
+waits but no network variance.
+
+The Supabase client is still created at import, so offline runs need
+some SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY set (any values).
+
+Environment:
+    KIBU_CASSETTE_MODE      off (default), record or replay
+    KIBU_CASSETTE_PATH      cassette file (default: kibu_cassette.sqlite3)
+    KIBU_CASSETTE_LATENCY   set to 1 to replay recorded latencies
+
+Usage:
+    KIBU_CASSETTE_MODE=record streamlit run dashboard.py
+    KIBU_CASSETTE_MODE=replay streamlit run dashboard.py
+    python cassette.py kibu_cassette.sqlite3     # summary per endpoint
+'''
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+from postgrest.exceptions import APIError
+
+CASSETTE_MODES = ["off", "record", "replay"]
+
+CASSETTE_MODE = os.getenv("KIBU_CASSETTE_MODE", "off")
+CASSETTE_PATH = os.getenv("KIBU_CASSETTE_PATH", "kibu_cassette.sqlite3")
+REPLAY_LATENCY = os.getenv("KIBU_CASSETTE_LATENCY", "0") == "1"
+
+if CASSETTE_MODE not in CASSETTE_MODES:
+    raise ValueError(f"Unsupported KIBU_CASSETTE_MODE: {CASSETTE_MODE}")
+
+
+class CassetteMiss(Exception):
+    """
+    Raised in replay mode for a query the cassette does not contain.
+    """
+
+
+class CassetteResponse:
+    """
+    Stand-in for a postgrest APIResponse: `.data` and `.count`.
+    """
+
+    __slots__ = ("data", "count")
+
+    def __init__(self, data: Any, count: Optional[int]):
+        self.data = data
+        self.count = count
+
+
+# --------------------------------------------------
+# STORE
+# --------------------------------------------------
+class Cassette:
+    """
+    Recorded responses in a SQLite file. Safe to record into from many
+    threads at once.
+    """
+
+    def __init__(self, path: str = CASSETTE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    endpoint TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    count INTEGER,
+                    error INTEGER NOT NULL DEFAULT 0,
+                    latency REAL NOT NULL,
+                    recorded_at REAL NOT NULL
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def put(
+        self,
+        key: str,
+        endpoint: str,
+        data: Any,
+        count: Optional[int],
+        latency: float,
+        error: bool = False
+    ) -> None:
+        body = zlib.compress(
+            json.dumps(data, separators=(",", ":"), default=str).encode("utf-8"), 9
+        )
+        self._connect().execute(
+            "INSERT OR REPLACE INTO responses "
+            "(key, endpoint, body, count, error, latency, recorded_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, endpoint, body, count, int(error), latency, time.time())
+        )
+
+    def get(self, key: str) -> Optional[Dict]:
+        row = self._connect().execute(
+            "SELECT body, count, error, latency FROM responses WHERE key = ?",
+            (key,)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        return {
+            "data": json.loads(zlib.decompress(row[0])),
+            "count": row[1],
+            "error": bool(row[2]),
+            "latency": row[3],
+        }
+
+    def summary(self) -> List[Dict]:
+        """
+        Entries, stored bytes and mean recorded latency per endpoint.
+        """
+        rows = self._connect().execute(
+            "SELECT endpoint, COUNT(*), SUM(LENGTH(body)), AVG(latency) "
+            "FROM responses GROUP BY endpoint ORDER BY COUNT(*) DESC"
+        ).fetchall()
+
+        return [
+            {
+                "endpoint": endpoint,
+                "responses": n,
+                "bytes": size,
+                "mean_latency": latency,
+            }
+            for endpoint, n, size, latency in rows
+        ]
+
+
+_mode = CASSETTE_MODE
+_replay_latency = REPLAY_LATENCY
+_cassette: Optional[Cassette] = None
+_cassette_lock = threading.Lock()
+
+
+def cassette_mode() -> str:
+    return _mode
+
+
+def configure(mode: str, path: str = CASSETTE_PATH, latency: Optional[bool] = None) -> None:
+    """
+    Switches mode / cassette file (and optionally latency replay) at
+    runtime, e.g. from a load test, overriding the environment.
+    """
+
+    global _mode, _cassette, _replay_latency
+
+    if mode not in CASSETTE_MODES:
+        raise ValueError(f"Unsupported cassette mode: {mode}")
+
+    with _cassette_lock:
+        _mode = mode
+        _cassette = None if mode == "off" else Cassette(path)
+        if latency is not None:
+            _replay_latency = latency
+
+
+def get_cassette() -> Cassette:
+    global _cassette
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette()
+        return _cassette
+
+
+# --------------------------------------------------
+# HOOKS FOR resilience.execute
+# --------------------------------------------------
+def _key(query) -> str:
+    from resilience import query_key
+
+    return hashlib.sha256(repr(query_key(query)).encode("utf-8")).hexdigest()
+
+
+def record(query, response, latency: float) -> None:
+    from resilience import endpoint_name
+
+    get_cassette().put(
+        _key(query),
+        endpoint_name(query),
+        response.data,
+        getattr(response, "count", None),
+        latency
+    )
+
+
+def record_error(query, error: APIError, latency: float) -> None:
+    """
+    Records an API error (missing RPC, bad filter ...), so replay
+    takes the same fallback path as the recorded run.
+    """
+    from resilience import endpoint_name
+
+    get_cassette().put(
+        _key(query),
+        endpoint_name(query),
+        error.json(),
+        None,
+        latency,
+        error=True
+    )
+
+
+def replay(query) -> CassetteResponse:
+    entry = get_cassette().get(_key(query))
+
+    if entry is None:
+        from resilience import endpoint_name
+
+        raise CassetteMiss(
+            f"No recorded response for {endpoint_name(query)} "
+            f"in {get_cassette().path}"
+        )
+
+    if _replay_latency:
+        time.sleep(entry["latency"])
+
+    if entry["error"]:
+        raise APIError(entry["data"])
+
+    return CassetteResponse(entry["data"], entry["count"])
+
+
+# --------------------------------------------------
+# CLI
+# --------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Summarize a recorded Supabase cassette."
+    )
+    parser.add_argument("path", nargs="?", default=CASSETTE_PATH)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        parser.error(f"No cassette at {args.path}")
+
+    for row in Cassette(args.path).summary():
+        print(
+            f"{row['endpoint']:<45} {row['responses']:>6} responses "
+            f"{row['bytes'] / 1024:>9.1f} KiB "
+            f"{row['mean_latency'] * 1000:>8.1f} ms avg"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import streamlit as st
 from datetime import date
-from typing import Dict
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 import os
 from supabase import create_client, Client
@@ -8,6 +8,8 @@ import pandas as pd
 
 from teachers_database_fetch import fetch_school_activity_stats
 from students_database_fetch import fetch_school_student_stats
+from regional_rollups import fetch_school_partials
+from resilience import client_options
 
 load_dotenv()
 
@@ -16,7 +18,8 @@ SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
 supabase: Client = create_client(
     SUPABASE_URL,
-    SUPABASE_SERVICE_ROLE_KEY
+    SUPABASE_SERVICE_ROLE_KEY,
+    options=client_options()
 )
 
 def calculate_delta(old: float, new: float) -> dict:
@@ -67,12 +70,17 @@ def compare_teacher_stats(
         start_a: date,
         end_a: date,
         start_b: date,
-        end_b: date
+        end_b: date,
+        index=None
     ) -> Dict:
 
-    stats_a = fetch_school_activity_stats(supabase, school_id, start_date=start_a, end_date=end_a)
+    if index is not None:
+        stats_a = index.activity_stats(start_a, end_a)
+        stats_b = index.activity_stats(start_b, end_b)
+    else:
+        stats_a = fetch_school_activity_stats(supabase, school_id, start_date=start_a, end_date=end_a)
 
-    stats_b = fetch_school_activity_stats(supabase, school_id, start_date=start_b, end_date=end_b)
+        stats_b = fetch_school_activity_stats(supabase, school_id, start_date=start_b, end_date=end_b)
 
     return {
         "total_activities": calculate_delta(
@@ -92,21 +100,26 @@ def compare_student_stats(
         start_a: date,
         end_a: date,
         start_b: date,
-        end_b: date
+        end_b: date,
+        index=None
     ) -> Dict:
-    stats_a = fetch_school_student_stats(
-        supabase,
-        school_id,
-        start_date=start_a,
-        end_date=end_a
-    )
+    if index is not None:
+        stats_a = index.school_student_stats(start_a, end_a)
+        stats_b = index.school_student_stats(start_b, end_b)
+    else:
+        stats_a = fetch_school_student_stats(
+            supabase,
+            school_id,
+            start_date=start_a,
+            end_date=end_a
+        )
 
-    stats_b = fetch_school_student_stats(
-        supabase,
-        school_id,
-        start_date=start_b,
-        end_date=end_b
-    )
+        stats_b = fetch_school_student_stats(
+            supabase,
+            school_id,
+            start_date=start_b,
+            end_date=end_b
+        )
 
     return {
         "total_activities_posted": calculate_delta(
@@ -138,13 +151,17 @@ def compare_school_performance(
     supabase,
     school_id,
     period_a: Dict[str, date],
-    period_b: Dict[str, date]
+    period_b: Dict[str, date],
+    index=None
 ) -> Dict:
     """
     Compare school performance across two periods.
 
     period_a = { "start": date, "end": date }
     period_b = { "start": date, "end": date }
+
+    With a school RangeIndex (range_index.py) both periods are answered
+    from memory, without backend calls.
     """
 
     teacher_comparison = compare_teacher_stats(
@@ -153,7 +170,8 @@ def compare_school_performance(
         period_a["start"],
         period_a["end"],
         period_b["start"],
-        period_b["end"]
+        period_b["end"],
+        index=index
     )
 
     student_comparison = compare_student_stats(
@@ -162,7 +180,8 @@ def compare_school_performance(
         period_a["start"],
         period_a["end"],
         period_b["start"],
-        period_b["end"]
+        period_b["end"],
+        index=index
     )
 
     return {
@@ -171,6 +190,82 @@ def compare_school_performance(
     }
 
 
+# --------------------------------------------------
+# MULTI-SCHOOL COMPARISON (SAME PERIOD)
+# --------------------------------------------------
+# Comparison metric -> RollupPartial metric
+SCHOOL_COMPARISON_METRICS = {
+    "total_activities": "total_activities",
+    "median_activities_per_teacher": "median_activities_per_teacher",
+    "total_activities_posted": "published_activities",
+    "total_sessions_attempted": "sessions_attempted",
+    "completion_rate": "completion_rate",
+    "mean_time_spent": "mean_time_spent",
+    "median_time_spent": "median_time_spent",
+}
+
+# Medians from the rollup sketches, within
+# sketches.DEFAULT_RELATIVE_ACCURACY; every other metric is exact
+APPROXIMATE_METRICS = ["median_activities_per_teacher", "median_time_spent"]
+
+
+def compare_schools(
+    supabase,
+    school_ids: List,
+    baseline_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> Dict:
+    """
+    Compare several schools over the same period against a baseline.
+
+    All schools are fetched together with school-grouped queries, so
+    the number of round trips does not grow with the number of schools.
+    The medians come from the partials' sketches and are approximate
+    (APPROXIMATE_METRICS).
+
+    Returns:
+    {
+        metrics: DataFrame (one row per school_id),
+        deltas: { school_id: { metric: calculate_delta(baseline, school) } },
+        approximate: [metric, ...]
+    }
+    """
+
+    if baseline_id not in school_ids:
+        school_ids = [baseline_id] + list(school_ids)
+
+    partials = fetch_school_partials(supabase, school_ids, start_date, end_date)
+
+    rows = {}
+    for school_id in school_ids:
+        school_metrics = partials[school_id].metrics()
+        rows[school_id] = {
+            name: school_metrics[source]
+            for name, source in SCHOOL_COMPARISON_METRICS.items()
+        }
+
+    baseline = rows[baseline_id]
+
+    deltas = {
+        school_id: {
+            name: calculate_delta(baseline[name], row[name])
+            for name in SCHOOL_COMPARISON_METRICS
+        }
+        for school_id, row in rows.items()
+        if school_id != baseline_id
+    }
+
+    metrics = pd.DataFrame.from_dict(rows, orient="index")
+    metrics.index.name = "school_id"
+
+    return {
+        "metrics": metrics,
+        "deltas": deltas,
+        "approximate": APPROXIMATE_METRICS
+    }
+
+
 def render_comparison_bar_chart(title, value_a, value_b, unit=None):
     """
     Renders a simple A vs B bar chart.
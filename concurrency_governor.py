@@ -0,0 +1,304 @@
+'''
+Process-wide admission control for Supabase calls:
+1. admit (used by resilience.execute around every attempt)
+2. request_priority / current_priority
+3. governor_stats
+
+Every backend call needs a slot before it is sent: at most
+MAX_CONCURRENT calls are in flight per process, and at most
+TABLE_LIMITS[endpoint] (DEFAULT_TABLE_LIMIT otherwise) per table or
+RPC, so heavy raw-session scans cannot take every connection. RPCs
+additionally draw a token from a per-RPC token bucket.
+
+Waiting calls are admitted by priority: interactive page fetches
+before background prefetches before exports, oldest first within a
+level. A call's priority rises one level per PRIORITY_AGING seconds
+waited, so lower levels are delayed, not starved. Waiting callers
+leave the queue as soon as their fetch scope is cancelled.
+
+Environment:
+    KIBU_MAX_CONCURRENT    calls in flight per process (default 12)
+    KIBU_MAX_PER_TABLE     default per-table limit (default 6)
+    KIBU_RPC_RATE          RPC calls per second, per RPC (default 10)
+    KIBU_ADMISSION_TIMEOUT seconds to wait for a slot (default 60)
+'''
+import contextlib
+import contextvars
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from fetch_tasks import check_cancelled
+
+INTERACTIVE = 0
+BACKGROUND = 1
+EXPORT = 2
+
+PRIORITY_NAMES = {
+    INTERACTIVE: "interactive",
+    BACKGROUND: "background",
+    EXPORT: "export",
+}
+
+MAX_CONCURRENT = int(os.getenv("KIBU_MAX_CONCURRENT", "12"))
+DEFAULT_TABLE_LIMIT = int(os.getenv("KIBU_MAX_PER_TABLE", "6"))
+
+# Raw scans of the large tables get fewer slots than the default
+TABLE_LIMITS = {
+    "activity_sessions": 4,
+    "student_tool_runs": 4,
+}
+
+RPC_RATE = float(os.getenv("KIBU_RPC_RATE", "10"))  # calls per second
+RPC_BURST = 2 * RPC_RATE
+
+ADMISSION_TIMEOUT = float(os.getenv("KIBU_ADMISSION_TIMEOUT", "60"))
+PRIORITY_AGING = 10.0  # seconds waited per priority level gained
+POLL_INTERVAL = 0.1    # seconds between cancellation checks while queued
+
+WAIT_WINDOW = 500
+
+_priority: contextvars.ContextVar = contextvars.ContextVar(
+    "request_priority", default=INTERACTIVE
+)
+
+
+class AdmissionTimeout(Exception):
+    """
+    Raised when a call waited longer than ADMISSION_TIMEOUT for a slot.
+    """
+
+
+# --------------------------------------------------
+# PRIORITY
+# --------------------------------------------------
+def current_priority() -> int:
+    return _priority.get()
+
+
+@contextlib.contextmanager
+def request_priority(level: int):
+    """
+    Backend calls made inside the block (and in fetch threads started
+    from it) are queued at `level`.
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+# --------------------------------------------------
+# TOKEN BUCKET
+# --------------------------------------------------
+class TokenBucket:
+    """
+    `rate` tokens per second, holding at most `burst`. Not thread-safe;
+    the governor calls it under its own lock.
+    """
+
+    def __init__(self, rate: float = RPC_RATE, burst: float = RPC_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> bool:
+        self._refill()
+        return self.tokens >= 1
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def wait_time(self) -> float:
+        """
+        Seconds until the next token.
+        """
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+# --------------------------------------------------
+# GOVERNOR
+# --------------------------------------------------
+class _Waiter:
+    __slots__ = ("endpoint", "priority", "seq", "queued_at")
+
+    def __init__(self, endpoint: str, priority: int, seq: int):
+        self.endpoint = endpoint
+        self.priority = priority
+        self.seq = seq
+        self.queued_at = time.monotonic()
+
+    def rank(self, now: float):
+        aged = self.priority - int((now - self.queued_at) / PRIORITY_AGING)
+        return max(INTERACTIVE, aged), self.seq
+
+
+class ConcurrencyGovernor:
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT,
+        table_limits: Optional[Dict[str, int]] = None,
+        default_table_limit: int = DEFAULT_TABLE_LIMIT
+    ):
+        self.max_concurrent = max_concurrent
+        self.table_limits = dict(TABLE_LIMITS if table_limits is None else table_limits)
+        self.default_table_limit = default_table_limit
+
+        self.in_flight = 0
+        self.in_flight_by_table: Dict[str, int] = {}
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.waiters = []
+        self.waits: Dict[int, deque] = {
+            level: deque(maxlen=WAIT_WINDOW) for level in PRIORITY_NAMES
+        }
+        self.timeouts = 0
+
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def limit_for(self, endpoint: str) -> int:
+        return self.table_limits.get(endpoint, self.default_table_limit)
+
+    def _bucket(self, endpoint: str) -> Optional[TokenBucket]:
+        if not endpoint.startswith("rpc/"):
+            return None
+        if endpoint not in self.buckets:
+            self.buckets[endpoint] = TokenBucket()
+        return self.buckets[endpoint]
+
+    def _admissible(self, endpoint: str) -> bool:
+        if self.in_flight_by_table.get(endpoint, 0) >= self.limit_for(endpoint):
+            return False
+        bucket = self._bucket(endpoint)
+        return bucket is None or bucket.available()
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        """
+        Highest ranked waiter that could start now. Waiters blocked on
+        their own table or RPC rate do not hold up other tables.
+        """
+
+        if self.in_flight >= self.max_concurrent:
+            return None
+
+        now = time.monotonic()
+        candidates = [w for w in self.waiters if self._admissible(w.endpoint)]
+        return min(candidates, key=lambda w: w.rank(now), default=None)
+
+    def _wait_timeout(self, endpoint: str, deadline: float) -> float:
+        timeout = min(POLL_INTERVAL, deadline - time.monotonic())
+        bucket = self._bucket(endpoint)
+        if bucket is not None and not bucket.available():
+            timeout = min(timeout, bucket.wait_time())
+        return max(0.0, timeout)
+
+    def acquire(self, endpoint: str, priority: int, timeout: float = ADMISSION_TIMEOUT) -> float:
+        """
+        Blocks until `endpoint` may be called. Returns the seconds waited.
+        """
+
+        with self._cond:
+            waiter = _Waiter(endpoint, priority, next(self._seq))
+            self.waiters.append(waiter)
+            deadline = waiter.queued_at + timeout
+
+            try:
+                while self._next_waiter() is not waiter:
+                    if time.monotonic() >= deadline:
+                        self.timeouts += 1
+                        raise AdmissionTimeout(
+                            f"No slot for {endpoint} after {timeout:.0f}s"
+                        )
+                    self._cond.wait(self._wait_timeout(endpoint, deadline))
+                    check_cancelled()
+            finally:
+                self.waiters.remove(waiter)
+                # Whoever is next may differ now that this waiter left
+                self._cond.notify_all()
+
+            self.in_flight += 1
+            self.in_flight_by_table[endpoint] = self.in_flight_by_table.get(endpoint, 0) + 1
+            bucket = self._bucket(endpoint)
+            if bucket is not None:
+                bucket.take()
+
+            waited = time.monotonic() - waiter.queued_at
+            self.waits[priority].append(waited)
+            return waited
+
+    def release(self, endpoint: str) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self.in_flight_by_table[endpoint] -= 1
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, endpoint: str, priority: Optional[int] = None):
+        self.acquire(endpoint, current_priority() if priority is None else priority)
+        try:
+            yield
+        finally:
+            self.release(endpoint)
+
+    def stats(self) -> Dict:
+        """
+        Current load, queue depth and recent wait times per priority.
+        """
+
+        with self._cond:
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for waiter in self.waiters:
+                queued[PRIORITY_NAMES[waiter.priority]] += 1
+
+            waits = {}
+            for level, samples in self.waits.items():
+                ordered = sorted(samples)
+                waits[PRIORITY_NAMES[level]] = {
+                    "admitted": len(ordered),
+                    "mean_wait": sum(ordered) / len(ordered) if ordered else 0.0,
+                    "p95_wait": ordered[int(len(ordered) * 0.95) - 1] if ordered else 0.0,
+                    "max_wait": ordered[-1] if ordered else 0.0,
+                }
+
+            return {
+                "in_flight": self.in_flight,
+                "max_concurrent": self.max_concurrent,
+                "in_flight_by_table": {
+                    table: count
+                    for table, count in self.in_flight_by_table.items()
+                    if count
+                },
+                "queued": queued,
+                "waits": waits,
+                "timeouts": self.timeouts,
+                "rpc_tokens": {
+                    name: round(bucket.tokens, 1)
+                    for name, bucket in self.buckets.items()
+                },
+            }
+
+
+_governor = ConcurrencyGovernor()
+
+
+def admit(endpoint: str):
+    """
+    Context manager holding a slot for one call to `endpoint`, queued
+    at the current priority.
+    """
+    return _governor.slot(endpoint)
+
+
+def governor_stats() -> Dict:
+    return _governor.stats()
@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 from supabase import create_client, Client
 from datetime import date
-from comparative_analysis import compare_school_performance
+from comparative_analysis import compare_school_performance, compare_schools
 from teachers_database_fetch import fetch_schools
 import plotly.graph_objects as go
 from add_new_school import insert_school
@@ -10,6 +10,7 @@ from add_new_school import insert_school
 
 from dotenv import load_dotenv
 import os
+import tempfile
 
 load_dotenv()
 
@@ -19,10 +20,30 @@ from teachers_database_fetch import (
     fetch_teachers_by_school,
     fetch_school_activity_stats,
     fetch_teacher_activity_count,
-    fetch_activities_by_teacher
+    fetch_activities_by_teacher,
+    search_teachers,
+    TEACHER_SEARCH_LIMIT
 )
 
 from study_materials_database_fetch import fetch_study_material_stats
+from fast_frames import fetch_activities_by_teacher_frame
+from students_database_fetch import fetch_published_activities_by_school
+from student_metrics import fetch_student_metrics
+from progressive import estimate_student_metrics
+from student_distributions import histogram_percentiles, WEEKDAYS
+from subject_analytics import fetch_subject_breakdown
+from activity_analytics import fetch_student_session_panels
+from regional_rollups import fetch_school_directory, fetch_regional_rollups
+from study_tool_analytics import fetch_tool_run_counts, tool_run_trends
+from fetch_tasks import FetchCancelled, session_scope
+from profiling import profile_rerun
+import memory_accounting
+from concurrency_governor import governor_stats
+from resilience import client_options
+from memory_accounting import track_page
+from prefetch import prefetch_school
+from range_index import get_range_index
+from export_data import export_to_file, EXPORT_TABLES, EXPORT_FORMATS
 
 
 # ---------------------------------------------
@@ -33,7 +54,8 @@ SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
 supabase: Client = create_client(
     SUPABASE_URL,
-    SUPABASE_SERVICE_ROLE_KEY
+    SUPABASE_SERVICE_ROLE_KEY,
+    options=client_options()
 )
 
 # ---------------------------------------------
@@ -55,14 +77,47 @@ def school_selector(supabase):
     if selected == "Select School":
         return None
 
-    return school_map[selected]
+    school_id = school_map[selected]
+
+    # Warm the other pages for this school in the background
+    prefetch_school(supabase, school_id)
+
+    return school_id
 
 
 def teacher_selector(supabase, school_id):
-    teachers = fetch_teachers_by_school(supabase, school_id)
+    """
+    Type-ahead teacher picker: the search box filters teachers
+    server-side, and results are shown one page at a time.
+    """
+
+    search = st.text_input(
+        "Search Teacher",
+        placeholder="Name or email",
+        key=f"teacher_search_{school_id}"
+    )
+
+    # Back to the first page whenever the search text changes
+    page_key = f"teacher_search_page_{school_id}"
+    if st.session_state.get(f"{page_key}_text") != search:
+        st.session_state[f"{page_key}_text"] = search
+        st.session_state[page_key] = 0
+
+    page = st.session_state[page_key]
+
+    result = search_teachers(
+        supabase,
+        school_id,
+        search,
+        offset=page * TEACHER_SEARCH_LIMIT
+    )
+    teachers = result["teachers"]
 
     if not teachers:
-        st.warning("No teachers found for this school.")
+        if search:
+            st.warning("No teachers match this search.")
+        else:
+            st.warning("No teachers found for this school.")
         return None
 
     teacher_map = {
@@ -72,7 +127,25 @@ def teacher_selector(supabase, school_id):
 
     options = ["Select Teacher"] + list(teacher_map.keys())
 
-    selected = st.selectbox("Select a Teacher", options)
+    # Keyed per school, so a teacher picked at one school is not carried
+    # over to another school whose list has the same position
+    selected = st.selectbox(
+        "Select a Teacher",
+        options,
+        key=f"teacher_select_{school_id}"
+    )
+
+    col1, col2, col3 = st.columns([1, 1, 4])
+
+    if col1.button("Previous", disabled=page == 0, key=f"{page_key}_prev"):
+        st.session_state[page_key] = page - 1
+        st.rerun()
+
+    if col2.button("Next", disabled=not result["has_more"], key=f"{page_key}_next"):
+        st.session_state[page_key] = page + 1
+        st.rerun()
+
+    col3.caption(f"Page {page + 1}")
 
     if selected == "Select Teacher":
         return None
@@ -113,12 +186,17 @@ def teachers_analytics_page():
     # -------------------------------
     # Overall School Analytics
     # -------------------------------
-    stats = fetch_school_activity_stats(
-        supabase,
-        school_id,
-        start_date=start_date,
-        end_date=end_date
-    )
+    index = get_range_index(supabase, school_id)
+
+    if index is not None:
+        stats = index.activity_stats(start_date, end_date)
+    else:
+        stats = fetch_school_activity_stats(
+            supabase,
+            school_id,
+            start_date=start_date,
+            end_date=end_date
+        )
 
     col1, col2 = st.columns(2)
 
@@ -134,6 +212,10 @@ def teachers_analytics_page():
 
     st.divider()
 
+    render_subject_breakdown(school_id, start_date, end_date)
+
+    st.divider()
+
     # -------------------------------
     # Teacher Selection
     # -------------------------------
@@ -161,26 +243,139 @@ def teachers_analytics_page():
     # -------------------------------
     # Teacher Activities Table
     # -------------------------------
-    activities = fetch_activities_by_teacher(
+    df = fetch_activities_by_teacher_frame(
         supabase,
         teacher_id,
         start_date=start_date,
         end_date=end_date
     )
 
-    if not activities:
+    if df.empty:
         st.info("No activities found for this teacher in the selected timeframe.")
         return
 
-    df = pd.DataFrame(activities)
-
     df = df[["name", "subject", "created_at"]]
+    # Same text as the JSON rows (the frame parses it to datetimes)
+    df["created_at"] = df["created_at"].map(
+        lambda ts: ts.isoformat() if pd.notna(ts) else None
+    )
     df.columns = ["Title", "Subject", "Created At"]
 
     st.subheader("Activities Created by Teacher")
     st.dataframe(df, use_container_width=True)
 
 
+def render_subject_breakdown(school_id, start_date, end_date):
+    st.subheader("Subject Coverage")
+
+    with st.spinner("Grouping activities by subject..."):
+        by_subject = fetch_subject_breakdown(
+            supabase,
+            school_id,
+            start_date=start_date,
+            end_date=end_date
+        )
+
+    if by_subject.empty:
+        st.info("No activities found for the selected period.")
+        return
+
+    # --------------------------------------------------
+    # SCHOOL LEVEL: PER SUBJECT
+    # --------------------------------------------------
+    table = by_subject.rename(columns={
+        "subject": "Subject",
+        "activities": "Activities",
+        "published": "Published",
+        "published_ratio": "Published (%)",
+        "sessions": "Student Sessions",
+    })
+    st.dataframe(table.round(1), use_container_width=True, hide_index=True)
+
+    fig = go.Figure(
+        data=[
+            go.Bar(
+                name="Activities",
+                x=by_subject["subject"],
+                y=by_subject["activities"]
+            ),
+            go.Bar(
+                name="Published",
+                x=by_subject["subject"],
+                y=by_subject["published"]
+            ),
+        ]
+    )
+    fig.update_layout(barmode="group", height=350, yaxis_title="Activities")
+    st.plotly_chart(fig, use_container_width=True)
+
+    # --------------------------------------------------
+    # OVER TIME
+    # --------------------------------------------------
+    freq = st.radio(
+        "Trend by",
+        ["week", "month"],
+        horizontal=True,
+        key="subject_trend_freq"
+    )
+
+    trend = fetch_subject_breakdown(
+        supabase,
+        school_id,
+        start_date=start_date,
+        end_date=end_date,
+        freq=freq
+    )
+
+    fig = go.Figure()
+    for subject, rows in trend.groupby("subject"):
+        fig.add_trace(
+            go.Scatter(
+                name=subject,
+                x=rows["period"],
+                y=rows["activities"],
+                mode="lines+markers"
+            )
+        )
+    fig.update_layout(height=350, yaxis_title="Activities Created")
+    st.plotly_chart(fig, use_container_width=True)
+
+    # --------------------------------------------------
+    # TEACHER LEVEL: COVERAGE GAPS
+    # --------------------------------------------------
+    with st.expander("Teacher x Subject Coverage"):
+        by_teacher = fetch_subject_breakdown(
+            supabase,
+            school_id,
+            start_date=start_date,
+            end_date=end_date,
+            by_teacher=True
+        )
+
+        teachers = fetch_teachers_by_school(supabase, school_id)
+        teacher_names = {
+            t["id"]: f"{t['first_name']} {t['last_name']}" for t in teachers
+        }
+
+        coverage = by_teacher.pivot_table(
+            index="creator_id",
+            columns="subject",
+            values="activities",
+            fill_value=0
+        )
+        # Teachers with no activities at all are the widest gaps
+        coverage = coverage.reindex(
+            coverage.index.union(list(teacher_names)), fill_value=0
+        )
+        coverage.index = coverage.index.map(
+            lambda t: teacher_names.get(t, t)
+        )
+        coverage.index.name = "Teacher"
+
+        st.dataframe(coverage, use_container_width=True)
+        st.caption("Zero cells are subjects a teacher has not covered.")
+
+
 def students_analytics_page():
     st.header("Student Analytics")
 
@@ -217,82 +412,314 @@ def students_analytics_page():
         return
 
     # --------------------------------------------------
-    # BACKEND IMPORTS (RPC-BASED)
+    # SCHOOL-LEVEL ANALYTICS
     # --------------------------------------------------
-    from students_stats import (
-        fetch_attempted_sessions_count,
-        fetch_total_published_activities,
-        fetch_completed_sessions_count,
-        fetch_ongoing_sessions_count,
-        fetch_completed_session_median_time
+    scope = session_scope(("students", school_id, start_date, end_date))
+
+    # One sessions fetch for the three panels below, started now so it
+    # overlaps with the metrics
+    panels_future = scope.submit(
+        fetch_student_session_panels,
+        supabase,
+        school_id,
+        start_date=start_date,
+        end_date=end_date
     )
 
-    # --------------------------------------------------
-    # SCHOOL-LEVEL ANALYTICS (RPC)
-    # --------------------------------------------------
-    with st.spinner("Fetching student analytics..."):
-        total_published_activities = fetch_total_published_activities(
-            supabase,
-            school_id,
-            start_date=start_date,
-            end_date=end_date
+    cards = [column.empty() for column in st.columns(5)]
+    caption = st.empty()
+
+    index = get_range_index(supabase, school_id)
+
+    if index is not None:
+        metrics = index.student_metrics(start_date, end_date)
+    else:
+        metrics = fetch_student_metrics.cache_peek(
+            supabase, school_id, start_date=start_date, end_date=end_date
         )
 
-        attempted_sessions = fetch_attempted_sessions_count(
+    if metrics is None:
+        future = scope.submit(
+            fetch_student_metrics,
             supabase,
             school_id,
             start_date=start_date,
             end_date=end_date
         )
 
-        completed_sessions = fetch_completed_sessions_count(
-            supabase,
-            school_id,
-            start_date=start_date,
-            end_date=end_date
+        # Estimates first; replaced below once the exact fetch finishes
+        estimate = estimate_student_metrics(
+            supabase, school_id, start_date, end_date
         )
+        if estimate is not None and not future.done():
+            render_student_metric_cards(cards, estimate, provisional=True)
+            caption.caption(
+                f"≈ Provisional: estimated from {estimate['sample_size']} "
+                "sampled sessions. Exact values are loading..."
+            )
 
-        ongoing_sessions = fetch_ongoing_sessions_count(
-            supabase,
-            school_id,
-            start_date=start_date,
-            end_date=end_date
+        with st.spinner("Fetching student analytics..."):
+            metrics = scope.wait(future)
+
+    # --------------------------------------------------
+    # METRICS DISPLAY
+    # --------------------------------------------------
+    render_student_metric_cards(cards, metrics)
+
+    caption.caption(
+        "Completed means status \"completed\"; every other session is "
+        "ongoing. Median time is calculated only for completed sessions."
+    )
+
+    st.divider()
+
+    with st.spinner("Fetching session analytics..."):
+        panels = scope.wait(panels_future)
+
+    render_activity_leaderboard(panels["activity_stats"])
+
+    st.divider()
+
+    render_duration_distribution(
+        school_id, start_date, end_date, panels["histogram"]
+    )
+
+    st.divider()
+
+    render_engagement_heatmap(panels["heatmap"])
+
+
+STUDENT_METRIC_CARDS = [
+    ("Published Activities", "published_activities", 0),
+    ("Sessions Attempted", "attempted_sessions", 0),
+    ("Sessions Completed", "completed_sessions", 0),
+    ("Sessions Ongoing", "ongoing_sessions", 0),
+    ("Median Time (Minutes)", "median_time_spent", 1),
+]
+
+
+def render_student_metric_cards(cards, metrics, provisional=False):
+    """
+    Fills the metric placeholders. Provisional values are marked with
+    "≈" and carry their 95% confidence interval as help text.
+    """
+
+    intervals = metrics.get("intervals", {}) if provisional else {}
+
+    for card, (label, key, digits) in zip(cards, STUDENT_METRIC_CARDS):
+        value = metrics[key]
+
+        if value is None:
+            card.metric(f"≈ {label}", "…", help="Not estimated; loading")
+            continue
+
+        value = round(value, digits) if digits else int(round(value))
+
+        if not provisional:
+            card.metric(label, value)
+            continue
+
+        low, high = intervals.get(key, (None, None))
+        card.metric(
+            f"≈ {label}",
+            value,
+            help=_estimate_help(metrics, key, low, high, digits)
         )
 
-        median_time_spent = fetch_completed_session_median_time(
-            supabase,
-            school_id,
-            start_date=start_date,
-            end_date=end_date
+
+def _estimate_help(metrics, key, low, high, digits, prefix="Provisional estimate"):
+    """
+    Help text for an estimated value: its 95% interval, or for counts
+    scaled from the planner's row estimate, an approximate range.
+    """
+
+    if low is None:
+        return f"{prefix} (planner row count)"
+
+    if low == high:
+        return f"{prefix}: exact"
+
+    bounds = f"{low:,.{digits}f} – {high:,.{digits}f}"
+
+    if key in metrics.get("approximate", ()):
+        return (
+            f"{prefix}, approximate: scaled from the query planner's "
+            f"estimate of the session total. Likely range: {bounds}"
         )
 
+    return f"{prefix}. 95% CI: {bounds}"
+
+
+LEADERBOARD_SORTS = {
+    "Sessions Attempted": "sessions_attempted",
+    "Completion Rate (%)": "completion_rate",
+    "Mean Time (Minutes)": "mean_time_spent",
+    "Median Time (Minutes)": "median_time_spent",
+}
+
+
+def render_activity_leaderboard(stats):
+    st.subheader("Activity Leaderboard")
+
+    if stats.empty:
+        st.info("No published activities found for the selected period.")
+        return
+
+    col1, col2 = st.columns([3, 1])
+
+    sort_label = col1.selectbox(
+        "Sort By",
+        list(LEADERBOARD_SORTS.keys()),
+        key="leaderboard_sort"
+    )
+    ascending = col2.toggle("Ascending", key="leaderboard_ascending")
+
+    leaderboard = stats.sort_values(
+        LEADERBOARD_SORTS[sort_label], ascending=ascending
+    )
+
+    st.dataframe(
+        leaderboard.drop(columns="activity_id").rename(columns={
+            "activity_name": "Activity",
+            "sessions_attempted": "Sessions Attempted",
+            "sessions_completed": "Sessions Completed",
+            "completion_rate": "Completion Rate (%)",
+            "mean_time_spent": "Mean Time (Minutes)",
+            "median_time_spent": "Median Time (Minutes)",
+        }),
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "Completion Rate (%)": st.column_config.NumberColumn(format="%.1f"),
+            "Mean Time (Minutes)": st.column_config.NumberColumn(format="%.1f"),
+            "Median Time (Minutes)": st.column_config.NumberColumn(format="%.1f"),
+        }
+    )
+
+
+def render_duration_distribution(school_id, start_date, end_date, histogram):
+    st.subheader("Session Duration Distribution")
+
+    if histogram.empty:
+        st.info("No timed sessions found for the selected period.")
+        return
+
+    activities = fetch_published_activities_by_school(
+        supabase, school_id, start_date, end_date
+    )
+    activity_names = {a["id"]: a["name"] for a in activities}
+
+    activity_options = ["All Activities"] + [
+        a for a in histogram["activity_id"].unique() if a in activity_names
+    ]
+
+    selected_activity = st.selectbox(
+        "Activity",
+        activity_options,
+        format_func=lambda a: activity_names.get(a, a),
+        key="duration_activity"
+    )
+
+    if selected_activity != "All Activities":
+        histogram = histogram[histogram["activity_id"] == selected_activity]
+
     # --------------------------------------------------
-    # METRICS DISPLAY
+    # HISTOGRAM (COMPLETED VS ONGOING)
     # --------------------------------------------------
-    col1, col2, col3, col4, col5 = st.columns(5)
+    by_state = (
+        histogram
+        .groupby(["state", "bin_start", "bin_end"], as_index=False)["count"]
+        .sum()
+    )
+
+    fig = go.Figure()
 
-    col1.metric("Published Activities", total_published_activities)
-    col2.metric("Sessions Attempted", attempted_sessions)
-    col3.metric("Sessions Completed", completed_sessions)
-    col4.metric("Sessions Ongoing", ongoing_sessions)
-    col5.metric(
-        "Median Time (Minutes)",
-        round(median_time_spent, 1)
+    for state in ["completed", "ongoing"]:
+        bins = by_state[by_state["state"] == state]
+        labels = [
+            f"{int(b)}+" if e == float("inf") else f"{int(b)}-{int(e)}"
+            for b, e in zip(bins["bin_start"], bins["bin_end"])
+        ]
+        fig.add_trace(
+            go.Bar(name=state.capitalize(), x=labels, y=bins["count"])
+        )
+
+    fig.update_layout(
+        xaxis_title="Minutes",
+        yaxis_title="Sessions",
+        barmode="overlay",
+        height=350,
     )
+    fig.update_traces(opacity=0.7)
+
+    st.plotly_chart(fig, use_container_width=True)
 
     # --------------------------------------------------
-    # CONSISTENCY CHECK (OPTIONAL BUT USEFUL)
+    # PERCENTILE TABLES
     # --------------------------------------------------
-    if attempted_sessions != completed_sessions + ongoing_sessions:
-        st.warning(
-            "⚠️ Data mismatch detected: Attempted ≠ Completed + Ongoing"
+    st.markdown("#### Percentiles (minutes)")
+
+    st.dataframe(
+        histogram_percentiles(histogram, by=["state"]).round(1),
+        use_container_width=True
+    )
+
+    if selected_activity == "All Activities":
+        per_activity = histogram_percentiles(
+            histogram, by=["activity_id", "state"]
+        )
+        per_activity.insert(
+            0,
+            "Activity",
+            per_activity["activity_id"].map(activity_names)
+        )
+        st.dataframe(
+            per_activity.drop(columns=["activity_id"]).round(1),
+            use_container_width=True
         )
 
     st.caption(
-        "Median time is calculated only for completed sessions."
+        "Percentiles are interpolated from the binned histogram."
     )
 
 
+def render_engagement_heatmap(heatmap):
+    st.subheader("When Students Work")
+
+    if heatmap["sessions"].sum() == 0:
+        st.info("No sessions found for the selected period.")
+        return
+
+    metric = st.radio(
+        "Show",
+        ["Sessions", "Completion Rate (%)"],
+        horizontal=True,
+        key="heatmap_metric"
+    )
+
+    column = "sessions" if metric == "Sessions" else "completion_rate"
+    grid = heatmap.pivot(index="weekday", columns="hour", values=column)
+
+    fig = go.Figure(
+        data=go.Heatmap(
+            z=grid.values,
+            x=[f"{h:02d}:00" for h in grid.columns],
+            y=[WEEKDAYS[d] for d in grid.index],
+            colorscale="Blues",
+            colorbar={"title": metric},
+            hoverongaps=False,
+        )
+    )
+
+    fig.update_layout(
+        xaxis_title="Hour (UTC)",
+        yaxis={"autorange": "reversed"},
+        height=350,
+    )
+
+    st.plotly_chart(fig, use_container_width=True)
+
+
 def render_comparison_bar_chart(title, period_a_value, period_b_value, y_label):
     fig = go.Figure(
         data = [
@@ -326,9 +753,67 @@ def render_comparison_bar_chart(title, period_a_value, period_b_value, y_label):
 
 
 
+PROVISIONAL_COMPARISON_METRICS = [
+    ("Sessions Attempted", "attempted_sessions", 0),
+    ("Completion Rate (%)", "completion_rate", 1),
+    ("Mean Time (Minutes)", "mean_time_spent", 1),
+]
+
+
+def render_provisional_comparison(container, school_id, start_a, end_a, start_b, end_b):
+    """
+    Estimated student metrics for both periods, shown while the exact
+    comparison runs.
+    """
+
+    estimates = [
+        estimate_student_metrics(supabase, school_id, start, end)
+        for start, end in ((start_a, end_a), (start_b, end_b))
+    ]
+
+    if None in estimates:
+        return
+
+    estimate_a, estimate_b = estimates
+
+    container.markdown("### ≈ Provisional Student Comparison")
+
+    cols = container.columns(len(PROVISIONAL_COMPARISON_METRICS))
+    for col, (label, key, digits) in zip(cols, PROVISIONAL_COMPARISON_METRICS):
+        value_a = round(estimate_a[key], digits)
+        value_b = round(estimate_b[key], digits)
+        low, high = estimate_b["intervals"].get(key, (None, None))
+
+        col.metric(
+            f"≈ {label}",
+            value_b,
+            delta=round(value_b - value_a, digits),
+            help=_estimate_help(
+                estimate_b, key, low, high, digits, prefix="Period B estimate"
+            )
+        )
+
+    container.caption(
+        f"Estimated from {estimate_a['sample_size']} (A) and "
+        f"{estimate_b['sample_size']} (B) sampled sessions; "
+        "delta is B minus A. Exact comparison is loading..."
+    )
+
+
 def comparative_analysis():
     st.header("Comparative Analysis")
 
+    mode = st.radio(
+        "Compare",
+        ["One School, Two Periods", "Multiple Schools"],
+        horizontal=True,
+        key="ca_mode"
+    )
+
+    if mode == "Multiple Schools":
+        multi_school_comparison()
+        return
+
     # --------------------------------------------------
     # PERIOD SELECTION
     # --------------------------------------------------
@@ -368,18 +853,45 @@ def comparative_analysis():
         return
 
     school_id = school_map[selected_school]
+    prefetch_school(supabase, school_id)
 
     # --------------------------------------------------
     # RUN COMPARISON
     # --------------------------------------------------
-    with st.spinner("Running comparative analysis..."):
-        comparison = compare_school_performance(
-            supabase=supabase,
-            school_id=school_id,
-            period_a={"start": start_a, "end": end_a},
-            period_b={"start": start_b, "end": end_b},
+    scope = session_scope(
+        ("comparative", school_id, start_a, end_a, start_b, end_b)
+    )
+
+    index = get_range_index(supabase, school_id)
+
+    future = scope.submit(
+        compare_school_performance,
+        supabase=supabase,
+        school_id=school_id,
+        period_a={"start": start_a, "end": end_a},
+        period_b={"start": start_b, "end": end_b},
+        index=index,
+    )
+
+    provisional = st.empty()
+
+    cached = [
+        fetch_student_metrics.cache_peek(
+            supabase, school_id, start_date=start, end_date=end
+        )
+        for start, end in ((start_a, end_a), (start_b, end_b))
+    ]
+
+    if index is None and None in cached and not future.done():
+        render_provisional_comparison(
+            provisional.container(), school_id, start_a, end_a, start_b, end_b
         )
 
+    with st.spinner("Running comparative analysis..."):
+        comparison = scope.wait(future)
+
+    provisional.empty()
+
     teachers = comparison["teachers"]
     students = comparison["students"]
 
@@ -495,6 +1007,158 @@ def comparative_analysis():
     )
 
 
+MULTI_SCHOOL_LIMIT = 20
+
+# Charts of the multi-school comparison: metrics sharing a unit go in
+# one grouped bar chart
+MULTI_SCHOOL_CHARTS = [
+    ("Teachers", "Activities", {
+        "total_activities": "Total Activities",
+        "median_activities_per_teacher": "Median per Teacher",
+    }),
+    ("Students: Volume", "Count", {
+        "total_activities_posted": "Published Activities",
+        "total_sessions_attempted": "Sessions Attempted",
+    }),
+    ("Students: Completion", "Percentage", {
+        "completion_rate": "Completion Rate (%)",
+    }),
+    ("Students: Time Spent", "Minutes", {
+        "mean_time_spent": "Mean Time",
+        "median_time_spent": "Median Time",
+    }),
+]
+
+
+def multi_school_comparison():
+    # --------------------------------------------------
+    # PERIOD SELECTION (SHARED BY ALL SCHOOLS)
+    # --------------------------------------------------
+    col1, col2 = st.columns(2)
+
+    with col1:
+        start_date = st.date_input("Start Date", value=None, key="ms_start_date")
+
+    with col2:
+        end_date = st.date_input("End Date", value=None, key="ms_end_date")
+
+    if start_date and end_date and start_date > end_date:
+        st.error("Start date cannot be after end date.")
+        return
+
+    # --------------------------------------------------
+    # SCHOOL SELECTION
+    # --------------------------------------------------
+    schools = fetch_schools(supabase)
+
+    if not schools:
+        st.warning("No schools found.")
+        return
+
+    school_names = {s["id"]: s["school_name"] for s in schools}
+
+    selected_ids = st.multiselect(
+        "Schools",
+        list(school_names.keys()),
+        format_func=school_names.get,
+        max_selections=MULTI_SCHOOL_LIMIT,
+        key="ms_schools"
+    )
+
+    if len(selected_ids) < 2:
+        st.info("Select at least two schools to compare.")
+        return
+
+    baseline_id = st.selectbox(
+        "Baseline School",
+        selected_ids,
+        format_func=school_names.get,
+        key="ms_baseline"
+    )
+
+    # --------------------------------------------------
+    # RUN COMPARISON
+    # --------------------------------------------------
+    scope = session_scope(
+        ("multi_school", tuple(selected_ids), baseline_id, start_date, end_date)
+    )
+
+    with st.spinner("Comparing schools..."):
+        comparison = scope.wait(
+            scope.submit(
+                compare_schools,
+                supabase,
+                selected_ids,
+                baseline_id,
+                start_date=start_date,
+                end_date=end_date
+            )
+        )
+
+    metrics = comparison["metrics"]
+    deltas = comparison["deltas"]
+    names = [school_names[i] for i in metrics.index]
+
+    def label_of(metric: str, label: str) -> str:
+        return f"≈ {label}" if metric in comparison["approximate"] else label
+
+    # --------------------------------------------------
+    # DELTAS VS BASELINE
+    # --------------------------------------------------
+    st.subheader(f"Compared with {school_names[baseline_id]}")
+
+    delta_rows = []
+    for school_id, school_deltas in deltas.items():
+        row = {"School": school_names[school_id]}
+        for _, _, labels in MULTI_SCHOOL_CHARTS:
+            for metric, label in labels.items():
+                delta = school_deltas[metric]
+                row[label_of(metric, label)] = (
+                    f"{delta['new']:.1f} ({delta['percentage']:+.1f}%)"
+                    if delta["percentage"] is not None
+                    else f"{delta['new']:.1f} ({delta['absolute']:+.1f})"
+                )
+        delta_rows.append(row)
+
+    st.dataframe(
+        pd.DataFrame(delta_rows),
+        use_container_width=True,
+        hide_index=True
+    )
+    st.caption(
+        "≈ Medians come from per-school sketches and are accurate to "
+        "within about 1%; every other figure is exact."
+    )
+
+    # --------------------------------------------------
+    # GROUPED BAR CHARTS
+    # --------------------------------------------------
+    for title, y_label, labels in MULTI_SCHOOL_CHARTS:
+        fig = go.Figure(
+            data=[
+                go.Bar(
+                    name=label_of(metric, label),
+                    x=names,
+                    y=metrics[metric],
+                    text=metrics[metric].round(1),
+                    textposition="auto",
+                )
+                for metric, label in labels.items()
+            ]
+        )
+
+        fig.update_layout(
+            title=title,
+            yaxis_title=y_label,
+            xaxis_title="",
+            barmode="group",
+            height=350,
+            showlegend=len(labels) > 1,
+        )
+
+        st.plotly_chart(fig, use_container_width=True)
+
+
 def add_new_school_form():
     st.subheader("Add New School")
 
@@ -545,6 +1209,8 @@ def add_new_school_form():
                     board_id=board_id.strip() if board_id else None,
                 )
 
+                fetch_schools.cache_clear()
+
                 st.success("✅ School added successfully!")
                 st.info("You may need to refresh to see it in dropdowns.")
 
@@ -600,17 +1266,28 @@ def study_material_analytics_page():
         return
 
     school_id = school_map[selected_school]
+    prefetch_school(supabase, school_id)
 
     # --------------------------------------------------
     # FETCH STATS
     # --------------------------------------------------
-    with st.spinner("Fetching study material analytics..."):
-        stats = fetch_study_material_stats(
-            supabase,
-            school_id,
-            start_date=start_date if start_date else None,
-            end_date=end_date if end_date else None
-        )
+    scope = session_scope(("study_material", school_id, start_date, end_date))
+
+    index = get_range_index(supabase, school_id)
+
+    if index is not None:
+        stats = index.study_material_stats(start_date, end_date)
+    else:
+        with st.spinner("Fetching study material analytics..."):
+            stats = scope.wait(
+                scope.submit(
+                    fetch_study_material_stats,
+                    supabase,
+                    school_id,
+                    start_date=start_date if start_date else None,
+                    end_date=end_date if end_date else None
+                )
+            )
 
     # --------------------------------------------------
     # KPI METRICS
@@ -642,6 +1319,502 @@ def study_material_analytics_page():
                 "✅ Study material usage is healthy with an acceptable failure rate."
             )
 
+        render_tool_run_trends(school_id, start_date, end_date)
+
+
+def render_tool_run_trends(school_id, start_date, end_date):
+    st.subheader("Usage and Failure Trends")
+
+    freq = st.radio(
+        "Group by",
+        ["day", "week"],
+        horizontal=True,
+        key="sm_trend_freq"
+    )
+
+    with st.spinner("Counting tool runs..."):
+        trends = tool_run_trends(
+            fetch_tool_run_counts(
+                supabase,
+                school_id,
+                start_date=start_date,
+                end_date=end_date,
+                freq=freq
+            )
+        )
+
+    if trends.empty:
+        st.info("No tool runs found for the selected period.")
+        return
+
+    runs_fig = go.Figure()
+    rate_fig = go.Figure()
+
+    for kind, rows in trends.groupby("kind"):
+        runs_fig.add_trace(
+            go.Bar(name=kind.capitalize(), x=rows["period"], y=rows["runs"])
+        )
+        rate_fig.add_trace(
+            go.Scatter(
+                name=kind.capitalize(),
+                x=rows["period"],
+                y=rows["failure_rate"],
+                mode="lines+markers"
+            )
+        )
+
+    runs_fig.update_layout(
+        title="Tool Runs by Kind",
+        barmode="stack",
+        yaxis_title="Runs",
+        height=350,
+    )
+    rate_fig.update_layout(
+        title="Failure Rate by Kind",
+        yaxis_title="Percentage",
+        height=350,
+    )
+
+    st.plotly_chart(runs_fig, use_container_width=True)
+    st.plotly_chart(rate_fig, use_container_width=True)
+
+
+REGIONAL_LEVELS = {
+    "Country": "country",
+    "State": "state",
+    "City": "city",
+    "School": "school",
+    "Board": "board",
+}
+
+REGIONAL_CHART_METRICS = {
+    "Total Activities": "total_activities",
+    "Sessions Attempted": "sessions_attempted",
+    "Completion Rate (%)": "completion_rate",
+    "Median Time (Minutes)": "median_time_spent",
+    "Total Tool Runs": "total_runs",
+    "Tool Failure Rate (%)": "failure_percentage",
+}
+
+
+def _region_options(schools, column, label):
+    values = sorted({s.get(column) for s in schools if s.get(column)})
+    return st.selectbox(label, ["All"] + values, key=f"regional_{column}")
+
+
+def regional_analytics_page():
+    st.header("Regional Analytics")
+
+    # --------------------------------------------------
+    # DATE FILTERS (OPTIONAL)
+    # --------------------------------------------------
+    col1, col2 = st.columns(2)
+
+    with col1:
+        start_date = st.date_input(
+            "Start Date",
+            value=None,
+            key="regional_start_date"
+        )
+
+    with col2:
+        end_date = st.date_input(
+            "End Date",
+            value=None,
+            key="regional_end_date"
+        )
+
+    if start_date and end_date and start_date > end_date:
+        st.error("Start date cannot be after end date.")
+        return
+
+    # --------------------------------------------------
+    # REGION SELECTION
+    # --------------------------------------------------
+    schools = fetch_school_directory(supabase)
+
+    if not schools:
+        st.warning("No schools found.")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        country = _region_options(schools, "country", "Country")
+    if country != "All":
+        schools = [s for s in schools if s.get("country") == country]
+
+    with col2:
+        state = _region_options(schools, "state", "State")
+    if state != "All":
+        schools = [s for s in schools if s.get("state") == state]
+
+    with col3:
+        city = _region_options(schools, "city", "City")
+    if city != "All":
+        schools = [s for s in schools if s.get("city") == city]
+
+    with col4:
+        board = _region_options(schools, "board_id", "Board")
+
+    level_label = st.radio(
+        "Group By",
+        list(REGIONAL_LEVELS.keys()),
+        horizontal=True,
+        key="regional_level"
+    )
+
+    # --------------------------------------------------
+    # FETCH ROLLUPS
+    # --------------------------------------------------
+    scope = session_scope(
+        ("regional", country, state, city, board, start_date, end_date)
+    )
+
+    with st.spinner("Rolling up regional analytics..."):
+        rollups = scope.wait(
+            scope.submit(
+                fetch_regional_rollups,
+                supabase,
+                start_date=start_date,
+                end_date=end_date,
+                country=None if country == "All" else country,
+                state=None if state == "All" else state,
+                city=None if city == "All" else city,
+                board_id=None if board == "All" else board
+            )
+        )
+
+    table = rollups[REGIONAL_LEVELS[level_label]]
+
+    if table.empty:
+        st.info("No schools match the selected region.")
+        return
+
+    # --------------------------------------------------
+    # KPI METRICS (WHOLE SELECTION)
+    # --------------------------------------------------
+    totals = rollups["country"]
+
+    col1, col2, col3, col4 = st.columns(4)
+
+    col1.metric("Schools", int(totals["schools"].sum()))
+    col2.metric("Teachers", int(totals["teachers"].sum()))
+    col3.metric("Total Activities", int(totals["total_activities"].sum()))
+    col4.metric("Sessions Attempted", int(totals["sessions_attempted"].sum()))
+
+    st.divider()
+
+    # --------------------------------------------------
+    # ROLLUP TABLE + CHART
+    # --------------------------------------------------
+    st.dataframe(
+        table.drop(columns="school_id", errors="ignore").round(1),
+        use_container_width=True,
+        hide_index=True
+    )
+
+    st.caption(
+        "Medians are merged from per-school sketches and are accurate to "
+        "within about 1%; every other figure is exact."
+    )
+
+    metric_label = st.selectbox(
+        "Chart Metric",
+        list(REGIONAL_CHART_METRICS.keys()),
+        key="regional_chart_metric"
+    )
+    metric = REGIONAL_CHART_METRICS[metric_label]
+
+    label_column = (
+        "school_name" if level_label == "School"
+        else "board_id" if level_label == "Board"
+        else REGIONAL_LEVELS[level_label]
+    )
+
+    fig = go.Figure(
+        go.Bar(
+            x=table[label_column].astype(str),
+            y=table[metric]
+        )
+    )
+    fig.update_layout(
+        title=f"{metric_label} by {level_label}",
+        xaxis_title=level_label,
+        yaxis_title=metric_label,
+        height=400
+    )
+
+    st.plotly_chart(fig, use_container_width=True)
+
+
+# Browser downloads are read into memory whole
+EXPORT_DOWNLOAD_MAX_ROWS = int(os.getenv("KIBU_EXPORT_MAX_ROWS", "200000"))
+
+
+def data_export_page():
+    st.header("Data Export")
+
+    # --------------------------------------------------
+    # DATE FILTERS (OPTIONAL)
+    # --------------------------------------------------
+    col1, col2 = st.columns(2)
+
+    with col1:
+        start_date = st.date_input(
+            "Start Date",
+            value=None,
+            key="export_start_date"
+        )
+
+    with col2:
+        end_date = st.date_input(
+            "End Date",
+            value=None,
+            key="export_end_date"
+        )
+
+    if start_date and end_date and start_date > end_date:
+        st.error("Start date cannot be after end date.")
+        return
+
+    # --------------------------------------------------
+    # SCHOOL SELECTION
+    # --------------------------------------------------
+    school_id = school_selector(supabase)
+
+    if not school_id:
+        st.info("Please select a school to export data.")
+        return
+
+    col1, col2 = st.columns(2)
+
+    table = col1.selectbox("Data", EXPORT_TABLES)
+    fmt = col2.selectbox("Format", EXPORT_FORMATS)
+
+    if not st.button("Prepare Export"):
+        return
+
+    # --------------------------------------------------
+    # STREAM TO A TEMP FILE, THEN SERVE IT
+    # --------------------------------------------------
+    with tempfile.NamedTemporaryFile(suffix=f".{fmt}", delete=False) as tmp:
+        path = tmp.name
+
+    try:
+        with st.spinner("Exporting rows..."):
+            total_rows = export_to_file(
+                supabase,
+                table,
+                school_id,
+                path,
+                fmt=fmt,
+                start_date=start_date,
+                end_date=end_date,
+                max_rows=EXPORT_DOWNLOAD_MAX_ROWS
+            )
+
+        if total_rows == 0:
+            st.info("No rows found for the selected school and period.")
+            return
+
+        st.success(f"Exported {total_rows} rows.")
+
+        if total_rows >= EXPORT_DOWNLOAD_MAX_ROWS:
+            # The download is held in memory; larger exports go through
+            # the CLI, which streams to disk
+            st.warning(
+                f"Downloads are capped at {EXPORT_DOWNLOAD_MAX_ROWS} rows. "
+                "Narrow the dates, or run `python export_data.py` for "
+                "the full export."
+            )
+
+        with open(path, "rb") as f:
+            st.download_button(
+                "Download",
+                data=f,
+                file_name=f"{table}_{school_id}.{fmt}",
+                mime="text/csv" if fmt == "csv" else "application/octet-stream"
+            )
+
+    except ImportError as e:
+        st.error(str(e))
+
+    finally:
+        os.remove(path)
+
+# Buttons that change state shared by every session (tracemalloc, the
+# in-process caches) are only shown to operators
+DIAGNOSTICS_ADMIN = os.getenv("KIBU_ADMIN", "0") == "1"
+
+
+def _megabytes(n):
+    return round(n / (1024 * 1024), 2)
+
+
+def diagnostics_page():
+    st.header("Diagnostics")
+
+    # --------------------------------------------------
+    # SESSION MEMORY
+    # --------------------------------------------------
+    st.subheader("Session Memory")
+
+    session_sizes = memory_accounting.session_state_sizes()
+    session_total = sum(session_sizes.values())
+    budget = memory_accounting.SESSION_MEMORY_BUDGET
+
+    col1, col2, col3, col4 = st.columns(4)
+
+    col1.metric("Session State (MB)", _megabytes(session_total))
+    col2.metric("Budget (MB)", _megabytes(budget))
+    col3.metric(
+        "Streaming Mode",
+        "On" if st.session_state.get(memory_accounting.STREAMING_KEY) else "Off"
+    )
+    col4.metric(
+        "Evictions",
+        st.session_state.get(memory_accounting.EVICTIONS_KEY, 0)
+    )
+
+    st.dataframe(
+        pd.DataFrame(
+            [
+                {"Key": key, "Size (MB)": _megabytes(size)}
+                for key, size in sorted(
+                    session_sizes.items(), key=lambda kv: kv[1], reverse=True
+                )
+            ],
+            columns=["Key", "Size (MB)"]
+        ),
+        use_container_width=True,
+        hide_index=True
+    )
+
+    if st.session_state.get(memory_accounting.STREAMING_KEY):
+        if st.button("Reset Streaming Mode"):
+            st.session_state[memory_accounting.STREAMING_KEY] = False
+            st.rerun()
+
+    # --------------------------------------------------
+    # PROCESS MEMORY
+    # --------------------------------------------------
+    st.subheader("Worker Process")
+
+    tracing = memory_accounting.tracemalloc.is_tracing()
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Peak RSS (MB)", _megabytes(memory_accounting.process_rss()))
+    col2.metric("tracemalloc", "Tracing" if tracing else "Off")
+    col3.metric(
+        "Peak Traced (MB)",
+        _megabytes(memory_accounting.tracemalloc.get_traced_memory()[1])
+        if tracing else "–"
+    )
+
+    st.dataframe(
+        pd.DataFrame(
+            [
+                {"Cache": name, "Size (MB)": _megabytes(size)}
+                for name, size in memory_accounting.process_cache_sizes().items()
+            ]
+        ),
+        use_container_width=True,
+        hide_index=True
+    )
+
+    if DIAGNOSTICS_ADMIN:
+        col1, col2 = st.columns(2)
+
+        if tracing:
+            if col1.button("Stop tracemalloc"):
+                memory_accounting.tracemalloc.stop()
+                st.rerun()
+        elif col1.button("Start tracemalloc"):
+            memory_accounting.tracemalloc.start(memory_accounting.TRACE_FRAMES)
+            st.rerun()
+
+        if col2.button("Clear In-Process Caches"):
+            memory_accounting.clear_process_caches()
+            st.rerun()
+
+    # --------------------------------------------------
+    # BACKEND LOAD (CONCURRENCY GOVERNOR)
+    # --------------------------------------------------
+    st.subheader("Backend Load")
+
+    load = governor_stats()
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("In Flight", f"{load['in_flight']} / {load['max_concurrent']}")
+    col2.metric("Queued", sum(load["queued"].values()))
+    col3.metric("Admission Timeouts", load["timeouts"])
+
+    st.dataframe(
+        pd.DataFrame(
+            [
+                {
+                    "Priority": name.title(),
+                    "Queued": load["queued"][name],
+                    "Admitted": waits["admitted"],
+                    "Mean Wait (s)": round(waits["mean_wait"], 3),
+                    "P95 Wait (s)": round(waits["p95_wait"], 3),
+                    "Max Wait (s)": round(waits["max_wait"], 3),
+                }
+                for name, waits in load["waits"].items()
+            ]
+        ),
+        use_container_width=True,
+        hide_index=True
+    )
+
+    if load["in_flight_by_table"]:
+        st.caption(
+            "In flight by table: "
+            + ", ".join(
+                f"{table} {count}"
+                for table, count in sorted(load["in_flight_by_table"].items())
+            )
+        )
+
+    # --------------------------------------------------
+    # PER-PAGE MEASUREMENTS
+    # --------------------------------------------------
+    st.subheader("Last Run per Page")
+
+    pages = st.session_state.get(memory_accounting.PAGE_STATS_KEY, {})
+
+    if not pages:
+        st.info("Open an analytics page to record its memory use.")
+        return
+
+    st.dataframe(
+        pd.DataFrame(
+            [
+                {
+                    "Page": stats["page"],
+                    "Seconds": round(stats["seconds"], 2),
+                    "Net Allocated (MB)": _megabytes(stats.get("net_allocated", 0)),
+                    "Session After (MB)": _megabytes(stats["budget"]["total"]),
+                    "Evicted": ", ".join(stats["budget"]["evicted"]),
+                }
+                for stats in pages.values()
+            ]
+        ),
+        use_container_width=True,
+        hide_index=True
+    )
+
+    for stats in pages.values():
+        if stats.get("top_allocations"):
+            with st.expander(f"Top allocations: {stats['page']}"):
+                st.dataframe(
+                    pd.DataFrame(stats["top_allocations"]),
+                    use_container_width=True,
+                    hide_index=True
+                )
+
+
 # ---------------------------------------------
 # MAIN APP
 # ---------------------------------------------
@@ -662,7 +1835,10 @@ def main():
             "Teachers Analytics",
             "Student Analytics",
             "Comparative Analysis",
-            "Study Material Analytics"
+            "Study Material Analytics",
+            "Regional Analytics",
+            "Data Export",
+            "Diagnostics"
         ]
     )
 
@@ -691,18 +1867,34 @@ def main():
     # ---------------------------------------------
     # PAGE ROUTING
     # ---------------------------------------------
-    if selected_page == "Teachers Analytics":
-        teachers_analytics_page()
+    # A superseded selection cancels its fetches; the rerun that
+    # replaced it renders the page
+    try:
+        with track_page(selected_page):
+            if selected_page == "Teachers Analytics":
+                teachers_analytics_page()
+
+            elif selected_page == "Student Analytics":
+                students_analytics_page()
+
+            elif selected_page == "Comparative Analysis":
+                comparative_analysis()
+
+            elif selected_page == "Study Material Analytics":
+                study_material_analytics_page()
+
+            elif selected_page == "Regional Analytics":
+                regional_analytics_page()
 
-    elif selected_page == "Student Analytics":
-        students_analytics_page()
+            elif selected_page == "Data Export":
+                data_export_page()
 
-    elif selected_page == "Comparative Analysis":
-        comparative_analysis()
+            elif selected_page == "Diagnostics":
+                diagnostics_page()
 
-    elif selected_page == "Study Material Analytics":
-        study_material_analytics_page()
+    except FetchCancelled:
+        st.info("Loading the new selection…")
 
 
 if __name__ == "__main__":
-    main()
+    profile_rerun(main)
@@ -0,0 +1,162 @@
+'''
+Shared helpers for running PostgREST queries built by the fetch modules:
+1. iter_query_pages
+2. try_rpc / fetch_grouped_counts
+3. count_rows / count_many
+4. rpc_params
+
+'''
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from postgrest.exceptions import APIError
+
+from resilience import execute
+
+# Supabase caps a single select at 1000 rows by default, so pages larger
+# than this would be silently truncated by the server.
+DEFAULT_PAGE_SIZE = 1000
+
+# PostgREST / Postgres error codes for an RPC that is not deployed
+MISSING_RPC_CODES = ("PGRST202", "42883")
+
+# Parallel HEAD requests issued by count_many
+COUNT_WORKERS = 8
+
+# Prefer: count=... methods understood by PostgREST. "planned" and
+# "estimated" read the query planner's estimate instead of scanning.
+COUNT_METHODS = ("exact", "planned", "estimated")
+
+
+# --------------------------------------------------
+# PAGED QUERIES
+# --------------------------------------------------
+def iter_query_pages(
+    build_query: Callable,
+    page_size: int = DEFAULT_PAGE_SIZE
+) -> Iterator[List[Dict]]:
+    """
+    Yields successive pages of rows for a query.
+
+    `build_query` must return a fresh, ordered query builder on every
+    call. Each page is requested with `.range()`, so only one page of
+    rows is held in memory at a time.
+    """
+
+    offset = 0
+
+    while True:
+        rows = execute(
+            build_query().range(offset, offset + page_size - 1)
+        ).data or []
+
+        if not rows:
+            return
+
+        yield rows
+
+        if len(rows) < page_size:
+            return
+
+        offset += page_size
+
+
+# --------------------------------------------------
+# OPTIONAL RPCS
+# --------------------------------------------------
+def rpc_params(
+    school_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> Dict:
+    """
+    Standard school + date range parameters shared by the RPCs.
+    """
+    return {
+        "p_school_id": school_id,
+        "p_start_date": start_date.isoformat() if start_date else None,
+        "p_end_date": end_date.isoformat() if end_date else None,
+    }
+
+
+def try_rpc(supabase, name: str, params: Dict) -> Optional[Any]:
+    """
+    Calls an RPC and returns its data, or None if the function is not
+    deployed on the database. Callers fall back to client-side
+    aggregation in that case.
+    """
+
+    try:
+        return execute(supabase.rpc(name, params)).data
+    except APIError as e:
+        if e.code in MISSING_RPC_CODES:
+            return None
+        raise
+
+
+# --------------------------------------------------
+# COUNT-ONLY QUERIES
+# --------------------------------------------------
+def count_rows(query) -> int:
+    """
+    Executes a query built with `select(..., count=..., head=True)` and
+    returns the row count from the Content-Range header. No rows are
+    transferred.
+    """
+    return execute(query).count or 0
+
+
+def check_count_method(count: str) -> str:
+    if count not in COUNT_METHODS:
+        raise ValueError(f"Unsupported count method: {count}")
+    return count
+
+
+def count_many(
+    build_queries: Dict[Any, Callable],
+    max_workers: int = COUNT_WORKERS
+) -> Dict[Any, int]:
+    """
+    Runs several count-only queries concurrently.
+    Maps each key of `build_queries` to its count.
+    """
+
+    if not build_queries:
+        return {}
+
+    # Each count runs in a copy of the caller's context, so it keeps
+    # the caller's request priority and cancellation scope
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            key: pool.submit(
+                contextvars.copy_context().run, lambda b=build: count_rows(b())
+            )
+            for key, build in build_queries.items()
+        }
+        return {key: f.result() for key, f in futures.items()}
+
+
+# --------------------------------------------------
+# GROUPED AGGREGATE RPCS
+# --------------------------------------------------
+def fetch_grouped_counts(
+    supabase,
+    name: str,
+    params: Dict,
+    key_column: str,
+    count_column: str = "count"
+) -> Optional[Dict[Any, int]]:
+    """
+    Calls a grouped-count RPC returning rows of
+    {key_column: ..., count_column: n} and maps keys to counts.
+    Returns None if the RPC is not deployed.
+    """
+
+    data = try_rpc(supabase, name, params)
+
+    if data is None:
+        return None
+
+    return {row[key_column]: int(row[count_column]) for row in data}
@@ -0,0 +1,250 @@
+'''
+Streaming export of raw rows for a school and period:
+1. activity_sessions
+2. student_tool_runs
+
+Rows are paged from the same queries the fetch modules use and written
+incrementally, so memory use does not grow with the export size.
+Parquet columns get the types in EXPORT_COLUMN_TYPES (text otherwise),
+so a column that is null throughout the first page still matches
+later pages.
+
+Usage:
+    python export_data.py <school_id> activity_sessions sessions.csv
+    python export_data.py <school_id> student_tool_runs runs.parquet \
+        --start 2025-09-01 --end 2025-10-01
+'''
+import argparse
+import csv
+from datetime import date
+from typing import Dict, IO, Iterator, List, Optional
+
+from concurrency_governor import EXPORT, request_priority
+from database_utils import DEFAULT_PAGE_SIZE
+from records import parse_timestamp
+from students_database_fetch import iter_activity_sessions
+from study_materials_database_fetch import iter_tool_runs
+
+EXPORT_TABLES = ["activity_sessions", "student_tool_runs"]
+EXPORT_FORMATS = ["csv", "parquet"]
+
+# Parquet column types; other columns are written as text
+EXPORT_COLUMN_TYPES = {
+    "created_at": "timestamp",
+    "updated_at": "timestamp",
+}
+
+
+# --------------------------------------------------
+# ROW STREAMS
+# --------------------------------------------------
+def iter_export_rows(
+    supabase,
+    table: str,
+    school_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    page_size: int = DEFAULT_PAGE_SIZE
+) -> Iterator[List[Dict]]:
+    """
+    Streams pages of raw rows (all columns) for one export table.
+    """
+
+    if table == "activity_sessions":
+        return iter_activity_sessions(
+            supabase,
+            school_id,
+            start_date=start_date,
+            end_date=end_date,
+            columns="*",
+            page_size=page_size
+        )
+
+    if table == "student_tool_runs":
+        return iter_tool_runs(
+            supabase,
+            school_id,
+            start_date=start_date,
+            end_date=end_date,
+            columns="*",
+            page_size=page_size
+        )
+
+    raise ValueError(f"Unsupported export table: {table}")
+
+
+# --------------------------------------------------
+# WRITERS
+# --------------------------------------------------
+def write_csv(pages: Iterator[List[Dict]], fileobj: IO[str]) -> int:
+    """
+    Writes pages of rows to an open text file as CSV.
+    The header is taken from the first row. Returns the row count.
+    """
+
+    writer = None
+    total_rows = 0
+
+    for rows in pages:
+        if writer is None:
+            writer = csv.DictWriter(
+                fileobj,
+                fieldnames=list(rows[0].keys()),
+                restval="",
+                extrasaction="ignore"
+            )
+            writer.writeheader()
+
+        writer.writerows(rows)
+        total_rows += len(rows)
+
+    return total_rows
+
+
+def write_parquet(pages: Iterator[List[Dict]], where) -> int:
+    """
+    Writes pages of rows to a Parquet file, one row group per page.
+    `where` is a path or a binary file object. Requires pyarrow.
+    Returns the row count.
+    """
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "Parquet export requires pyarrow (pip install pyarrow)."
+        ) from e
+
+    writer = None
+    total_rows = 0
+
+    try:
+        for rows in pages:
+            if writer is None:
+                # Every row carries every selected column, so the first
+                # row fixes the column set; types come from the names
+                columns = list(rows[0].keys())
+                writer = pq.ParquetWriter(where, _parquet_schema(pa, columns))
+
+            writer.write_table(
+                pa.Table.from_pydict(
+                    {
+                        column: _parquet_values(rows, column)
+                        for column in columns
+                    },
+                    schema=writer.schema
+                )
+            )
+            total_rows += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return total_rows
+
+
+def _parquet_schema(pa, columns: List[str]):
+    return pa.schema([
+        (
+            column,
+            pa.timestamp("us", tz="UTC")
+            if EXPORT_COLUMN_TYPES.get(column) == "timestamp"
+            else pa.string()
+        )
+        for column in columns
+    ])
+
+
+def _parquet_values(rows: List[Dict], column: str) -> List:
+    values = [row.get(column) for row in rows]
+
+    if EXPORT_COLUMN_TYPES.get(column) == "timestamp":
+        return [parse_timestamp(v) if isinstance(v, str) else v for v in values]
+
+    return [None if v is None else str(v) for v in values]
+
+
+def _limit_rows(pages: Iterator[List[Dict]], max_rows: int) -> Iterator[List[Dict]]:
+    remaining = max_rows
+
+    for rows in pages:
+        if remaining <= 0:
+            return
+        yield rows[:remaining]
+        remaining -= len(rows)
+
+
+def export_to_file(
+    supabase,
+    table: str,
+    school_id,
+    path: str,
+    fmt: str = "csv",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    max_rows: Optional[int] = None
+) -> int:
+    """
+    Streams one export table for a school into `path`, stopping after
+    `max_rows` rows if given. Returns the number of rows written.
+    """
+
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    pages = iter_export_rows(
+        supabase, table, school_id, start_date, end_date, page_size
+    )
+
+    if max_rows is not None:
+        pages = _limit_rows(pages, max_rows)
+
+    # Exports queue behind interactive and prefetch requests
+    with request_priority(EXPORT):
+        if fmt == "csv":
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                return write_csv(pages, f)
+
+        return write_parquet(pages, path)
+
+
+# --------------------------------------------------
+# CLI
+# --------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export raw activity sessions or tool runs for a school."
+    )
+    parser.add_argument("school_id")
+    parser.add_argument("table", choices=EXPORT_TABLES)
+    parser.add_argument("output", help="Output file (.csv or .parquet)")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default=None)
+    parser.add_argument("--start", type=date.fromisoformat, default=None)
+    parser.add_argument("--end", type=date.fromisoformat, default=None)
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or (
+        "parquet" if args.output.endswith(".parquet") else "csv"
+    )
+
+    from students_database_fetch import supabase
+
+    total_rows = export_to_file(
+        supabase,
+        args.table,
+        args.school_id,
+        args.output,
+        fmt=fmt,
+        start_date=args.start,
+        end_date=args.end,
+        page_size=args.page_size
+    )
+
+    print(f"Exported {total_rows} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+'''
+Fast path that decodes large selects straight into DataFrames:
+1. fetch_activity_sessions_frame
+2. fetch_activities_by_teacher_frame
+3. fetch_study_material_frame
+4. fetch_school_activities_frame
+
+Rows are requested from PostgREST as CSV and parsed column-wise by
+pandas (with the pyarrow engine when it is installed), skipping the
+per-row dict stage of the JSON path. Set KIBU_FAST_DECODE=0 to fall
+back to the JSON response.
+'''
+import io
+import os
+from datetime import date
+from typing import Callable, List, Optional
+
+import pandas as pd
+
+from database_utils import DEFAULT_PAGE_SIZE
+from persistent_cache import disk_cached
+from resilience import execute
+from students_database_fetch import (
+    _activity_sessions_query,
+    id_chunks,
+    SESSION_COLUMNS
+)
+from study_materials_database_fetch import _tool_runs_query, TOOL_RUN_COLUMNS
+from teachers_database_fetch import (
+    _activities_by_teacher_query,
+    _school_activities_query,
+    ACTIVITY_COLUMNS,
+    SCHOOL_ACTIVITY_COLUMNS
+)
+
+FAST_DECODE = os.getenv("KIBU_FAST_DECODE", "1") != "0"
+
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = "pyarrow"
+except ImportError:
+    CSV_ENGINE = "c"
+
+DATETIME_COLUMNS = ("created_at",)
+
+
+# --------------------------------------------------
+# UTILITY: DECODING
+# --------------------------------------------------
+def _column_names(columns: str) -> List[str]:
+    return [c.strip() for c in columns.split(",") if c.strip()]
+
+
+def _empty_frame(columns: str) -> pd.DataFrame:
+    return pd.DataFrame(columns=_column_names(columns))
+
+
+def _read_csv_frame(text: str) -> pd.DataFrame:
+    df = pd.read_csv(io.StringIO(text), engine=CSV_ENGINE)
+
+    for col in DATETIME_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], utc=True, errors="coerce")
+
+    return df
+
+
+def _csv_page(query) -> Optional[str]:
+    """
+    Executes a query as CSV. Returns None if the client did not
+    hand back CSV text (older postgrest clients ignore `.csv()`).
+    """
+
+    result = execute(query.csv())
+    text = result if isinstance(result, str) else getattr(result, "data", None)
+
+    # An empty body comes back as an empty list
+    if text == []:
+        return ""
+
+    return text if isinstance(text, str) else None
+
+
+def _fetch_frame(
+    build_query: Callable,
+    columns: str,
+    page_size: int = DEFAULT_PAGE_SIZE
+) -> pd.DataFrame:
+    """
+    Pages through a query and returns one DataFrame.
+    `build_query` must return a fresh, ordered query builder.
+    """
+
+    frames = []
+    offset = 0
+
+    while True:
+        text = (
+            _csv_page(build_query().range(offset, offset + page_size - 1))
+            if FAST_DECODE else None
+        )
+
+        if text is None:
+            rows = execute(
+                build_query().range(offset, offset + page_size - 1)
+            ).data or []
+            page = pd.DataFrame(rows)
+            if "created_at" in page.columns:
+                page["created_at"] = pd.to_datetime(
+                    page["created_at"], utc=True, errors="coerce"
+                )
+            n_rows = len(rows)
+        elif text.strip():
+            page = _read_csv_frame(text)
+            n_rows = len(page)
+        else:
+            n_rows = 0
+
+        if n_rows == 0:
+            break
+
+        frames.append(page)
+
+        if n_rows < page_size:
+            break
+
+        offset += page_size
+
+    if not frames:
+        return _empty_frame(columns)
+
+    return pd.concat(frames, ignore_index=True)
+
+
+# --------------------------------------------------
+# FRAME FETCHES
+# --------------------------------------------------
+def fetch_activity_sessions_frame(
+    supabase,
+    school_id,
+    activity_ids: Optional[List] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    columns: str = SESSION_COLUMNS
+) -> pd.DataFrame:
+    """
+    Same rows as `fetch_activity_sessions`, as a DataFrame.
+    """
+
+    if activity_ids is None:
+        return _fetch_frame(
+            lambda: _activity_sessions_query(
+                supabase, school_id, None, start_date, end_date, columns
+            ).order("created_at").order("id"),
+            columns
+        )
+
+    frames = [
+        _fetch_frame(
+            lambda chunk=chunk: _activity_sessions_query(
+                supabase, school_id, chunk, start_date, end_date, columns
+            ).order("created_at").order("id"),
+            columns
+        )
+        for chunk in id_chunks(activity_ids)
+    ]
+    frames = [frame for frame in frames if not frame.empty]
+
+    if not frames:
+        return _empty_frame(columns)
+
+    return pd.concat(frames, ignore_index=True)
+
+
+@disk_cached(ttl=300)
+def fetch_activities_by_teacher_frame(
+    supabase,
+    teacher_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    columns: str = ACTIVITY_COLUMNS
+) -> pd.DataFrame:
+    """
+    Same rows as `fetch_activities_by_teacher`, as a DataFrame.
+    """
+
+    return _fetch_frame(
+        lambda: _activities_by_teacher_query(
+            supabase, teacher_id, start_date, end_date, columns
+        ).order("id"),
+        columns
+    )
+
+
+def fetch_study_material_frame(
+    supabase,
+    school_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    columns: str = TOOL_RUN_COLUMNS
+) -> pd.DataFrame:
+    """
+    Rows behind `fetch_study_material_stats`, as a DataFrame.
+    """
+
+    return _fetch_frame(
+        lambda: _tool_runs_query(
+            supabase, school_id, start_date, end_date, columns
+        ).order("created_at").order("id"),
+        columns
+    )
+
+
+def fetch_school_activities_frame(
+    supabase,
+    school_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    columns: str = SCHOOL_ACTIVITY_COLUMNS
+) -> pd.DataFrame:
+    """
+    All activities of a school, as a DataFrame.
+    """
+
+    return _fetch_frame(
+        lambda: _school_activities_query(
+            supabase, school_id, start_date, end_date, columns
+        ).order("created_at").order("id"),
+        columns
+    )
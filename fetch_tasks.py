@@ -0,0 +1,191 @@
+'''
+Cancellable fetch tasks tied to the Streamlit rerun:
+1. FetchScope / session_scope
+2. check_cancelled
+
+Every page run submits its fetches to a FetchScope keyed by the
+current selection (page, school, dates ...). When a rerun arrives with
+a different selection, the previous scope is cancelled: queued fetches
+never start, and running ones stop before their next request or page,
+because `resilience.execute` calls `check_cancelled()` first. Requests
+already on the wire finish and their connections go back to the pool.
+
+While the script thread waits on a fetch it touches a placeholder
+element between polls. Element calls are where Streamlit raises a
+pending rerun or stop, so a new widget value interrupts the wait
+without reading Streamlit internals. The page raises FetchCancelled
+past that point; `main` catches it.
+'''
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Callable, Dict, Hashable, Optional
+
+from profiling import run_profiled
+
+FETCH_WORKERS = 16
+POLL_INTERVAL = 0.1  # seconds between rerun checks while waiting
+
+_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="fetch")
+
+_current_token: contextvars.ContextVar = contextvars.ContextVar(
+    "fetch_cancel_token", default=None
+)
+
+SESSION_SCOPE_KEY = "_fetch_scope"
+
+
+class FetchCancelled(Exception):
+    """
+    Raised inside a fetch whose scope was superseded.
+    """
+
+
+# --------------------------------------------------
+# CANCEL TOKEN
+# --------------------------------------------------
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise FetchCancelled()
+
+
+def check_cancelled() -> None:
+    """
+    Raises FetchCancelled if the calling fetch belongs to a cancelled
+    scope. A no-op outside of any scope.
+    """
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+# --------------------------------------------------
+# SCOPES
+# --------------------------------------------------
+class FetchScope:
+    """
+    A group of fetches that are cancelled together.
+    """
+
+    def __init__(self, key: Hashable = None):
+        self.key = key
+        self.token = CancelToken()
+        self.futures = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self.token.cancelled
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Runs `fn(*args, **kwargs)` on the shared fetch pool under this
+        scope's cancel token.
+        """
+
+        token = self.token
+
+        def run():
+            _current_token.set(token)
+            token.raise_if_cancelled()
+            return run_profiled(fn, *args, **kwargs)
+
+        context = contextvars.copy_context()
+        future = _pool.submit(context.run, run)
+        self.futures.append(future)
+        return future
+
+    def cancel(self) -> None:
+        self.token.cancel()
+        for future in self.futures:
+            future.cancel()
+
+    def wait(self, future: Future):
+        """
+        Waits for a future, giving Streamlit an interrupt point between
+        polls. If a rerun or stop is pending, the scope is cancelled and
+        Streamlit's exception propagates so the rerun can start.
+        """
+
+        placeholder = None
+
+        while True:
+            try:
+                return future.result(timeout=POLL_INTERVAL)
+            except FutureTimeout:
+                pass
+
+            try:
+                placeholder = _yield_to_streamlit(placeholder)
+            except BaseException:
+                # RerunException / StopException
+                self.cancel()
+                raise
+
+    def gather(self, calls: Dict[str, Callable]) -> Dict:
+        """
+        Runs zero-argument callables (e.g. functools.partial) concurrently
+        and returns their results by name.
+        """
+
+        futures = {name: self.submit(call) for name, call in calls.items()}
+        return {name: self.wait(f) for name, f in futures.items()}
+
+
+def session_scope(key: Hashable) -> FetchScope:
+    """
+    The FetchScope for the current Streamlit session and selection.
+    A different `key` from the previous run cancels the old scope.
+    """
+
+    import streamlit as st
+
+    scope: Optional[FetchScope] = st.session_state.get(SESSION_SCOPE_KEY)
+
+    if scope is not None and scope.key != key:
+        scope.cancel()
+        scope = None
+
+    if scope is None or scope.cancelled:
+        scope = FetchScope(key)
+        st.session_state[SESSION_SCOPE_KEY] = scope
+
+    # Forget futures from earlier runs of the same selection
+    scope.futures = [f for f in scope.futures if not f.done()]
+
+    return scope
+
+
+# --------------------------------------------------
+# UTILITY: STREAMLIT INTERRUPT POINT
+# --------------------------------------------------
+def _yield_to_streamlit(placeholder=None):
+    """
+    Any element call is a Streamlit interrupt point; it raises a pending
+    RerunException / StopException. Re-empties one placeholder so
+    repeated polls do not add elements. Returns the placeholder, or
+    None outside a script run.
+    """
+
+    import streamlit as st
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return None
+
+    if placeholder is None:
+        return st.empty()
+
+    placeholder.empty()
+    return placeholder
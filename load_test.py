@@ -0,0 +1,540 @@
+'''
+Concurrent multi-user load test of the dashboard:
+1. DashboardServer (one `streamlit run dashboard.py` process)
+2. BrowserSession (one user session over the websocket)
+3. JOURNEY (scripted user steps)
+4. run_load (one concurrency level)
+5. CLI (record a cassette, or ramp through concurrency levels)
+
+All virtual users are sessions of one dashboard server started by the
+harness, so the report shows what a single worker sustains: sessions
+share its interpreter, concurrency governor, in-process caches and
+range indexes, as they would in production. Each user talks to the
+server over Streamlit's websocket protocol the way a browser tab
+does: it sends a rerun with its widget values and reads the page back
+until the script finishes. A user repeats the journey in a fresh
+session: open the dashboard, select a school, open a teacher, switch
+to Comparative Analysis, pick a school there and change the
+comparison dates. Every step is one rerun and is timed separately.
+
+The backend is a recorded cassette (see cassette.py), so results
+measure the Streamlit layer without network variance. Record one
+against a real backend first with --record; pass --latency to replay
+the recorded request latencies. Cassettes contain date filters, and
+the comparison page defaults to today, so re-record on a new day.
+Set KIBU_CACHE_DISABLED=1 to measure without the disk cache. Levels
+run one after another against the same server, so later levels start
+with its caches warm.
+
+For each level the report gives throughput (reruns and journeys per
+second), per-step and overall latency percentiles, errors, and the
+server process's CPU use (cores) and resident memory, read from /proc
+(Linux only; shown as "-" elsewhere).
+
+Usage:
+    python load_test.py --record --cassette load.sqlite3
+    python load_test.py --cassette load.sqlite3 --users 1,4,8,16 --journeys 5
+'''
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from websockets.sync.client import connect
+
+import cassette
+
+DASHBOARD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dashboard.py")
+RERUN_TIMEOUT = 120  # seconds
+SERVER_START_TIMEOUT = 60  # seconds
+PERCENTILES = [50, 90, 95, 99]
+
+# Widgets the journey reads and sets
+WIDGET_TYPES = ("selectbox", "radio", "date_input")
+
+
+class JourneyError(Exception):
+    """
+    A step could not run (missing widget or page exception).
+    """
+
+
+# --------------------------------------------------
+# SERVER
+# --------------------------------------------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class DashboardServer:
+    """
+    `streamlit run dashboard.py` in a child process on a free local
+    port, with the cassette set through its environment. Use as a
+    context manager.
+    """
+
+    def __init__(self, mode: str, cassette_path: str, latency: bool = False):
+        self.mode = mode
+        self.cassette_path = os.path.abspath(cassette_path)
+        self.latency = latency
+        self.port = _free_port()
+        self.process: Optional[subprocess.Popen] = None
+        self.log_path: Optional[str] = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://127.0.0.1:{self.port}/_stcore/stream"
+
+    def __enter__(self) -> "DashboardServer":
+        env = dict(
+            os.environ,
+            KIBU_CASSETTE_MODE=self.mode,
+            KIBU_CASSETTE_PATH=self.cassette_path,
+            KIBU_CASSETTE_LATENCY="1" if self.latency else "0",
+        )
+
+        log = tempfile.NamedTemporaryFile(
+            prefix="kibu-load-server-", suffix=".log", delete=False
+        )
+        self.log_path = log.name
+
+        self.process = subprocess.Popen(
+            [
+                sys.executable, "-m", "streamlit", "run", DASHBOARD_PATH,
+                "--server.headless=true",
+                "--server.address=127.0.0.1",
+                f"--server.port={self.port}",
+                "--server.fileWatcherType=none",
+                "--browser.gatherUsageStats=false",
+            ],
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        log.close()
+
+        try:
+            self._wait_until_healthy()
+        except BaseException:
+            self.stop()
+            raise
+
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _wait_until_healthy(self) -> None:
+        # Straight to localhost, whatever proxy the environment sets
+        opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+        health = f"http://127.0.0.1:{self.port}/_stcore/health"
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                with opener.open(health, timeout=1) as response:
+                    if response.status == 200:
+                        return
+            except OSError:
+                pass
+            time.sleep(0.2)
+
+        raise RuntimeError(f"Dashboard server did not start; see {self.log_path}")
+
+    def stop(self) -> None:
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def usage(self) -> Dict[str, Optional[float]]:
+        """
+        The server's CPU seconds (user + system), current and peak
+        resident memory in bytes; None where /proc is missing.
+        """
+
+        proc = f"/proc/{self.process.pid}"
+
+        try:
+            with open(f"{proc}/stat") as f:
+                # Fields after the parenthesised command name; utime and
+                # stime are the 14th and 15th fields of the line
+                fields = f.read().rsplit(")", 1)[1].split()
+            cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+            memory = {}
+            with open(f"{proc}/status") as f:
+                for line in f:
+                    name, _, value = line.partition(":")
+                    if name in ("VmRSS", "VmHWM"):
+                        memory[name] = int(value.split()[0]) * 1024
+        except (OSError, ValueError, IndexError):
+            return {"cpu": None, "rss": None, "peak_rss": None}
+
+        return {
+            "cpu": cpu,
+            "rss": memory.get("VmRSS"),
+            "peak_rss": memory.get("VmHWM"),
+        }
+
+
+# --------------------------------------------------
+# SESSION
+# --------------------------------------------------
+class BrowserSession:
+    """
+    One dashboard session over the websocket, as a browser tab holds
+    it. The widget values the user has set are sent with every rerun;
+    `widgets` (by label) and `exceptions` describe the last page.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.connection = None
+        self.states: Dict[str, WidgetState] = {}
+        self.widgets: Dict[str, object] = {}
+        self.exceptions: List[str] = []
+
+    def run(self) -> None:
+        """
+        One rerun: sends the widget values and reads the page until the
+        script has finished.
+        """
+
+        if self.connection is None:
+            self.connection = connect(
+                self.url,
+                subprotocols=["streamlit"],
+                open_timeout=RERUN_TIMEOUT,
+                max_size=None,
+            )
+
+        back = BackMsg()
+        back.rerun_script.widget_states.widgets.extend(self.states.values())
+        self.connection.send(back.SerializeToString())
+
+        deadline = time.monotonic() + RERUN_TIMEOUT
+
+        while True:
+            msg = ForwardMsg()
+            msg.ParseFromString(
+                self.connection.recv(timeout=max(0.0, deadline - time.monotonic()))
+            )
+            kind = msg.WhichOneof("type")
+
+            if kind == "new_session":
+                # Sent as every script run starts, including one the
+                # script triggers itself
+                self.widgets, self.exceptions = {}, []
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                element = msg.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type in WIDGET_TYPES:
+                    widget = getattr(element, element_type)
+                    self.widgets.setdefault(widget.label, widget)
+                elif element_type == "exception":
+                    self.exceptions.append(element.exception.message)
+            elif kind == "script_finished":
+                if msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    break
+
+        # Like a browser, keep values only for widgets still on the page
+        shown = {widget.id for widget in self.widgets.values()}
+        self.states = {id_: s for id_, s in self.states.items() if id_ in shown}
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+
+    def _widget(self, label: str):
+        if label not in self.widgets:
+            raise JourneyError(f"No widget labelled {label!r}")
+        return self.widgets[label]
+
+    def options(self, label: str) -> List[str]:
+        return list(self._widget(label).options)
+
+    def choose(self, label: str, option: str) -> None:
+        """
+        Selects `option` in a selectbox or radio.
+        """
+        state = WidgetState(id=self._widget(label).id)
+        state.string_value = option
+        self.states[state.id] = state
+
+    def set_date(self, label: str, value: date) -> None:
+        state = WidgetState(id=self._widget(label).id)
+        state.string_array_value.data[:] = [value.isoformat()]
+        self.states[state.id] = state
+
+
+# --------------------------------------------------
+# JOURNEY STEPS
+# --------------------------------------------------
+def _pick(options: List, user: int):
+    """
+    A real option (not the "Select ..." placeholder), varied per user.
+    """
+    if len(options) < 2:
+        raise JourneyError("Nothing to select")
+    return options[1 + user % (len(options) - 1)]
+
+
+def _open_dashboard(session: BrowserSession, user: int, iteration: int) -> None:
+    pass
+
+
+def _select_school(session: BrowserSession, user: int, iteration: int) -> None:
+    label = "Select a School"
+    session.choose(label, _pick(session.options(label), user + iteration))
+
+
+def _open_teacher(session: BrowserSession, user: int, iteration: int) -> None:
+    label = "Select a Teacher"
+    session.choose(label, _pick(session.options(label), user))
+
+
+def _open_comparative(session: BrowserSession, user: int, iteration: int) -> None:
+    session.choose("Select Analytics View", "Comparative Analysis")
+
+
+def _compare_school(session: BrowserSession, user: int, iteration: int) -> None:
+    label = "Select School"
+    session.choose(label, _pick(session.options(label), user + iteration))
+
+
+def _change_dates(session: BrowserSession, user: int, iteration: int) -> None:
+    # Same windows for every run of a given (user, iteration), so a
+    # recorded cassette covers them
+    end_b = date.today() - timedelta(days=7 * ((user + iteration) % 4))
+    start_b = end_b - timedelta(days=29)
+
+    session.set_date("Start Date A", start_b - timedelta(days=30))
+    session.set_date("End Date A", start_b - timedelta(days=1))
+    session.set_date("Start Date B", start_b)
+    session.set_date("End Date B", end_b)
+
+
+JOURNEY: List = [
+    ("open dashboard", _open_dashboard),
+    ("select school", _select_school),
+    ("open teacher", _open_teacher),
+    ("comparative analysis", _open_comparative),
+    ("compare school", _compare_school),
+    ("change dates", _change_dates),
+]
+
+
+# --------------------------------------------------
+# RUNNER
+# --------------------------------------------------
+def run_journey(url: str, user: int, iteration: int, record: Callable) -> None:
+    """
+    One journey in a fresh session. `record(step, seconds, error)` is
+    called per step; the journey stops at the first failing step.
+    """
+
+    session = BrowserSession(url)
+
+    try:
+        for step, prepare in JOURNEY:
+            try:
+                prepare(session, user, iteration)
+                started = time.perf_counter()
+                session.run()
+                seconds = time.perf_counter() - started
+
+                if session.exceptions:
+                    raise JourneyError(session.exceptions[0])
+            except Exception as e:
+                record(step, None, f"{type(e).__name__}: {e}")
+                return
+
+            record(step, seconds, None)
+    finally:
+        session.close()
+
+
+def _percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    ordered = sorted(samples)
+    return {
+        f"p{p}": ordered[max(0, int(round(len(ordered) * p / 100)) - 1)] if ordered else None
+        for p in PERCENTILES
+    }
+
+
+def _mb(value: Optional[float]) -> Optional[float]:
+    return None if value is None else value / 1024 / 1024
+
+
+def run_load(server: DashboardServer, users: int, journeys: int) -> Dict:
+    """
+    `users` concurrent sessions against `server`, each running
+    `journeys` journeys one after another.
+    """
+
+    latencies: Dict[str, List[float]] = {step: [] for step, _ in JOURNEY}
+    errors: Dict[str, List[str]] = {step: [] for step, _ in JOURNEY}
+    completed = [0]
+    lock = threading.Lock()
+
+    def record(step: str, seconds: Optional[float], error: Optional[str]) -> None:
+        with lock:
+            if error is None:
+                latencies[step].append(seconds)
+            else:
+                errors[step].append(error)
+
+    def user_loop(user: int) -> None:
+        for iteration in range(journeys):
+            run_journey(server.url, user, iteration, record)
+            with lock:
+                completed[0] += 1
+
+    threads = [
+        threading.Thread(target=user_loop, args=(user,), name=f"user-{user}")
+        for user in range(users)
+    ]
+
+    before = server.usage()
+    started = time.perf_counter()
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    wall = time.perf_counter() - started
+    after = server.usage()
+
+    all_latencies = [s for samples in latencies.values() for s in samples]
+
+    return {
+        "users": users,
+        "journeys": completed[0],
+        "reruns": len(all_latencies),
+        "seconds": wall,
+        "reruns_per_second": len(all_latencies) / wall if wall else 0.0,
+        "journeys_per_second": completed[0] / wall if wall else 0.0,
+        "latency": _percentiles(all_latencies),
+        "steps": {
+            step: {**_percentiles(samples), "errors": len(errors[step])}
+            for step, samples in latencies.items()
+        },
+        "errors": {step: found[:3] for step, found in errors.items() if found},
+        "cpu_cores": (
+            (after["cpu"] - before["cpu"]) / wall
+            if wall and after["cpu"] is not None else None
+        ),
+        "rss_mb": _mb(after["rss"]),
+        "peak_rss_mb": _mb(after["peak_rss"]),
+    }
+
+
+# --------------------------------------------------
+# REPORT
+# --------------------------------------------------
+def _ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}"
+
+
+def _number(value: Optional[float], width: int, digits: int) -> str:
+    return f"{'-':>{width}}" if value is None else f"{value:>{width}.{digits}f}"
+
+
+def print_report(results: List[Dict]) -> None:
+    print(
+        f"{'users':>5} {'reruns/s':>9} {'journeys/s':>10} "
+        + " ".join(f"{'p' + str(p) + ' ms':>8}" for p in PERCENTILES)
+        + f" {'errors':>6} {'cpu':>5} {'rss MB':>7}"
+    )
+    for result in results:
+        errors = sum(step["errors"] for step in result["steps"].values())
+        print(
+            f"{result['users']:>5} {result['reruns_per_second']:>9.2f} "
+            f"{result['journeys_per_second']:>10.2f} "
+            + " ".join(f"{_ms(result['latency'][f'p{p}']):>8}" for p in PERCENTILES)
+            + f" {errors:>6} {_number(result['cpu_cores'], 5, 2)}"
+            + f" {_number(result['rss_mb'], 7, 0)}"
+        )
+
+    last = results[-1]
+    print(f"\nPer step at {last['users']} users (ms):")
+    for step, stats in last["steps"].items():
+        print(
+            f"  {step:<22} "
+            + " ".join(f"p{p} {_ms(stats[f'p{p}']):>6}" for p in PERCENTILES)
+            + f"  errors {stats['errors']}"
+        )
+
+    for result in results:
+        for step, found in result["errors"].items():
+            print(f"\n{result['users']} users, {step}: {found[0]}")
+
+
+# --------------------------------------------------
+# CLI
+# --------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load test the dashboard with concurrent scripted users."
+    )
+    parser.add_argument("--cassette", default=cassette.CASSETTE_PATH)
+    parser.add_argument(
+        "--record",
+        action="store_true",
+        help="Run every journey once against the real backend, recording the cassette"
+    )
+    parser.add_argument(
+        "--users",
+        default="1,2,4,8",
+        help="Comma-separated concurrency levels (default 1,2,4,8)"
+    )
+    parser.add_argument("--journeys", type=int, default=3, help="Journeys per user")
+    parser.add_argument("--latency", action="store_true", help="Replay recorded latencies")
+    parser.add_argument("--json", default=None, help="Also write results to this file")
+    args = parser.parse_args(argv)
+
+    levels = [int(n) for n in args.users.split(",") if n.strip()]
+
+    if not args.record and not os.path.exists(args.cassette):
+        parser.error(f"No cassette at {args.cassette}; record one with --record")
+
+    mode = "record" if args.record else "replay"
+
+    with DashboardServer(mode, args.cassette, latency=args.latency) as server:
+        if args.record:
+            # One session per (user, iteration) pair the load runs will use
+            results = [run_load(server, max(levels), args.journeys)]
+            print(f"Recorded {results[0]['reruns']} reruns into {args.cassette}")
+        else:
+            results = [run_load(server, users, args.journeys) for users in levels]
+
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+'''
+Memory accounting and per-session budgets:
+1. track_page (tracemalloc around a page run + budget check)
+2. estimate_size / session_state_sizes / process_cache_sizes
+3. enforce_budget / prefer_streaming
+
+Each page run is measured with tracemalloc (when tracing is on) and
+then the session's retained size is estimated: session_state entries,
+including results still held by fetch futures. Over the budget, the
+session's largest session_state entries are dropped until it fits, and
+the session switches to streaming aggregation (`prefer_streaming()`):
+fetches that would otherwise pull raw rows into memory use server-side
+aggregates instead. A later run that fits without dropping anything
+switches streaming off again. The in-process caches are shared by
+every session, so a single session going over budget never clears
+them.
+
+tracemalloc is process-wide: a page's net allocations include whatever
+other sessions allocated meanwhile, and the traced peak is only
+reported for the whole process (resetting it would disturb every other
+session's measurement).
+
+Environment:
+    KIBU_SESSION_MEMORY_MB   per-session budget (default 256)
+    KIBU_TRACE_MEMORY        set to 1 to start tracemalloc at import
+'''
+import contextlib
+import contextvars
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+SESSION_MEMORY_BUDGET = int(
+    float(os.getenv("KIBU_SESSION_MEMORY_MB", "256")) * 1024 * 1024
+)
+TRACE_FRAMES = 1
+TOP_ALLOCATIONS = 10
+MAX_DEPTH = 6
+
+PAGE_STATS_KEY = "_memory_pages"
+STREAMING_KEY = "_memory_prefer_streaming"
+EVICTIONS_KEY = "_memory_evictions"
+
+# Bookkeeping that enforce_budget never drops
+PROTECTED_KEYS = (STREAMING_KEY, EVICTIONS_KEY)
+
+if os.getenv("KIBU_TRACE_MEMORY", "0") == "1":
+    tracemalloc.start(TRACE_FRAMES)
+
+_prefer_streaming: contextvars.ContextVar = contextvars.ContextVar(
+    "memory_prefer_streaming", default=False
+)
+
+
+# --------------------------------------------------
+# SIZE ESTIMATES
+# --------------------------------------------------
+def estimate_size(obj: Any, _seen=None, _depth: int = 0) -> int:
+    """
+    Approximate retained bytes of an object graph. DataFrames, numpy
+    arrays and SessionBatch report their own buffer sizes; containers
+    are walked up to MAX_DEPTH levels. Shared objects count once.
+    """
+
+    if _seen is None:
+        _seen = set()
+
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    memory_usage = getattr(obj, "memory_usage", None)
+    if callable(memory_usage) and hasattr(obj, "columns"):
+        return int(memory_usage(deep=True).sum())
+
+    nbytes = getattr(obj, "nbytes", None)
+    if nbytes is not None and not isinstance(obj, type):
+        try:
+            return int(nbytes() if callable(nbytes) else nbytes) + sys.getsizeof(obj)
+        except TypeError:
+            pass
+
+    size = sys.getsizeof(obj)
+
+    if _depth >= MAX_DEPTH:
+        return size
+
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += estimate_size(key, _seen, _depth + 1)
+            size += estimate_size(value, _seen, _depth + 1)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += estimate_size(item, _seen, _depth + 1)
+    elif hasattr(obj, "futures"):
+        # FetchScope: finished futures keep their results alive
+        for future in obj.futures:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                size += estimate_size(future.result(), _seen, _depth + 1)
+    elif hasattr(obj, "__dict__"):
+        size += estimate_size(vars(obj), _seen, _depth + 1)
+
+    return size
+
+
+def session_state_sizes() -> Dict[str, int]:
+    import streamlit as st
+
+    return {
+        str(key): estimate_size(value)
+        for key, value in st.session_state.to_dict().items()
+    }
+
+
+def process_cache_sizes() -> Dict[str, int]:
+    """
+    In-process caches shared by all sessions, plus the disk cache.
+    """
+
+    import range_index
+    import resilience
+    import teachers_database_fetch
+    from persistent_cache import CACHE_DISABLED, get_cache
+
+    sizes = {
+        "stale responses (resilience)": estimate_size(resilience._stale),
+        "teacher search cache": estimate_size(
+            teachers_database_fetch._search_cache
+        ),
+        "range indexes": estimate_size(range_index._indexes),
+    }
+
+    if not CACHE_DISABLED:
+        sizes["disk cache (on disk)"] = get_cache().total_bytes()
+
+    return sizes
+
+
+def process_rss() -> int:
+    """
+    Peak resident set size of the worker process, in bytes (0 if unknown).
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# --------------------------------------------------
+# BUDGET
+# --------------------------------------------------
+def prefer_streaming() -> bool:
+    """
+    True when the current session is over its memory budget. Safe to
+    call from fetch threads (FetchScope copies the context).
+    """
+    return _prefer_streaming.get()
+
+
+def clear_process_caches() -> None:
+    """
+    Empties the in-process caches shared by all sessions. An operator
+    action (Diagnostics page, admin controls only).
+    """
+
+    import range_index
+    import resilience
+    import teachers_database_fetch
+
+    resilience.clear_stale()
+    with teachers_database_fetch._search_lock:
+        teachers_database_fetch._search_cache.clear()
+    range_index.clear_range_indexes()
+
+
+def enforce_budget(budget: int = SESSION_MEMORY_BUDGET) -> Dict:
+    """
+    Estimates the session's retained size. Over `budget`, drops the
+    session's largest session_state entries until it fits and switches
+    it to streaming aggregation; the fetch scope only loses its finished
+    results, never fetches still running. Within `budget`, switches
+    streaming off. Caches shared with other sessions are left alone.
+    """
+
+    import streamlit as st
+
+    from fetch_tasks import SESSION_SCOPE_KEY
+
+    sizes = session_state_sizes()
+    total = sum(sizes.values())
+
+    if total <= budget:
+        if st.session_state.get(STREAMING_KEY):
+            st.session_state[STREAMING_KEY] = False
+        return {"total": total, "evicted": []}
+
+    evicted = []
+
+    for key, size in sorted(sizes.items(), key=lambda kv: kv[1], reverse=True):
+        if total <= budget:
+            break
+        if key in PROTECTED_KEYS:
+            continue
+
+        if key == SESSION_SCOPE_KEY:
+            scope = st.session_state[key]
+            scope.futures = [f for f in scope.futures if not f.done()]
+            total -= size - estimate_size(scope)
+        else:
+            del st.session_state[key]
+            total -= size
+
+        evicted.append(key)
+
+    st.session_state[STREAMING_KEY] = True
+    st.session_state[EVICTIONS_KEY] = st.session_state.get(EVICTIONS_KEY, 0) + 1
+
+    return {"total": total, "evicted": evicted}
+
+
+# --------------------------------------------------
+# PAGE TRACKING
+# --------------------------------------------------
+def _top_allocations(before, after) -> List[Dict]:
+    return [
+        {
+            "location": str(stat.traceback),
+            "size_diff": stat.size_diff,
+            "count_diff": stat.count_diff,
+        }
+        for stat in after.compare_to(before, "lineno")[:TOP_ALLOCATIONS]
+    ]
+
+
+@contextlib.contextmanager
+def track_page(name: str):
+    """
+    Wraps a page function: applies the session's streaming preference,
+    measures allocations with tracemalloc (if tracing), and checks the
+    session budget afterwards.
+    """
+
+    import streamlit as st
+
+    token = _prefer_streaming.set(bool(st.session_state.get(STREAMING_KEY)))
+
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        before = tracemalloc.take_snapshot()
+        current_before = tracemalloc.get_traced_memory()[0]
+
+    started = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        _prefer_streaming.reset(token)
+
+        stats = {
+            "page": name,
+            "seconds": time.perf_counter() - started,
+        }
+
+        if tracing:
+            stats["net_allocated"] = (
+                tracemalloc.get_traced_memory()[0] - current_before
+            )
+            stats["top_allocations"] = _top_allocations(
+                before, tracemalloc.take_snapshot()
+            )
+
+        stats["budget"] = enforce_budget()
+
+        pages = st.session_state.setdefault(PAGE_STATS_KEY, {})
+        pages[name] = stats
@@ -0,0 +1,375 @@
+'''
+Disk-backed cache for fetch results, shared by every Streamlit worker
+on a host:
+1. disk_cached (decorator)
+2. PersistentCache
+
+Entries live in one SQLite file (WAL mode, so readers never block the
+writer), serialized with pickle and zlib. Each entry has a TTL, and
+the least recently used entries are evicted once the file grows past
+KIBU_CACHE_MAX_MB. A fresh worker starts warm: anything another worker
+fetched is already on disk.
+
+The file holds student data and pickles, so it lives in a directory
+only the dashboard's user can open (created with mode 0700; an
+existing one must be owned by the user and closed to others), and
+every entry is signed with HMAC-SHA256. Entries whose signature does
+not match are dropped without being unpickled. The key is
+KIBU_CACHE_SECRET, or a random key kept in `cache.key` (mode 0600)
+next to the file, so workers of the same user share it.
+
+Environment:
+    KIBU_CACHE_PATH       SQLite file (default: ~/.cache/kibu_dashboard/cache.sqlite3)
+    KIBU_CACHE_SECRET     signing key (default: generated, in cache.key)
+    KIBU_CACHE_MAX_MB     size budget (default 256)
+    KIBU_CACHE_DISABLED   set to 1 to bypass the cache
+'''
+import functools
+import hashlib
+import hmac
+import inspect
+import os
+import pickle
+import secrets
+import sqlite3
+import stat
+import threading
+import time
+import zlib
+from typing import Any, Callable, Optional
+
+CACHE_PATH = os.getenv(
+    "KIBU_CACHE_PATH",
+    os.path.join(
+        os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+        "kibu_dashboard",
+        "cache.sqlite3"
+    )
+)
+CACHE_SECRET = os.getenv("KIBU_CACHE_SECRET")
+CACHE_MAX_BYTES = int(float(os.getenv("KIBU_CACHE_MAX_MB", "256")) * 1024 * 1024)
+CACHE_DISABLED = os.getenv("KIBU_CACHE_DISABLED", "0") == "1"
+
+DEFAULT_TTL = 600           # seconds
+ACCESS_TOUCH_INTERVAL = 60  # seconds between LRU timestamp updates
+
+KEY_FILE = "cache.key"
+SIGNATURE_BYTES = hashlib.sha256().digest_size
+
+_MISSING = object()
+
+
+class InsecureCacheLocation(Exception):
+    """
+    Raised when the cache directory or key file could be read or
+    replaced by other users.
+    """
+
+
+# --------------------------------------------------
+# UTILITY: PRIVATE FILES
+# --------------------------------------------------
+def _check_private(path: str, st: os.stat_result) -> None:
+    if not hasattr(os, "getuid"):
+        return
+    if st.st_uid != os.getuid() or st.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+        raise InsecureCacheLocation(
+            f"{path} must be owned by this user and closed to others "
+            "(mode 0700 for the directory, 0600 for files)"
+        )
+
+
+def private_directory(path: str) -> str:
+    """
+    Creates `path` with mode 0700, or checks that an existing one is
+    private to this user.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    _check_private(path, os.stat(path))
+    return path
+
+
+def _load_key(directory: str) -> bytes:
+    if CACHE_SECRET:
+        return CACHE_SECRET.encode("utf-8")
+
+    path = os.path.join(directory, KEY_FILE)
+
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        pass
+    else:
+        with os.fdopen(fd, "wb") as f:
+            f.write(secrets.token_bytes(32))
+
+    with open(path, "rb") as f:
+        _check_private(path, os.fstat(f.fileno()))
+        key = f.read()
+
+    if len(key) < 32:
+        # Another worker is still writing it
+        time.sleep(0.1)
+        with open(path, "rb") as f:
+            key = f.read()
+
+    return key
+
+
+# --------------------------------------------------
+# STORE
+# --------------------------------------------------
+# `totals` holds the running size of `entries`, maintained by triggers
+# so every worker process sees the same figure
+CACHE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS entries (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        expires_at REAL NOT NULL,
+        accessed_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)",
+    "CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires_at)",
+    """
+    CREATE TABLE IF NOT EXISTS totals (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        bytes INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries
+    BEGIN
+        UPDATE totals SET bytes = bytes + NEW.size WHERE id = 0;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries
+    BEGIN
+        UPDATE totals SET bytes = bytes - OLD.size WHERE id = 0;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS entries_resize AFTER UPDATE OF size ON entries
+    BEGIN
+        UPDATE totals SET bytes = bytes + NEW.size - OLD.size WHERE id = 0;
+    END
+    """,
+]
+
+
+class PersistentCache:
+    """
+    TTL + size-bounded key/value store in a SQLite file.
+    Safe to use from many threads and processes at once.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+        directory = private_directory(os.path.dirname(os.path.abspath(path)))
+        self._key = _load_key(directory)
+
+        # Create the file ourselves so it never has the umask's mode
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        _check_private(path, os.stat(path))
+
+        conn = self._connect()
+        for statement in CACHE_SCHEMA:
+            conn.execute(statement)
+        conn.execute(
+            "INSERT OR IGNORE INTO totals (id, bytes) "
+            "SELECT 0, COALESCE(SUM(size), 0) FROM entries"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        conn = self._connect()
+
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM entries WHERE key = ?",
+            (key,)
+        ).fetchone()
+
+        if row is None or row[1] <= now:
+            return default
+
+        if now - row[2] > ACCESS_TOUCH_INTERVAL:
+            conn.execute(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?",
+                (now, key)
+            )
+
+        blob = bytes(row[0])
+        signature, payload = blob[:SIGNATURE_BYTES], blob[SIGNATURE_BYTES:]
+
+        if not hmac.compare_digest(signature, self._sign(key, payload)):
+            # Not written by us (or an older format): never unpickled
+            self.delete(key)
+            return default
+
+        try:
+            return pickle.loads(zlib.decompress(payload))
+        except Exception:
+            # Written by an incompatible version; treat as a miss
+            self.delete(key)
+            return default
+
+    def _sign(self, key: str, payload: bytes) -> bytes:
+        # The key is signed too, so an entry cannot be moved to another key
+        return hmac.new(
+            self._key, key.encode("utf-8") + b"\0" + payload, hashlib.sha256
+        ).digest()
+
+    def set(self, key: str, value: Any, ttl: float = DEFAULT_TTL) -> None:
+        payload = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        blob = self._sign(key, payload) + payload
+
+        if len(blob) > self.max_bytes:
+            return
+
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO entries "
+            "(key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, "
+            "size = excluded.size, expires_at = excluded.expires_at, "
+            "accessed_at = excluded.accessed_at",
+            (key, blob, len(blob), now + ttl, now)
+        )
+        self._evict()
+
+    def delete(self, key: str) -> None:
+        self._connect().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def delete_prefix(self, prefix: str) -> None:
+        self._connect().execute(
+            "DELETE FROM entries WHERE substr(key, 1, ?) = ?",
+            (len(prefix), prefix)
+        )
+
+    def clear(self) -> None:
+        self._connect().execute("DELETE FROM entries")
+
+    def total_bytes(self) -> int:
+        """
+        Stored bytes, kept up to date by triggers (no table scan).
+        """
+        row = self._connect().execute(
+            "SELECT bytes FROM totals WHERE id = 0"
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _evict(self) -> None:
+        if self.total_bytes() <= self.max_bytes:
+            return
+
+        conn = self._connect()
+        conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+
+        excess = self.total_bytes() - self.max_bytes
+        if excess <= 0:
+            return
+
+        # Drop least recently used entries until back under budget
+        freed = 0
+        victims = []
+        for key, size in conn.execute(
+            "SELECT key, size FROM entries ORDER BY accessed_at"
+        ):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+
+        conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+
+
+_cache: Optional[PersistentCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> PersistentCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PersistentCache()
+        return _cache
+
+
+# --------------------------------------------------
+# DECORATOR
+# --------------------------------------------------
+def _function_prefix(func: Callable) -> str:
+    return f"{func.__module__}.{func.__qualname__}:"
+
+
+def cache_key(func: Callable, args: tuple, kwargs: dict) -> str:
+    """
+    Key for a fetch call, independent of whether arguments were passed
+    by position or keyword. The `supabase` client is not part of the key.
+    """
+
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+
+    arguments = [
+        (name, value) for name, value in bound.arguments.items()
+        if name != "supabase"
+    ]
+
+    payload = pickle.dumps(arguments, protocol=4)
+    return _function_prefix(func) + hashlib.sha256(payload).hexdigest()
+
+
+def disk_cached(ttl: float = DEFAULT_TTL):
+    """
+    Caches a `fetch_*(supabase, ...)` function's result on disk.
+    The wrapped function gains `cache_clear()`, and `cache_peek(...)`
+    which returns the cached result for those arguments, or None,
+    without calling the function.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        prefix = _function_prefix(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if CACHE_DISABLED:
+                return func(*args, **kwargs)
+
+            key = cache_key(func, args, kwargs)
+            cache = get_cache()
+
+            value = cache.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+            value = func(*args, **kwargs)
+            cache.set(key, value, ttl)
+            return value
+
+        def cache_peek(*args, **kwargs):
+            if CACHE_DISABLED:
+                return None
+            return get_cache().get(cache_key(func, args, kwargs))
+
+        wrapper.cache_clear = lambda: get_cache().delete_prefix(prefix)
+        wrapper.cache_peek = cache_peek
+        return wrapper
+
+    return decorator
@@ -0,0 +1,107 @@
+'''
+Predictive prefetch of the views users open after picking a school:
+1. prefetch_school
+
+Warms the first page of the teacher picker, the student metrics and
+the study-tool stats in background threads. Results land in the shared
+disk cache (persistent_cache) or, for the teacher search, in its
+in-process cache, so the next page switch is a cache hit.
+
+A small dedicated pool bounds how much backend load prefetching can
+add (KIBU_PREFETCH_WORKERS), its requests queue at background priority
+behind interactive ones, and a school is not prefetched again within
+PREFETCH_INTERVAL seconds.
+'''
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from concurrency_governor import BACKGROUND, request_priority
+from student_metrics import fetch_student_metrics
+from study_materials_database_fetch import fetch_study_material_stats
+from teachers_database_fetch import (
+    fetch_school_activity_stats,
+    search_teachers
+)
+
+PREFETCH_WORKERS = int(os.getenv("KIBU_PREFETCH_WORKERS", "3"))
+PREFETCH_INTERVAL = 120  # seconds
+
+logger = logging.getLogger(__name__)
+
+_pool = ThreadPoolExecutor(
+    max_workers=PREFETCH_WORKERS,
+    thread_name_prefix="prefetch"
+)
+_lock = threading.Lock()
+_last_prefetch: Dict = {}
+_queued = 0
+
+
+def first_teacher_page(supabase, school_id) -> Dict:
+    """
+    The teacher picker's first page with an empty search box.
+    """
+    return search_teachers(supabase, school_id, "", offset=0)
+
+
+# Fetches behind the views opened next, called with the pages' default
+# (empty) date filters and search so they share cache keys with the
+# real page run.
+SCHOOL_VIEWS = [
+    first_teacher_page,
+    fetch_school_activity_stats,
+    fetch_student_metrics,
+    fetch_study_material_stats,
+]
+
+# At most two schools' prefetches waiting at once
+MAX_QUEUED = 2 * len(SCHOOL_VIEWS)
+
+
+# --------------------------------------------------
+# BACKGROUND RUNNER
+# --------------------------------------------------
+def _run(fetch, supabase, school_id) -> None:
+    global _queued
+    try:
+        with request_priority(BACKGROUND):
+            fetch(supabase, school_id)
+    except Exception:
+        logger.debug("Prefetch of %s failed", fetch.__name__, exc_info=True)
+    finally:
+        with _lock:
+            _queued -= 1
+
+
+def prefetch_school(supabase, school_id) -> List:
+    """
+    Starts warming the likely next views for `school_id` and returns
+    immediately. Returns the submitted futures (empty if the school was
+    prefetched recently or the budget is exhausted).
+    """
+
+    global _queued
+
+    if not school_id:
+        return []
+
+    now = time.monotonic()
+
+    with _lock:
+        last = _last_prefetch.get(school_id)
+        if last is not None and now - last < PREFETCH_INTERVAL:
+            return []
+        if _queued + len(SCHOOL_VIEWS) > MAX_QUEUED:
+            return []
+
+        _last_prefetch[school_id] = now
+        _queued += len(SCHOOL_VIEWS)
+
+    return [
+        _pool.submit(_run, fetch, supabase, school_id)
+        for fetch in SCHOOL_VIEWS
+    ]
@@ -0,0 +1,310 @@
+'''
+Per-rerun profiling for the dashboard:
+1. profile_rerun
+2. run_profiled (fetch threads)
+3. ProfileSession
+
+Enabled with KIBU_PROFILE=1 or the `?profile=1` query parameter. The
+rerun is profiled with cProfile on the script thread and on every
+fetch thread it starts (FetchScope propagates the session), while a
+sampler thread records stacks for a flamegraph. The sidebar then
+shows time per fetch_* function, DataFrame construction and Plotly
+rendering, with .prof (pstats) and folded-stack downloads.
+
+When disabled, the only cost is one flag check per rerun and one
+context variable lookup per fetch.
+
+Only one rerun per process is profiled at a time; a rerun that starts
+while another is being profiled runs unprofiled. From Python 3.12
+cProfile is built on sys.monitoring, which allows one active profiler
+per process and sees every thread, so fetch threads get no profiler of
+their own there: the rerun's profiler already covers them (along with
+any other session's threads running meanwhile).
+'''
+import contextvars
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+PROFILE_ENV = os.getenv("KIBU_PROFILE", "0") == "1"
+PROFILE_QUERY_PARAM = "profile"
+
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+TOP_FUNCTIONS = 15
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Before 3.12 each thread needs its own cProfile.Profile; from 3.12 a
+# second enabled profiler raises ValueError
+PER_THREAD_PROFILERS = sys.version_info < (3, 12)
+
+# Held by the rerun being profiled
+_profiler_lock = threading.Lock()
+
+_session: contextvars.ContextVar = contextvars.ContextVar(
+    "profile_session", default=None
+)
+
+
+# --------------------------------------------------
+# SESSION
+# --------------------------------------------------
+class ProfileSession:
+    """
+    cProfile data and stack samples for one rerun, across threads.
+    """
+
+    def __init__(self):
+        self.profiles: List[cProfile.Profile] = []
+        self.samples: Counter = Counter()
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def track(self, profile: Optional[cProfile.Profile], role: str) -> None:
+        """
+        Registers the calling thread with the sampler, and its profiler
+        if it has one.
+        """
+        with self._lock:
+            if profile is not None:
+                self.profiles.append(profile)
+            self._threads[threading.get_ident()] = role
+
+    def untrack(self) -> None:
+        with self._lock:
+            self._threads.pop(threading.get_ident(), None)
+
+    # Sampling (flamegraph)
+    def start_sampler(self) -> None:
+        self._sampler = threading.Thread(
+            target=self._sample, name="profile-sampler", daemon=True
+        )
+        self._sampler.start()
+
+    def stop_sampler(self) -> None:
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def _sample(self) -> None:
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            with self._lock:
+                threads = dict(self._threads)
+
+            frames = sys._current_frames()
+
+            for ident, role in threads.items():
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                        f":{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(role)
+                self.samples[";".join(reversed(stack))] += 1
+
+    # Results
+    def stats(self) -> pstats.Stats:
+        stats = pstats.Stats(self.profiles[0], stream=io.StringIO())
+        for profile in self.profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def pstats_bytes(self) -> bytes:
+        """
+        The merged profile in the .prof format read by pstats / snakeviz.
+        """
+        return marshal.dumps(self.stats().stats)
+
+    def folded_stacks(self) -> str:
+        """
+        Stack samples in folded format (flamegraph.pl, speedscope).
+        """
+        return "\n".join(
+            f"{stack} {count}" for stack, count in self.samples.most_common()
+        )
+
+    def attribution(self) -> List[Dict]:
+        """
+        Cumulative seconds per fetch_* function, DataFrame construction
+        and Plotly rendering, summed over threads. Nested entries (a
+        fetch calling another fetch) overlap.
+        """
+
+        rows = []
+
+        for (filename, _, name), (_, ncalls, _, cumtime, _) in self.stats().stats.items():
+            category = _category(filename, name)
+            if category is None:
+                continue
+            label = name if category == "fetch" else category
+            rows.append({"section": label, "calls": ncalls, "seconds": cumtime})
+
+        totals: Dict[str, Dict] = {}
+        for row in rows:
+            total = totals.setdefault(
+                row["section"], {"section": row["section"], "calls": 0, "seconds": 0.0}
+            )
+            total["calls"] += row["calls"]
+            total["seconds"] += row["seconds"]
+
+        return sorted(totals.values(), key=lambda r: r["seconds"], reverse=True)
+
+    def top_functions(self, limit: int = TOP_FUNCTIONS) -> str:
+        stream = io.StringIO()
+        stats = self.stats()
+        stats.stream = stream
+        stats.sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+
+def _category(filename: str, name: str) -> Optional[str]:
+    path = filename.replace("\\", "/")
+
+    if name.startswith("fetch_") and filename.startswith(PROJECT_DIR):
+        return "fetch"
+    if path.endswith("pandas/core/frame.py") and name == "__init__":
+        return "DataFrame construction"
+    if path.endswith("plotly/graph_objs/_figure.py") and name == "__init__":
+        return "Plotly figure build"
+    if "/streamlit/" in path and name == "plotly_chart":
+        return "Plotly rendering (st.plotly_chart)"
+    return None
+
+
+# --------------------------------------------------
+# ENTRY POINTS
+# --------------------------------------------------
+def profiling_enabled() -> bool:
+    if PROFILE_ENV:
+        return True
+
+    import streamlit as st
+
+    try:
+        return st.query_params.get(PROFILE_QUERY_PARAM) == "1"
+    except Exception:
+        return False
+
+
+def run_profiled(fn: Callable, *args, **kwargs):
+    """
+    Runs a fetch on the current thread, profiled if its rerun is.
+    Called by FetchScope for every submitted fetch.
+    """
+
+    session: Optional[ProfileSession] = _session.get()
+
+    if session is None:
+        return fn(*args, **kwargs)
+
+    if not PER_THREAD_PROFILERS:
+        # Covered by the rerun's profiler; only sampled here
+        session.track(None, "fetch")
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            session.untrack()
+
+    profile = cProfile.Profile()
+    session.track(profile, "fetch")
+    profile.enable()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profile.disable()
+        session.untrack()
+
+
+def profile_rerun(main: Callable) -> None:
+    """
+    Runs `main()` and, when profiling is enabled, profiles it and
+    renders the results in the sidebar.
+    """
+
+    if not profiling_enabled():
+        main()
+        return
+
+    if not _profiler_lock.acquire(blocking=False):
+        main()
+        _render_profile_busy()
+        return
+
+    try:
+        session = ProfileSession()
+        token = _session.set(session)
+
+        profile = cProfile.Profile()
+        session.track(profile, "script")
+        session.start_sampler()
+        profile.enable()
+        try:
+            main()
+        finally:
+            profile.disable()
+            session.stop_sampler()
+            session.untrack()
+            _session.reset(token)
+    finally:
+        _profiler_lock.release()
+
+    render_profile_sidebar(session)
+
+
+def _render_profile_busy() -> None:
+    import streamlit as st
+
+    st.sidebar.caption(
+        "⏱ Another rerun is being profiled on this server; "
+        "this one was not. Rerun to try again."
+    )
+
+
+def render_profile_sidebar(session: ProfileSession) -> None:
+    import pandas as pd
+    import streamlit as st
+
+    with st.sidebar.expander("⏱ Profile of this run", expanded=False):
+        st.caption(f"Rerun took {session.elapsed:.2f} s")
+
+        attribution = session.attribution()
+        if attribution:
+            st.dataframe(
+                pd.DataFrame(attribution).round({"seconds": 3}),
+                hide_index=True,
+                use_container_width=True
+            )
+
+        st.download_button(
+            "Download pstats (.prof)",
+            session.pstats_bytes(),
+            file_name="dashboard_rerun.prof",
+            mime="application/octet-stream",
+            key="profile_pstats"
+        )
+        st.download_button(
+            "Download flamegraph (folded stacks)",
+            session.folded_stacks(),
+            file_name="dashboard_rerun.folded",
+            mime="text/plain",
+            key="profile_folded"
+        )
+
+        with st.popover("Top functions"):
+            st.code(session.top_functions(), language="text")
@@ -0,0 +1,262 @@
+'''
+Fast provisional estimates shown while exact metrics load:
+1. estimate_student_metrics
+2. wilson_interval / mean_interval / median_interval
+
+An estimate costs a planner-estimated session count (no table scan),
+the school's published activities (cached, and needed by the exact
+fetch anyway) and a sample of SAMPLE_SIZE sessions. PostgREST cannot
+order by random(), so the sample is SAMPLE_SEGMENTS short runs in `id`
+order starting at random offsets below the estimated total, fetched
+concurrently. Sampled sessions of unpublished activities are dropped,
+so every figure follows the exact definitions.
+
+Rates and times come from the sample with 95% confidence intervals.
+Counts are the estimated total times a sampled proportion; the total
+is the planner's estimate, not a measurement, so count ranges also
+allow PLANNER_ERROR either way and are labelled approximate. When the
+window holds no more than SAMPLE_SIZE sessions the sample is the whole
+window and the counts are exact. Pages render estimates as provisional
+and replace them when the exact fetch finishes.
+'''
+import contextvars
+import logging
+import math
+import random
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from records import SessionBatch
+from resilience import execute
+from student_metrics import METRIC_SESSION_COLUMNS, estimate_session_rows
+from students_database_fetch import (
+    COMPLETED_STATUSES,
+    _activity_sessions_query,
+    fetch_published_activities_by_school
+)
+
+SAMPLE_SIZE = 500
+SAMPLE_SEGMENTS = 10
+Z_95 = 1.96
+
+# Relative error allowed for the planner's row estimate (statistics
+# refreshed by autovacuum are usually well within this)
+PLANNER_ERROR = 0.2
+
+# Metrics whose range includes the planner's error
+COUNT_METRICS = ("attempted_sessions", "completed_sessions", "ongoing_sessions")
+
+logger = logging.getLogger(__name__)
+
+
+# --------------------------------------------------
+# UTILITY: CONFIDENCE INTERVALS
+# --------------------------------------------------
+def wilson_interval(successes: int, n: int, z: float = Z_95) -> Tuple[float, float]:
+    """
+    Wilson score interval for a proportion, as fractions (0..1).
+    """
+
+    if n == 0:
+        return 0.0, 1.0
+
+    p = successes / n
+    denominator = 1 + z ** 2 / n
+    center = (p + z ** 2 / (2 * n)) / denominator
+    half = z * math.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denominator
+
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def mean_interval(values: List[float], z: float = Z_95) -> Tuple[float, float]:
+    if len(values) < 2:
+        return (values[0], values[0]) if values else (0.0, 0.0)
+
+    mean = statistics.mean(values)
+    half = z * statistics.stdev(values) / math.sqrt(len(values))
+
+    return max(0.0, mean - half), mean + half
+
+
+def median_interval(values: List[float], z: float = Z_95) -> Tuple[float, float]:
+    """
+    Distribution-free interval from order statistics around n / 2.
+    """
+
+    if not values:
+        return 0.0, 0.0
+
+    ordered = sorted(values)
+    n = len(ordered)
+    half = z * math.sqrt(n) / 2
+
+    low = max(0, math.floor(n / 2 - half))
+    high = min(n - 1, math.ceil(n / 2 + half) - 1)
+
+    return ordered[low], ordered[high]
+
+
+# --------------------------------------------------
+# SAMPLING
+# --------------------------------------------------
+def _sample_sessions(
+    supabase,
+    school_id,
+    start_date: Optional[date],
+    end_date: Optional[date],
+    total: int,
+    sample_size: int
+) -> Tuple[List[Dict], bool]:
+    """
+    Sessions of the window (any activity): all of them if there are at
+    most `sample_size`, otherwise SAMPLE_SEGMENTS runs at random
+    offsets. Returns (rows, exhaustive).
+    """
+
+    def query():
+        return _activity_sessions_query(
+            supabase,
+            school_id,
+            start_date=start_date,
+            end_date=end_date,
+            columns="id, " + METRIC_SESSION_COLUMNS
+        ).order("id")
+
+    if total <= sample_size:
+        rows = execute(query().limit(sample_size + 1)).data or []
+        if len(rows) <= sample_size:
+            return rows, True
+        # The planner underestimated; sample like a large window
+        total = max(total, 2 * sample_size)
+
+    segment = max(1, sample_size // SAMPLE_SEGMENTS)
+    offsets = random.sample(
+        range(max(1, total - segment + 1)),
+        min(SAMPLE_SEGMENTS, max(1, total - segment + 1))
+    )
+
+    # Each segment runs in a copy of the caller's context, so it keeps
+    # the caller's request priority and cancellation scope
+    with ThreadPoolExecutor(max_workers=len(offsets)) as pool:
+        futures = [
+            pool.submit(
+                contextvars.copy_context().run,
+                lambda o=offset: execute(query().range(o, o + segment - 1)).data or []
+            )
+            for offset in offsets
+        ]
+        segments = [f.result() for f in futures]
+
+    # Overlapping segments return some sessions twice
+    rows = {}
+    for segment_rows in segments:
+        for row in segment_rows:
+            rows[row["id"]] = row
+
+    return list(rows.values()), False
+
+
+def _count_estimate(
+    total: int,
+    matches: int,
+    n: int,
+    exhaustive: bool
+) -> Tuple[float, Tuple[float, float]]:
+    """
+    Estimated count of sessions like `matches` of the `n` sampled, and
+    its range: the proportion's Wilson interval times the total allowed
+    PLANNER_ERROR either way. Exact for an exhaustive sample.
+    """
+
+    if exhaustive or not n:
+        return matches, (matches, matches)
+
+    low, high = wilson_interval(matches, n)
+
+    return total * matches / n, (
+        total * (1 - PLANNER_ERROR) * low,
+        total * (1 + PLANNER_ERROR) * high,
+    )
+
+
+# --------------------------------------------------
+# STUDENT METRIC ESTIMATES
+# --------------------------------------------------
+def estimate_student_metrics(
+    supabase,
+    school_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    sample_size: int = SAMPLE_SIZE
+) -> Optional[Dict]:
+    """
+    Provisional values for the student_metrics keys, plus
+    "intervals" {metric: (low, high)}, "approximate" (the metrics whose
+    range rests on the planner's estimate; empty when the sample is the
+    whole window) and "sample_size". Returns None if the estimate could
+    not be made; callers then just wait.
+    """
+
+    try:
+        total = estimate_session_rows(supabase, school_id, start_date, end_date)
+
+        published_ids = {
+            a["id"] for a in fetch_published_activities_by_school(
+                supabase, school_id, start_date, end_date
+            )
+        }
+
+        rows, exhaustive = _sample_sessions(
+            supabase, school_id, start_date, end_date, total, sample_size
+        )
+    except Exception:
+        logger.debug("Student metrics estimate failed", exc_info=True)
+        return None
+
+    n = len(rows)
+
+    sample = SessionBatch.from_rows(
+        row for row in rows if row.get("activity_id") in published_ids
+    )
+
+    attempted = len(sample)
+    completed = sample.count_status(*COMPLETED_STATUSES)
+    durations = sample.durations(*COMPLETED_STATUSES)
+
+    attempted_estimate, attempted_range = _count_estimate(
+        total, attempted, n, exhaustive
+    )
+    completed_estimate, completed_range = _count_estimate(
+        total, completed, n, exhaustive
+    )
+    ongoing_estimate, ongoing_range = _count_estimate(
+        total, attempted - completed, n, exhaustive
+    )
+
+    rate = completed / attempted if attempted else 0.0
+    rate_low, rate_high = (
+        (rate, rate) if exhaustive else wilson_interval(completed, attempted)
+    )
+
+    return {
+        "published_activities": len(published_ids),
+        "attempted_sessions": attempted_estimate,
+        "completed_sessions": completed_estimate,
+        "ongoing_sessions": ongoing_estimate,
+        "completion_rate": rate * 100,
+        "mean_time_spent": statistics.mean(durations) if durations else 0,
+        "median_time_spent": statistics.median(durations) if durations else 0,
+        "intervals": {
+            "published_activities": (len(published_ids), len(published_ids)),
+            "attempted_sessions": attempted_range,
+            "completed_sessions": completed_range,
+            "ongoing_sessions": ongoing_range,
+            "completion_rate": (rate_low * 100, rate_high * 100),
+            "mean_time_spent": mean_interval(durations),
+            "median_time_spent": median_interval(durations),
+        },
+        "approximate": () if exhaustive else COUNT_METRICS,
+        "sample_size": attempted,
+    }
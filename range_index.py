@@ -0,0 +1,602 @@
+'''
+In-memory per-school index over daily buckets, answering any date
+window without a backend call:
+1. get_range_index (process-wide, built in the background)
+2. RangeIndex.activity_stats / student_metrics / study_material_stats
+3. build_range_index
+
+The pages filter with `gte(created_at, start)` / `lte(created_at, end)`
+on timestamps, so a row passes exactly when start <= lower and
+upper <= end for its day span (lower, upper): lower is its day, and
+upper is the same day for a row at midnight and the next day
+otherwise (`lte` compares with midnight of the end day). Rows without
+a timestamp only pass unfiltered queries.
+
+Activities and tool runs have one span each, so their sums live in
+prefix-sum arrays over the days, one per span width, and a window
+is two binary searches. Activities per teacher are counted per
+(day, teacher) pair instead, and a window adds up the pairs between
+the two searches, so memory follows the pairs, not days x teachers. A session only counts while its published
+activity also falls in the window, so its span covers both
+timestamps; session sums live in a summed-area table over the
+(lower, upper) days, which is again two binary searches and a lookup.
+Medians come from an exact selection over the school's completed
+durations held as arrays, so they match every other backend.
+
+Indexes expire after RANGE_INDEX_TTL seconds, like the fetch caches.
+Schools with more than RANGE_INDEX_MAX_ROWS sessions (planner
+estimate) are not indexed, and sessions over their memory budget
+(`prefer_streaming()`) never start a build; both keep using the
+regular fetches.
+
+Environment:
+    KIBU_RANGE_INDEX_TTL        seconds an index is used (default 300)
+    KIBU_RANGE_INDEX_MAX_ROWS   largest school indexed, in sessions
+                                (default 200000)
+'''
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from datetime import time as day_time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from concurrency_governor import BACKGROUND, request_priority
+from database_utils import iter_query_pages
+from memory_accounting import prefer_streaming
+from records import session_duration_minutes
+from student_metrics import (
+    METRIC_SESSION_COLUMNS,
+    _metrics,
+    _mirror_connect,
+    estimate_session_rows,
+    mirror_is_fresh
+)
+from students_database_fetch import (
+    COMPLETED_STATUSES,
+    fetch_published_activity_ids,
+    iter_activity_sessions
+)
+from study_materials_database_fetch import iter_tool_runs
+from teachers_database_fetch import _school_activities_query
+
+RANGE_INDEX_TTL = float(os.getenv("KIBU_RANGE_INDEX_TTL", "300"))
+RANGE_INDEX_MAX_ROWS = int(os.getenv("KIBU_RANGE_INDEX_MAX_ROWS", "200000"))
+RANGE_INDEX_CACHE_SIZE = 8
+BUILD_WORKERS = 2
+
+# Summed-area tables above this many (lower, upper) cells fall back to
+# masked sums over the session arrays
+MAX_GRID_CELLS = 250_000
+
+# Spans of rows without a timestamp: never inside a bounded window
+NULL_LOWER = -1
+NULL_UPPER = 10 ** 7
+
+TOOL_RUN_INDEX_COLUMNS = "kind,status,created_at"
+SESSION_SUMS = ["attempted", "completed", "timed", "minutes"]
+
+logger = logging.getLogger(__name__)
+
+
+# --------------------------------------------------
+# UTILITY: DAY SPANS
+# --------------------------------------------------
+def day_span(raw: Optional[str]) -> Tuple[int, int]:
+    """
+    (lower, upper) day ordinals of a timestamp (see the module docstring).
+    """
+
+    if not raw:
+        return NULL_LOWER, NULL_UPPER
+
+    try:
+        ts = datetime.fromisoformat(raw)
+    except ValueError:
+        return NULL_LOWER, NULL_UPPER
+
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc)
+
+    day = ts.date().toordinal()
+    return day, day if ts.time() == day_time(0) else day + 1
+
+
+def window_bounds(start_date: Optional[date], end_date: Optional[date]) -> Tuple[int, int]:
+    return (
+        start_date.toordinal() if start_date else NULL_LOWER,
+        end_date.toordinal() if end_date else NULL_UPPER,
+    )
+
+
+# --------------------------------------------------
+# WINDOW SUMS
+# --------------------------------------------------
+class DaySums:
+    """
+    Sums of per-row value vectors over the rows whose span lies in a
+    window, for rows with few distinct span widths. Per width, a
+    prefix-sum array over the lower days.
+    """
+
+    def __init__(self, lower: np.ndarray, upper: np.ndarray, values: np.ndarray):
+        self.width = values.shape[1]
+        self.groups: List[Tuple[int, np.ndarray, np.ndarray]] = []
+
+        null = lower == NULL_LOWER
+        self.unbounded = values[null].sum(axis=0)
+
+        spans = upper[~null] - lower[~null]
+        for span in np.unique(spans).tolist():
+            rows = ~null
+            rows[rows] = spans == span
+
+            days, inverse = np.unique(lower[rows], return_inverse=True)
+            sums = np.zeros((len(days), self.width), dtype=values.dtype)
+            np.add.at(sums, inverse, values[rows])
+
+            self.groups.append((span, days, np.cumsum(sums, axis=0)))
+
+    def window(self, start: int, end: int) -> np.ndarray:
+        if (start, end) == (NULL_LOWER, NULL_UPPER):
+            total = self.unbounded.copy()
+        else:
+            total = np.zeros_like(self.unbounded)
+
+        for span, days, prefix in self.groups:
+            # start <= lower <= end - span
+            first = np.searchsorted(days, start, side="left")
+            last = np.searchsorted(days, end - span, side="right")
+            if last > first:
+                total += prefix[last - 1] - (prefix[first - 1] if first else 0)
+
+        return total
+
+
+class KeyedDaySums:
+    """
+    Counts per key (a teacher) of the rows whose span lies in a window,
+    for rows with few distinct span widths. Per width, the (lower day,
+    key) pairs in day order with their row counts.
+    """
+
+    def __init__(self, lower: np.ndarray, upper: np.ndarray, keys: np.ndarray, size: int):
+        self.size = size
+        self.groups: List[Tuple[int, np.ndarray, np.ndarray, np.ndarray]] = []
+
+        null = lower == NULL_LOWER
+        self.unbounded = np.bincount(keys[null], minlength=size)
+
+        spans = upper[~null] - lower[~null]
+        for span in np.unique(spans).tolist():
+            rows = ~null
+            rows[rows] = spans == span
+
+            pairs, counts = np.unique(
+                np.stack([lower[rows], keys[rows]], axis=1),
+                axis=0,
+                return_counts=True
+            )
+            self.groups.append((span, pairs[:, 0], pairs[:, 1], counts))
+
+    def window(self, start: int, end: int) -> np.ndarray:
+        if (start, end) == (NULL_LOWER, NULL_UPPER):
+            total = self.unbounded.copy()
+        else:
+            total = np.zeros(self.size, dtype=np.int64)
+
+        for span, days, keys, counts in self.groups:
+            # start <= lower <= end - span
+            first = np.searchsorted(days, start, side="left")
+            last = np.searchsorted(days, end - span, side="right")
+            if last > first:
+                np.add.at(total, keys[first:last], counts[first:last])
+
+        return total
+
+
+class SpanSums:
+    """
+    Sums of per-row value vectors over the rows whose span lies in a
+    window, for arbitrary spans: a summed-area table over the distinct
+    (lower, upper) days, suffix-summed over lower and prefix-summed
+    over upper.
+    """
+
+    def __init__(self, lower: np.ndarray, upper: np.ndarray, values: np.ndarray):
+        self.lower = lower
+        self.upper = upper
+        self.values = values
+        self.lowers = np.unique(lower)
+        self.uppers = np.unique(upper)
+        self.grid = None
+
+        if len(self.lowers) * len(self.uppers) <= MAX_GRID_CELLS:
+            grid = np.zeros(
+                (len(self.lowers), len(self.uppers), values.shape[1]),
+                dtype=values.dtype
+            )
+            np.add.at(
+                grid,
+                (
+                    np.searchsorted(self.lowers, lower),
+                    np.searchsorted(self.uppers, upper)
+                ),
+                values
+            )
+            grid = np.cumsum(grid[::-1], axis=0)[::-1]
+            self.grid = np.cumsum(grid, axis=1)
+
+    def window(self, start: int, end: int) -> np.ndarray:
+        if self.grid is None:
+            inside = (self.lower >= start) & (self.upper <= end)
+            return self.values[inside].sum(axis=0)
+
+        i = np.searchsorted(self.lowers, start, side="left")
+        j = np.searchsorted(self.uppers, end, side="right") - 1
+
+        if i >= len(self.lowers) or j < 0:
+            return np.zeros(self.values.shape[1], dtype=self.values.dtype)
+
+        return self.grid[i, j]
+
+
+# --------------------------------------------------
+# INDEX
+# --------------------------------------------------
+class RangeIndex:
+    """
+    One school's activities, sessions and tool runs, aggregated for
+    window queries. Methods return the same shapes as the matching
+    fetch functions.
+    """
+
+    def __init__(
+        self,
+        school_id,
+        teacher_ids: List,
+        published_sums: DaySums,
+        teacher_activity_sums: KeyedDaySums,
+        session_sums: SpanSums,
+        completed_lower: np.ndarray,
+        completed_upper: np.ndarray,
+        completed_minutes: np.ndarray,
+        tool_run_sums: DaySums
+    ):
+        self.school_id = school_id
+        self.teacher_ids = teacher_ids
+        self.published_sums = published_sums
+        self.teacher_activity_sums = teacher_activity_sums
+        self.session_sums = session_sums
+        self.completed_lower = completed_lower
+        self.completed_upper = completed_upper
+        self.completed_minutes = completed_minutes
+        self.tool_run_sums = tool_run_sums
+        self.built_at = time.time()
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() - self.built_at <= RANGE_INDEX_TTL
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes held in arrays (read by memory_accounting.estimate_size).
+        """
+
+        arrays = [
+            self.session_sums.lower,
+            self.session_sums.upper,
+            self.session_sums.values,
+            self.completed_lower,
+            self.completed_upper,
+            self.completed_minutes,
+        ]
+        if self.session_sums.grid is not None:
+            arrays.append(self.session_sums.grid)
+        for sums in (self.published_sums, self.tool_run_sums):
+            for _, days, prefix in sums.groups:
+                arrays.extend([days, prefix])
+        for _, days, keys, counts in self.teacher_activity_sums.groups:
+            arrays.extend([days, keys, counts])
+
+        return sum(a.nbytes for a in arrays)
+
+    def activity_stats(self, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Dict:
+        """
+        As fetch_school_activity_stats.
+        """
+
+        sums = self.teacher_activity_sums.window(*window_bounds(start_date, end_date))
+        counts = sorted(int(c) for c in sums if c)
+
+        if not counts:
+            return {
+                "total_activities": 0,
+                "median_activities_per_teacher": 0
+            }
+
+        n = len(counts)
+        if n % 2 == 1:
+            median = counts[n // 2]
+        else:
+            median = (counts[n // 2 - 1] + counts[n // 2]) / 2
+
+        return {
+            "total_activities": sum(counts),
+            "median_activities_per_teacher": median
+        }
+
+    def student_metrics(self, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Dict:
+        """
+        As fetch_student_metrics, with backend "index".
+        """
+
+        start, end = window_bounds(start_date, end_date)
+
+        published = int(self.published_sums.window(start, end)[0])
+        attempted, completed, timed, minutes = self.session_sums.window(start, end)
+
+        inside = (self.completed_lower >= start) & (self.completed_upper <= end)
+        durations = self.completed_minutes[inside]
+
+        metrics = _metrics(
+            published,
+            int(attempted),
+            int(completed),
+            float(minutes / timed) if timed else 0,
+            float(np.median(durations)) if len(durations) else 0
+        )
+        metrics["backend"] = "index"
+
+        return metrics
+
+    def school_student_stats(self, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Dict:
+        """
+        As fetch_school_student_stats.
+        """
+
+        metrics = self.student_metrics(start_date, end_date)
+
+        return {
+            "total_activities_posted": metrics["published_activities"],
+            "total_sessions_attempted": metrics["attempted_sessions"],
+            "completion_rate": metrics["completion_rate"],
+            "mean_time_spent": metrics["mean_time_spent"],
+            "median_time_spent": metrics["median_time_spent"]
+        }
+
+    def study_material_stats(self, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Dict:
+        """
+        As fetch_study_material_stats.
+        """
+
+        total_runs, flashcards_count, quiz_count, failed_runs = (
+            int(n) for n in self.tool_run_sums.window(*window_bounds(start_date, end_date))
+        )
+
+        return {
+            "flashcards_count": flashcards_count,
+            "quiz_count": quiz_count,
+            "total_runs": total_runs,
+            "failed_runs": failed_runs,
+            "failure_percentage": (
+                (failed_runs / total_runs) * 100 if total_runs > 0 else 0
+            ),
+        }
+
+
+# --------------------------------------------------
+# BUILD
+# --------------------------------------------------
+def _spans(raw_values) -> Tuple[np.ndarray, np.ndarray]:
+    spans = [day_span(raw) for raw in raw_values]
+    return (
+        np.array([s[0] for s in spans], dtype=np.int64),
+        np.array([s[1] for s in spans], dtype=np.int64),
+    )
+
+
+def _session_rows(supabase, school_id):
+    """
+    The school's sessions, from the local mirror when it is fresh.
+    """
+
+    if mirror_is_fresh(school_id):
+        with _mirror_connect() as conn:
+            rows = conn.execute(
+                "SELECT activity_id, status, start_time, end_time, created_at "
+                "FROM activity_sessions WHERE school_id = ?",
+                (str(school_id),)
+            ).fetchall()
+        columns = ["activity_id", "status", "start_time", "end_time", "created_at"]
+        yield [dict(zip(columns, row)) for row in rows]
+        return
+
+    yield from iter_activity_sessions(
+        supabase, school_id, columns=METRIC_SESSION_COLUMNS
+    )
+
+
+def build_range_index(supabase, school_id) -> RangeIndex:
+    """
+    Fetches the school's activities, sessions and tool runs once and
+    aggregates them into a RangeIndex.
+    """
+
+    # Activities: published flag and creator
+    activities = []
+    for rows in iter_query_pages(
+        lambda: _school_activities_query(
+            supabase, school_id, columns="id, creator_id, created_at"
+        ).order("id")
+    ):
+        activities.extend(rows)
+
+    published_ids = fetch_published_activity_ids(
+        supabase, [a["id"] for a in activities]
+    )
+
+    teacher_ids = sorted({a["creator_id"] for a in activities}, key=str)
+    teacher_index = {t: i for i, t in enumerate(teacher_ids)}
+
+    activity_lower, activity_upper = _spans(a.get("created_at") for a in activities)
+    activity_published = np.array(
+        [a["id"] in published_ids for a in activities], dtype=np.int64
+    ).reshape(-1, 1)
+    activity_teachers = np.array(
+        [teacher_index[a["creator_id"]] for a in activities], dtype=np.int64
+    )
+
+    # Keyed by str: the mirror stores ids as text
+    published_spans = {
+        str(a["id"]): (int(lower), int(upper))
+        for a, lower, upper in zip(activities, activity_lower, activity_upper)
+        if a["id"] in published_ids
+    }
+
+    # Sessions of published activities: the span covers both timestamps
+    session_lower, session_upper, session_values = [], [], []
+    completed_lower, completed_upper, completed_minutes = [], [], []
+
+    for rows in _session_rows(supabase, school_id):
+        for row in rows:
+            activity_span = published_spans.get(str(row.get("activity_id")))
+            if activity_span is None:
+                continue
+
+            lower, upper = day_span(row.get("created_at"))
+            lower = min(lower, activity_span[0])
+            upper = max(upper, activity_span[1])
+
+            completed = row.get("status") in COMPLETED_STATUSES
+            minutes = (
+                session_duration_minutes(
+                    row.get("start_time"), row.get("end_time"), row.get("created_at")
+                )
+                if completed else None
+            )
+
+            session_lower.append(lower)
+            session_upper.append(upper)
+            session_values.append(
+                (1, int(completed), int(minutes is not None), minutes or 0.0)
+            )
+
+            if minutes is not None:
+                completed_lower.append(lower)
+                completed_upper.append(upper)
+                completed_minutes.append(minutes)
+
+    session_sums = SpanSums(
+        np.array(session_lower, dtype=np.int64),
+        np.array(session_upper, dtype=np.int64),
+        np.array(session_values, dtype=float).reshape(-1, len(SESSION_SUMS))
+    )
+
+    # Tool runs: total, flashcards, quiz, failed
+    run_raw, run_values = [], []
+    for rows in iter_tool_runs(supabase, school_id, columns=TOOL_RUN_INDEX_COLUMNS):
+        for row in rows:
+            run_raw.append(row.get("created_at"))
+            run_values.append((
+                1,
+                int(row.get("kind") == "flashcards"),
+                int(row.get("kind") == "quiz"),
+                int(row.get("status") == "failed"),
+            ))
+
+    run_lower, run_upper = _spans(run_raw)
+
+    return RangeIndex(
+        school_id,
+        teacher_ids,
+        DaySums(activity_lower, activity_upper, activity_published),
+        KeyedDaySums(activity_lower, activity_upper, activity_teachers, len(teacher_ids)),
+        session_sums,
+        np.array(completed_lower, dtype=np.int64),
+        np.array(completed_upper, dtype=np.int64),
+        np.array(completed_minutes, dtype=float),
+        DaySums(run_lower, run_upper, np.array(run_values, dtype=np.int64).reshape(-1, 4))
+    )
+
+
+# --------------------------------------------------
+# PROCESS-WIDE CACHE
+# --------------------------------------------------
+_pool = ThreadPoolExecutor(max_workers=BUILD_WORKERS, thread_name_prefix="range-index")
+_lock = threading.Lock()
+_indexes: "OrderedDict[str, RangeIndex]" = OrderedDict()
+_building: Dict[str, Future] = {}
+
+# Schools found too large to index, with the time they were checked
+_too_large: Dict[str, float] = {}
+
+
+def _build(supabase, school_id) -> None:
+    try:
+        with request_priority(BACKGROUND):
+            rows = estimate_session_rows(supabase, school_id)
+            if rows > RANGE_INDEX_MAX_ROWS:
+                logger.debug(
+                    "Not indexing %s: about %d sessions", school_id, rows
+                )
+                with _lock:
+                    _too_large[str(school_id)] = time.time()
+                return
+
+            index = build_range_index(supabase, school_id)
+    except Exception:
+        logger.debug("Range index build for %s failed", school_id, exc_info=True)
+        return
+    finally:
+        with _lock:
+            _building.pop(str(school_id), None)
+
+    with _lock:
+        _indexes[str(school_id)] = index
+        _indexes.move_to_end(str(school_id))
+        while len(_indexes) > RANGE_INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+
+
+def get_range_index(supabase, school_id, build: bool = True) -> Optional[RangeIndex]:
+    """
+    The school's index if one is ready and fresh. Otherwise returns
+    None and (with `build`) starts building it in the background, so
+    later reruns answer from memory. No build starts for a session
+    over its memory budget or for a school recently found too large.
+    """
+
+    if not school_id:
+        return None
+
+    key = str(school_id)
+
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None and index.fresh:
+            _indexes.move_to_end(key)
+            return index
+
+        if not build or key in _building or prefer_streaming():
+            return None
+
+        checked_at = _too_large.get(key)
+        if checked_at is not None and time.time() - checked_at <= RANGE_INDEX_TTL:
+            return None
+
+        _building[key] = _pool.submit(_build, supabase, school_id)
+
+    return None
+
+
+def clear_range_indexes() -> None:
+    with _lock:
+        _indexes.clear()
+        _too_large.clear()
@@ -0,0 +1,208 @@
+'''
+Compact typed containers for rows fetched from Supabase:
+1. SessionBatch (columnar)
+2. session_duration_minutes / parse_timestamp
+
+'''
+from array import array
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+# Status codes stored in SessionBatch.status_codes
+SESSION_STATUSES = ("completed", "active", "failed", "abandoned")
+_UNKNOWN_STATUS = -1
+
+NAN = float("nan")
+
+
+# --------------------------------------------------
+# UTILITY: TIME PARSING
+# --------------------------------------------------
+def parse_timestamp(raw: Optional[str]) -> Optional[datetime]:
+    if not raw:
+        return None
+
+    try:
+        return datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def session_duration_minutes(
+    start_raw: Optional[str],
+    end_raw: Optional[str],
+    created_raw: Optional[str]
+) -> Optional[float]:
+    """
+    Duration of a session in minutes.
+
+    `start_time` / `end_time` are time-only fields; the date comes
+    from `created_at`. Returns None if any field is missing or invalid.
+    """
+
+    if not start_raw or not end_raw or not created_raw:
+        return None
+
+    created_dt = parse_timestamp(created_raw)
+    if created_dt is None:
+        return None
+
+    try:
+        start_t = time.fromisoformat(start_raw)
+        end_t = time.fromisoformat(end_raw)
+    except ValueError:
+        return None
+
+    base_date = created_dt.date()
+    start_dt = datetime.combine(base_date, start_t)
+    end_dt = datetime.combine(base_date, end_t)
+
+    # Handle cross-midnight sessions (rare but possible)
+    if end_dt < start_dt:
+        end_dt += timedelta(days=1)
+
+    return (end_dt - start_dt).total_seconds() / 60
+
+
+def _start_hour(start_raw: Optional[str], fallback: int) -> int:
+    if not start_raw:
+        return fallback
+
+    try:
+        return time.fromisoformat(start_raw).hour
+    except ValueError:
+        return fallback
+
+
+# --------------------------------------------------
+# COLUMNAR SESSION BATCH
+# --------------------------------------------------
+class SessionBatch:
+    """
+    Struct-of-arrays container for activity sessions.
+
+    Each session costs a few bytes per column instead of a dict of
+    strings. Durations are parsed once on the way in (NaN when
+    unknown), and activity ids are interned into `activity_ids`.
+    `weekday` and `hour` place the session in the week (UTC, -1 when
+    unknown): the weekday of `created_at`, and the hour of
+    `start_time`, or of `created_at` when `start_time` is missing.
+    """
+
+    __slots__ = (
+        "activity_ids",
+        "_activity_lookup",
+        "activity_index",
+        "status_codes",
+        "created_ordinal",
+        "duration_minutes",
+        "weekday",
+        "hour",
+    )
+
+    def __init__(self):
+        self.activity_ids: List = []
+        self._activity_lookup: Dict = {}
+        self.activity_index = array("I")
+        self.status_codes = array("b")
+        self.created_ordinal = array("i")
+        self.duration_minutes = array("d")
+        self.weekday = array("b")
+        self.hour = array("b")
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict]) -> "SessionBatch":
+        batch = cls()
+        batch.extend(rows)
+        return batch
+
+    def extend(self, rows: Iterable[Dict]) -> None:
+        """
+        Appends response rows (as returned by the sessions query).
+        """
+        lookup = self._activity_lookup
+
+        for row in rows:
+            activity_id = row.get("activity_id")
+            index = lookup.get(activity_id)
+            if index is None:
+                index = len(self.activity_ids)
+                lookup[activity_id] = index
+                self.activity_ids.append(activity_id)
+
+            status = row.get("status")
+            status_code = (
+                SESSION_STATUSES.index(status)
+                if status in SESSION_STATUSES
+                else _UNKNOWN_STATUS
+            )
+
+            created_raw = row.get("created_at")
+            created_dt = parse_timestamp(created_raw)
+
+            duration = session_duration_minutes(
+                row.get("start_time"), row.get("end_time"), created_raw
+            )
+
+            self.activity_index.append(index)
+            self.status_codes.append(status_code)
+            self.created_ordinal.append(
+                created_dt.date().toordinal() if created_dt else 0
+            )
+            self.duration_minutes.append(
+                duration if duration is not None else NAN
+            )
+
+            if created_dt is None:
+                self.weekday.append(-1)
+                self.hour.append(-1)
+            else:
+                utc = (
+                    created_dt.astimezone(timezone.utc)
+                    if created_dt.tzinfo is not None else created_dt
+                )
+                self.weekday.append(utc.weekday())
+                self.hour.append(_start_hour(row.get("start_time"), utc.hour))
+
+    def __len__(self) -> int:
+        return len(self.activity_index)
+
+    def count_status(self, *statuses: str) -> int:
+        codes = {SESSION_STATUSES.index(s) for s in statuses}
+        return sum(1 for c in self.status_codes if c in codes)
+
+    def durations(self, *statuses: str) -> List[float]:
+        """
+        Known session durations in minutes (NaN entries dropped),
+        optionally only for sessions with one of `statuses`.
+        """
+        if not statuses:
+            return [d for d in self.duration_minutes if d == d]
+
+        codes = {SESSION_STATUSES.index(s) for s in statuses}
+        return [
+            d for d, c in zip(self.duration_minutes, self.status_codes)
+            if d == d and c in codes
+        ]
+
+    def created_dates(self) -> List[Optional[date]]:
+        return [
+            date.fromordinal(o) if o else None
+            for o in self.created_ordinal
+        ]
+
+    def nbytes(self) -> int:
+        """
+        Approximate bytes held by the column arrays.
+        """
+        return sum(
+            a.itemsize * len(a)
+            for a in (
+                self.activity_index,
+                self.status_codes,
+                self.created_ordinal,
+                self.duration_minutes,
+                self.weekday,
+                self.hour,
+            )
+        )
@@ -0,0 +1,525 @@
+'''
+Regional and board rollups of teacher, student and study-tool KPIs:
+1. fetch_school_directory
+2. fetch_school_partials
+3. fetch_regional_rollups
+
+Each school is reduced to a RollupPartial: additive counts plus
+quantile sketches for the medians. Partials for many schools are
+computed together (never a request per school), cached per school, and
+merged upward school -> city -> state -> country, and school -> board.
+Medians at every level come from merged sketches, so they are
+approximate within sketches.DEFAULT_RELATIVE_ACCURACY; every other KPI
+is exact.
+
+Partials are grouped on the server by three RPCs taking a list of
+school ids, so a few rows per school come back instead of every
+session and tool run:
+    get_school_rollup_counts               school_id + PARTIAL_COUNT_FIELDS
+    get_activity_counts_by_school_creator  school_id, creator_id, count
+    get_completed_minutes_by_school        school_id, minutes, count
+Where they are not deployed, the rows are streamed and grouped here.
+'''
+from dataclasses import dataclass, field, fields
+from datetime import date
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from database_utils import iter_query_pages, try_rpc
+from persistent_cache import CACHE_DISABLED, cache_key, disk_cached, get_cache
+from sketches import QuantileSketch
+from student_distributions import session_durations
+from students_database_fetch import (
+    COMPLETED_STATUSES,
+    fetch_published_activity_ids,
+    id_chunks
+)
+
+PARTIAL_TTL = 300  # seconds
+
+PARTIAL_COUNTS_RPC = "get_school_rollup_counts"
+ACTIVITIES_PER_TEACHER_RPC = "get_activity_counts_by_school_creator"
+COMPLETED_MINUTES_RPC = "get_completed_minutes_by_school"
+
+# Additive RollupPartial fields returned by PARTIAL_COUNTS_RPC
+PARTIAL_COUNT_FIELDS = (
+    "teachers",
+    "activities",
+    "published_activities",
+    "sessions_attempted",
+    "sessions_completed",
+    "total_runs",
+    "flashcards_count",
+    "quiz_count",
+    "failed_runs",
+)
+
+# Set once the grouping RPCs turn out not to be deployed
+_grouped_rpcs_missing = False
+
+UNKNOWN_REGION = "Unknown"
+
+# Grouping columns per level; each level merges the one before it
+REGION_LEVELS = {
+    "school": ["country", "state", "city", "school_id", "school_name"],
+    "city": ["country", "state", "city"],
+    "state": ["country", "state"],
+    "country": ["country"],
+}
+BOARD_LEVEL = ["board_id"]
+
+ROLLUP_METRICS = [
+    "schools",
+    "teachers",
+    "total_activities",
+    "median_activities_per_teacher",
+    "published_activities",
+    "sessions_attempted",
+    "sessions_completed",
+    "completion_rate",
+    "mean_time_spent",
+    "median_time_spent",
+    "total_runs",
+    "flashcards_count",
+    "quiz_count",
+    "failed_runs",
+    "failure_percentage",
+]
+
+
+# --------------------------------------------------
+# PARTIAL AGGREGATES
+# --------------------------------------------------
+@dataclass(slots=True)
+class RollupPartial:
+    """
+    Mergeable KPI state for one school or a group of schools.
+    """
+
+    schools: int = 0
+    teachers: int = 0
+    activities: int = 0
+    published_activities: int = 0
+    sessions_attempted: int = 0
+    sessions_completed: int = 0
+    total_runs: int = 0
+    flashcards_count: int = 0
+    quiz_count: int = 0
+    failed_runs: int = 0
+    activities_per_teacher: QuantileSketch = field(default_factory=QuantileSketch)
+    completed_minutes: QuantileSketch = field(default_factory=QuantileSketch)
+
+    def merge(self, other: "RollupPartial") -> "RollupPartial":
+        merged = {}
+        for f in fields(self):
+            a, b = getattr(self, f.name), getattr(other, f.name)
+            merged[f.name] = a.merge(b) if isinstance(a, QuantileSketch) else a + b
+        return RollupPartial(**merged)
+
+    def metrics(self) -> Dict:
+        """
+        KPIs with the same definitions as the single-school views.
+        """
+        return {
+            "schools": self.schools,
+            "teachers": self.teachers,
+            "total_activities": self.activities,
+            "median_activities_per_teacher": self.activities_per_teacher.median(),
+            "published_activities": self.published_activities,
+            "sessions_attempted": self.sessions_attempted,
+            "sessions_completed": self.sessions_completed,
+            "completion_rate": (
+                self.sessions_completed / self.sessions_attempted * 100
+                if self.sessions_attempted else 0
+            ),
+            "mean_time_spent": self.completed_minutes.mean(),
+            "median_time_spent": self.completed_minutes.median(),
+            "total_runs": self.total_runs,
+            "flashcards_count": self.flashcards_count,
+            "quiz_count": self.quiz_count,
+            "failed_runs": self.failed_runs,
+            "failure_percentage": (
+                self.failed_runs / self.total_runs * 100
+                if self.total_runs else 0
+            ),
+        }
+
+
+# --------------------------------------------------
+# SCHOOL DIRECTORY
+# --------------------------------------------------
+@disk_cached(ttl=300)
+def fetch_school_directory(supabase) -> List[Dict]:
+    """
+    All schools with their location and board.
+    """
+
+    schools = []
+    for rows in iter_query_pages(
+        lambda: supabase
+        .table("schools")
+        .select("id, school_name, city, state, country, board_id")
+        .order("school_name")
+        .order("id")
+    ):
+        schools.extend(rows)
+
+    return schools
+
+
+# --------------------------------------------------
+# UTILITY: SCHOOL-GROUPED STREAMS
+# --------------------------------------------------
+def _iter_school_rows(
+    supabase,
+    table: str,
+    columns: str,
+    school_ids: List,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    role: Optional[str] = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Streams rows of `table` for many schools, one DataFrame per page.
+    """
+
+    for chunk in id_chunks(school_ids):
+        def build(chunk=chunk):
+            query = (
+                supabase
+                .table(table)
+                .select(columns)
+                .in_("school_id", chunk)
+            )
+            if role:
+                query = query.eq("role", role)
+            if start_date:
+                query = query.gte("created_at", start_date.isoformat())
+            if end_date:
+                query = query.lte("created_at", end_date.isoformat())
+            return query.order("id")
+
+        for rows in iter_query_pages(build):
+            yield pd.DataFrame(rows)
+
+
+def _add_counts(partials: Dict, counts: pd.Series, attribute: str) -> None:
+    for school_id, n in counts.items():
+        partial = partials[school_id]
+        setattr(partial, attribute, getattr(partial, attribute) + int(n))
+
+
+# --------------------------------------------------
+# PER-SCHOOL PARTIALS
+# --------------------------------------------------
+def _school_ids_params(
+    school_ids: List,
+    start_date: Optional[date],
+    end_date: Optional[date]
+) -> Dict:
+    return {
+        "p_school_ids": school_ids,
+        "p_start_date": start_date.isoformat() if start_date else None,
+        "p_end_date": end_date.isoformat() if end_date else None,
+    }
+
+
+def _rpc_partials(
+    supabase,
+    school_ids: List,
+    start_date: Optional[date],
+    end_date: Optional[date]
+) -> Optional[Dict]:
+    """
+    Partials from the grouping RPCs (see the module docstring).
+    Returns None if any of them is not deployed.
+    """
+
+    partials = {school_id: RollupPartial(schools=1) for school_id in school_ids}
+
+    for chunk in id_chunks(school_ids):
+        params = _school_ids_params(chunk, start_date, end_date)
+
+        counts = try_rpc(supabase, PARTIAL_COUNTS_RPC, params)
+        if counts is None:
+            return None
+
+        per_teacher = try_rpc(supabase, ACTIVITIES_PER_TEACHER_RPC, params)
+        if per_teacher is None:
+            return None
+
+        minutes = try_rpc(supabase, COMPLETED_MINUTES_RPC, params)
+        if minutes is None:
+            return None
+
+        for row in counts:
+            partial = partials[row["school_id"]]
+            for name in PARTIAL_COUNT_FIELDS:
+                setattr(partial, name, int(row.get(name) or 0))
+
+        for row in per_teacher:
+            partials[row["school_id"]].activities_per_teacher.add(int(row["count"]))
+
+        # One row per distinct duration, weighted by its sessions
+        for row in minutes:
+            partials[row["school_id"]].completed_minutes.add(
+                float(row["minutes"]), int(row["count"])
+            )
+
+    return partials
+
+
+def _compute_partials(
+    supabase,
+    school_ids: List,
+    start_date: Optional[date],
+    end_date: Optional[date]
+) -> Dict:
+    global _grouped_rpcs_missing
+
+    if not _grouped_rpcs_missing:
+        partials = _rpc_partials(supabase, school_ids, start_date, end_date)
+        if partials is not None:
+            return partials
+        _grouped_rpcs_missing = True
+
+    return _stream_partials(supabase, school_ids, start_date, end_date)
+
+
+def _stream_partials(
+    supabase,
+    school_ids: List,
+    start_date: Optional[date],
+    end_date: Optional[date]
+) -> Dict:
+    """
+    Partials grouped here from streamed rows; the fallback when the
+    grouping RPCs are missing.
+    """
+
+    partials = {school_id: RollupPartial(schools=1) for school_id in school_ids}
+
+    # Teachers
+    for page in _iter_school_rows(
+        supabase, "profiles", "school_id", school_ids, role="teacher"
+    ):
+        _add_counts(partials, page.groupby("school_id").size(), "teachers")
+
+    # Activities and activities per teacher
+    activity_pages = list(_iter_school_rows(
+        supabase,
+        "activities",
+        "id, school_id, creator_id",
+        school_ids,
+        start_date,
+        end_date
+    ))
+    activities = (
+        pd.concat(activity_pages, ignore_index=True)
+        if activity_pages
+        else pd.DataFrame(columns=["id", "school_id", "creator_id"])
+    )
+
+    _add_counts(partials, activities.groupby("school_id").size(), "activities")
+
+    per_teacher = activities.groupby(["school_id", "creator_id"]).size()
+    for school_id, counts in per_teacher.groupby(level=0):
+        partials[school_id].activities_per_teacher.add_many(counts.to_numpy())
+
+    published_ids = fetch_published_activity_ids(
+        supabase, activities["id"].tolist()
+    )
+    published = activities[activities["id"].isin(published_ids)]
+    _add_counts(
+        partials, published.groupby("school_id").size(), "published_activities"
+    )
+
+    # Sessions of published activities
+    published_set = set(published["id"])
+
+    for page in _iter_school_rows(
+        supabase,
+        "activity_sessions",
+        "school_id, activity_id, status, start_time, end_time, created_at",
+        school_ids,
+        start_date,
+        end_date
+    ):
+        page = page[page["activity_id"].isin(published_set)]
+        if page.empty:
+            continue
+
+        completed = page[page["status"].isin(COMPLETED_STATUSES)]
+
+        _add_counts(partials, page.groupby("school_id").size(), "sessions_attempted")
+        _add_counts(
+            partials, completed.groupby("school_id").size(), "sessions_completed"
+        )
+
+        minutes = session_durations(completed)
+        for school_id, values in minutes.groupby(completed["school_id"]):
+            partials[school_id].completed_minutes.add_many(values.to_numpy())
+
+    # Study tool runs
+    for page in _iter_school_rows(
+        supabase,
+        "student_tool_runs",
+        "school_id, kind, status",
+        school_ids,
+        start_date,
+        end_date
+    ):
+        _add_counts(partials, page.groupby("school_id").size(), "total_runs")
+        _add_counts(
+            partials,
+            page[page["kind"] == "flashcards"].groupby("school_id").size(),
+            "flashcards_count"
+        )
+        _add_counts(
+            partials,
+            page[page["kind"] == "quiz"].groupby("school_id").size(),
+            "quiz_count"
+        )
+        _add_counts(
+            partials,
+            page[page["status"] == "failed"].groupby("school_id").size(),
+            "failed_runs"
+        )
+
+    return partials
+
+
+def _partial_cache_key(school_id, start_date, end_date) -> str:
+    return cache_key(_partial_cache_key, (school_id, start_date, end_date), {})
+
+
+def fetch_school_partials(
+    supabase,
+    school_ids: List,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> Dict:
+    """
+    RollupPartial per school id. Partials are cached per school, so
+    overlapping regions only fetch the schools not seen recently;
+    the rest are computed together in one batch.
+    """
+
+    partials = {}
+    missing = list(school_ids)
+
+    if not CACHE_DISABLED:
+        cache = get_cache()
+        missing = []
+        for school_id in school_ids:
+            partial = cache.get(_partial_cache_key(school_id, start_date, end_date))
+            if partial is None:
+                missing.append(school_id)
+            else:
+                partials[school_id] = partial
+
+    if missing:
+        fetched = _compute_partials(supabase, missing, start_date, end_date)
+        partials.update(fetched)
+
+        if not CACHE_DISABLED:
+            for school_id, partial in fetched.items():
+                cache.set(
+                    _partial_cache_key(school_id, start_date, end_date),
+                    partial,
+                    PARTIAL_TTL
+                )
+
+    return partials
+
+
+# --------------------------------------------------
+# ROLLUPS
+# --------------------------------------------------
+def _merge_groups(groups: Dict, keys: List[str], all_keys: List[str]) -> Dict:
+    """
+    Merges partials grouped by `all_keys` into coarser `keys` groups.
+    """
+
+    positions = [all_keys.index(k) for k in keys]
+    merged = {}
+
+    for group, partial in groups.items():
+        key = tuple(group[p] for p in positions)
+        merged[key] = merged[key].merge(partial) if key in merged else partial
+
+    return merged
+
+
+def _rollup_frame(groups: Dict, keys: List[str]) -> pd.DataFrame:
+    rows = [
+        {**dict(zip(keys, key)), **partial.metrics()}
+        for key, partial in groups.items()
+    ]
+
+    if not rows:
+        return pd.DataFrame(columns=keys + ROLLUP_METRICS)
+
+    return pd.DataFrame(rows)[keys + ROLLUP_METRICS].sort_values(keys, ignore_index=True)
+
+
+def fetch_regional_rollups(
+    supabase,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    country: Optional[str] = None,
+    state: Optional[str] = None,
+    city: Optional[str] = None,
+    board_id=None
+) -> Dict[str, pd.DataFrame]:
+    """
+    KPIs for every level of the hierarchy in one call:
+    {"school", "city", "state", "country", "board"} -> DataFrame.
+
+    `country` / `state` / `city` / `board_id` restrict the schools
+    included, e.g. state="MH" loads one whole state.
+    """
+
+    filters = {"country": country, "state": state, "city": city, "board_id": board_id}
+
+    schools = [
+        s for s in fetch_school_directory(supabase)
+        if all(v is None or s.get(k) == v for k, v in filters.items())
+    ]
+
+    partials = fetch_school_partials(
+        supabase, [s["id"] for s in schools], start_date, end_date
+    )
+
+    school_keys = REGION_LEVELS["school"]
+    groups = {}
+    boards = {}
+
+    for s in schools:
+        region = {k: s.get(k) or UNKNOWN_REGION for k in ("country", "state", "city")}
+        key = tuple(
+            {**region, "school_id": s["id"], "school_name": s["school_name"]}[k]
+            for k in school_keys
+        )
+        groups[key] = partials[s["id"]]
+
+        board = (s.get("board_id") or UNKNOWN_REGION,)
+        boards[board] = (
+            boards[board].merge(partials[s["id"]])
+            if board in boards
+            else partials[s["id"]]
+        )
+
+    rollups = {"school": _rollup_frame(groups, school_keys)}
+
+    previous_keys = school_keys
+    for level in ("city", "state", "country"):
+        keys = REGION_LEVELS[level]
+        groups = _merge_groups(groups, keys, previous_keys)
+        rollups[level] = _rollup_frame(groups, keys)
+        previous_keys = keys
+
+    rollups["board"] = _rollup_frame(boards, BOARD_LEVEL)
+
+    return rollups
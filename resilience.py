@@ -0,0 +1,457 @@
+'''
+Resilience wrapper shared by every Supabase call:
+1. execute (admission, timeouts, retries, hedging, stale fallback,
+   cassette record / replay)
+2. CircuitBreaker
+
+Usage:
+    from resilience import execute
+    response = execute(supabase.table("schools").select("id"))
+
+Reads are retried with jittered exponential backoff; writes
+(`idempotent=False`) are tried once. Each table / RPC has its own
+circuit breaker. While a breaker is open, the last good response for
+the same query is served instead of calling the backend. Each request
+first waits for a slot from the concurrency governor and holds it until
+the request itself ends: a hedge takes a slot of its own, and the
+losing request of a hedged pair keeps its slot until it finishes.
+Backoff sleeps do not hold one.
+
+Timeouts are enforced by the HTTP client, so a timed-out request is
+closed rather than left running: create clients with
+`create_client(url, key, options=client_options())`.
+'''
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    TimeoutError as FutureTimeout,
+    wait
+)
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from postgrest.exceptions import APIError
+from supabase import ClientOptions
+
+import cassette
+from concurrency_governor import AdmissionTimeout, admit
+from fetch_tasks import FetchCancelled, check_cancelled
+
+DEFAULT_TIMEOUT = float(os.getenv("KIBU_QUERY_TIMEOUT", "20"))  # seconds
+CONNECT_TIMEOUT = 5.0
+MAX_RETRIES = int(os.getenv("KIBU_QUERY_RETRIES", "3"))
+BASE_DELAY = 0.25   # seconds, doubled per attempt
+MAX_DELAY = 4.0
+
+# Hedged requests: send a duplicate read once the first one has been
+# outstanding for longer than the observed p95 latency.
+HEDGE_REQUESTS = os.getenv("KIBU_HEDGE_REQUESTS", "0") == "1"
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30.0  # seconds before a trial request
+
+# Last good responses served while a breaker is open, bounded by count
+# and by their JSON size
+STALE_CACHE_SIZE = 256
+STALE_CACHE_BYTES = int(
+    float(os.getenv("KIBU_STALE_CACHE_MB", "32")) * 1024 * 1024
+)
+
+# Postgres / PostgREST error codes worth retrying
+RETRYABLE_CODES = {
+    "57014",    # statement timeout
+    "53300",    # too many connections
+    "40001",    # serialization failure
+    "PGRST000", # could not connect to the database
+    "PGRST001",
+    "PGRST002",
+}
+
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="supabase")
+
+
+def client_options() -> ClientOptions:
+    """
+    Supabase client options with the query timeout set on the HTTP
+    client (connect and per-read). The client is passed in whole, as
+    supabase-py no longer takes a separate PostgREST timeout.
+    """
+    return ClientOptions(
+        httpx_client=httpx.Client(
+            timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=CONNECT_TIMEOUT),
+            follow_redirects=True,
+            http2=True
+        )
+    )
+
+
+class BackendUnavailable(Exception):
+    """
+    Raised when a circuit is open and no stale response is available.
+    """
+
+
+# --------------------------------------------------
+# CIRCUIT BREAKER
+# --------------------------------------------------
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures;
+    open -> half-open after `reset_timeout`, letting one trial call
+    through; a success closes it again, a failure re-opens it.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = BREAKER_RESET_TIMEOUT
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._trial_owner: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                self._trial_owner = threading.get_ident()
+                return True
+            return False
+
+    def release_trial(self) -> None:
+        """
+        Gives up the calling thread's trial without an outcome (the
+        call ended before reaching the backend), so another call may
+        make the trial.
+        """
+        with self._lock:
+            if self._trial_owner == threading.get_ident():
+                self._trial_in_flight = False
+                self._trial_owner = None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+            self._trial_owner = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            self._trial_owner = None
+            if self.failures >= self.failure_threshold or self.opened_at:
+                self.opened_at = time.monotonic()
+
+
+# --------------------------------------------------
+# PER-ENDPOINT STATE
+# --------------------------------------------------
+_state_lock = threading.Lock()
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, deque] = {}
+_stale: "OrderedDict[Tuple, Tuple[Any, int]]" = OrderedDict()
+_stale_bytes = 0
+
+
+def endpoint_name(query) -> str:
+    """
+    Table or RPC name of a query builder, e.g. "activity_sessions" or
+    "rpc/get_completed_sessions_count".
+    """
+    path = str(query.request.path).rstrip("/")
+    parts = path.split("/")
+    if len(parts) >= 2 and parts[-2] == "rpc":
+        return f"rpc/{parts[-1]}"
+    return parts[-1]
+
+
+def query_key(query) -> Tuple:
+    """
+    Normalized identity of a request: method, endpoint, sorted query
+    parameters, Accept / Prefer headers and JSON body.
+    """
+    request = query.request
+    return (
+        request.http_method,
+        endpoint_name(query),
+        tuple(sorted(request.params.multi_items())),
+        request.headers.get("Accept"),
+        request.headers.get("Prefer"),
+        repr(request.json),
+    )
+
+
+def breaker_for(endpoint: str) -> CircuitBreaker:
+    with _state_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker()
+        return _breakers[endpoint]
+
+
+def breaker_states() -> Dict[str, str]:
+    with _state_lock:
+        return {name: b.state for name, b in _breakers.items()}
+
+
+def _record_latency(endpoint: str, seconds: float) -> None:
+    with _state_lock:
+        if endpoint not in _latencies:
+            _latencies[endpoint] = deque(maxlen=LATENCY_WINDOW)
+        _latencies[endpoint].append(seconds)
+
+
+def p95_latency(endpoint: str) -> Optional[float]:
+    with _state_lock:
+        samples = sorted(_latencies.get(endpoint, ()))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    return samples[int(len(samples) * 0.95) - 1]
+
+
+def _response_size(response) -> int:
+    return len(json.dumps(
+        getattr(response, "data", None), separators=(",", ":"), default=str
+    ))
+
+
+def _remember(key: Tuple, response) -> None:
+    global _stale_bytes
+
+    size = _response_size(response)
+
+    # One large export page should not flush every other entry
+    if size > STALE_CACHE_BYTES // 8:
+        return
+
+    with _state_lock:
+        previous = _stale.pop(key, None)
+        if previous is not None:
+            _stale_bytes -= previous[1]
+
+        _stale[key] = (response, size)
+        _stale_bytes += size
+
+        while len(_stale) > STALE_CACHE_SIZE or _stale_bytes > STALE_CACHE_BYTES:
+            _, (_, evicted) = _stale.popitem(last=False)
+            _stale_bytes -= evicted
+
+
+def _stale_response(key: Tuple):
+    with _state_lock:
+        entry = _stale.get(key)
+    return None if entry is None else entry[0]
+
+
+def clear_stale() -> None:
+    global _stale_bytes
+
+    with _state_lock:
+        _stale.clear()
+        _stale_bytes = 0
+
+
+# --------------------------------------------------
+# UTILITY: ERRORS AND BACKOFF
+# --------------------------------------------------
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (FutureTimeout, httpx.TransportError)):
+        return True
+    if isinstance(error, APIError):
+        code = error.code
+        if isinstance(code, int):
+            return code >= 500
+        return code in RETRYABLE_CODES
+    return False
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Full-jitter exponential backoff.
+    """
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+
+
+# --------------------------------------------------
+# EXECUTION
+# --------------------------------------------------
+def _timed_execute(query, endpoint: str):
+    started = time.monotonic()
+    response = query.execute()
+    _record_latency(endpoint, time.monotonic() - started)
+    return response
+
+
+def _admitted_execute(query, endpoint: str, admitted: Optional[threading.Event] = None):
+    """
+    One request, holding a governor slot for as long as it runs.
+    Sets `admitted` once the slot is granted.
+    """
+    with admit(endpoint):
+        if admitted is not None:
+            admitted.set()
+        return _timed_execute(query, endpoint)
+
+
+def _submit(query, endpoint: str, admitted: Optional[threading.Event] = None):
+    # In a copy of the caller's context, so the request keeps the
+    # caller's priority and cancellation scope while queued
+    return _executor.submit(
+        contextvars.copy_context().run, _admitted_execute, query, endpoint, admitted
+    )
+
+
+def _execute_once(query, endpoint: str, hedge: bool):
+    """
+    One attempt. Without hedging the request runs in the calling
+    thread; the HTTP client's timeout bounds it. A hedge is only sent
+    once the primary request has been admitted and outlived the p95
+    latency.
+    """
+
+    hedge_after = p95_latency(endpoint) if hedge else None
+
+    if hedge_after is None or hedge_after >= DEFAULT_TIMEOUT:
+        return _admitted_execute(query, endpoint)
+
+    admitted = threading.Event()
+    primary = _submit(query, endpoint, admitted)
+
+    # Time spent queued for a slot does not count towards the hedge delay
+    while not admitted.wait(0.05):
+        if primary.done():
+            return primary.result()
+
+    try:
+        return primary.result(timeout=hedge_after)
+    except FutureTimeout:
+        pass
+
+    secondary = _submit(query, endpoint)
+    pending = {primary, secondary}
+    error: Optional[BaseException] = None
+
+    # Both requests end within the HTTP timeout; the first success wins
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+
+    raise error
+
+
+def execute(
+    query,
+    retries: int = MAX_RETRIES,
+    idempotent: bool = True,
+    hedge: bool = HEDGE_REQUESTS
+):
+    """
+    Executes a query builder (table select, RPC, insert ...) with
+    jittered retries for idempotent reads, optional hedging, and a
+    per-endpoint circuit breaker. The timeout is the client's (see
+    `client_options`).
+
+    If the backend is failing, the last good response for the same
+    query is returned when available. Non-retryable API errors (bad
+    filters, missing RPCs ...) are raised immediately.
+
+    In cassette replay mode the recorded response is returned without
+    calling the backend; in record mode successful responses are saved.
+
+    Raises FetchCancelled if the calling fetch scope was superseded,
+    and AdmissionTimeout if no concurrency slot freed up in time.
+    """
+
+    check_cancelled()
+
+    mode = cassette.cassette_mode()
+    if mode == "replay":
+        return cassette.replay(query)
+
+    endpoint = endpoint_name(query)
+    key = query_key(query)
+    breaker = breaker_for(endpoint)
+
+    # Retries happen here, with backoff and the breaker; postgrest's own
+    # 503 retry would sleep inside an attempt
+    query.request.retry_enabled = False
+
+    if not breaker.allow():
+        stale = _stale_response(key) if idempotent else None
+        if stale is not None:
+            return stale
+        raise BackendUnavailable(f"Circuit open for {endpoint}")
+
+    attempts = retries + 1 if idempotent else 1
+    last_error: Optional[Exception] = None
+
+    for attempt in range(attempts):
+        started = time.monotonic()
+        try:
+            response = _execute_once(query, endpoint, hedge and idempotent)
+            latency = time.monotonic() - started
+        except (AdmissionTimeout, FetchCancelled):
+            # Local overload or a superseded fetch: the backend was not
+            # reached, so the breaker learns nothing
+            breaker.release_trial()
+            raise
+        except Exception as e:
+            if not is_retryable(e):
+                if isinstance(e, APIError):
+                    # The backend answered; the request itself is wrong
+                    breaker.record_success()
+                    if mode == "record":
+                        cassette.record_error(query, e, time.monotonic() - started)
+                else:
+                    breaker.release_trial()
+                raise
+
+            breaker.record_failure()
+            last_error = e
+
+            if attempt + 1 < attempts and breaker.allow():
+                time.sleep(backoff_delay(attempt))
+                check_cancelled()
+                continue
+            break
+
+        breaker.record_success()
+        if idempotent:
+            _remember(key, response)
+        if mode == "record":
+            cassette.record(query, response, latency)
+        return response
+
+    stale = _stale_response(key) if idempotent else None
+    if stale is not None:
+        return stale
+
+    raise last_error
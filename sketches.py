@@ -0,0 +1,158 @@
+'''
+Mergeable quantile sketches, used to roll medians up across schools
+without refetching rows:
+1. QuantileSketch
+
+Values are counted in logarithmic buckets [gamma^(i-1), gamma^i) (the
+DDSketch scheme), so every quantile comes back within
+`relative_accuracy` of the true value. Sketches with the same accuracy
+merge by adding bucket counts, and the merged sketch answers exactly
+as if it had seen all values itself.
+'''
+import math
+from typing import Dict, Iterable
+
+import numpy as np
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# Values at or below this are counted as zero
+MIN_POSITIVE = 1e-9
+
+
+class QuantileSketch:
+    """
+    Log-bucketed histogram of non-negative values with exact count,
+    sum and mean, and relative-error quantiles.
+    """
+
+    __slots__ = (
+        "relative_accuracy",
+        "gamma",
+        "bins",
+        "zero_count",
+        "count",
+        "total",
+    )
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value: float, n: int = 1) -> None:
+        if value != value:
+            return
+        if value < 0:
+            raise ValueError("QuantileSketch only accepts non-negative values")
+
+        self.count += n
+        self.total += value * n
+
+        if value <= MIN_POSITIVE:
+            self.zero_count += n
+            return
+
+        index = math.ceil(math.log(value, self.gamma))
+        self.bins[index] = self.bins.get(index, 0) + n
+
+    def add_many(self, values: Iterable[float]) -> None:
+        """
+        Vectorized `add` for an array / Series of values (NaN skipped).
+        """
+
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+
+        if not len(values):
+            return
+        if (values < 0).any():
+            raise ValueError("QuantileSketch only accepts non-negative values")
+
+        positive = values[values > MIN_POSITIVE]
+
+        self.count += len(values)
+        self.total += float(values.sum())
+        self.zero_count += len(values) - len(positive)
+
+        indexes = np.ceil(np.log(positive) / math.log(self.gamma)).astype(np.int64)
+        unique, counts = np.unique(indexes, return_counts=True)
+
+        for index, n in zip(unique.tolist(), counts.tolist()):
+            self.bins[index] = self.bins.get(index, 0) + n
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """
+        A new sketch holding the values of both.
+        """
+
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracy")
+
+        merged = QuantileSketch(self.relative_accuracy)
+        merged.bins = dict(self.bins)
+        for index, n in other.bins.items():
+            merged.bins[index] = merged.bins.get(index, 0) + n
+
+        merged.zero_count = self.zero_count + other.zero_count
+        merged.count = self.count + other.count
+        merged.total = self.total + other.total
+
+        return merged
+
+    def quantile(self, q: float) -> float:
+        """
+        Value at quantile `q` (0..1); 0 for an empty sketch. Between two
+        ranks the values are interpolated linearly, as
+        `statistics.median` does for an even count.
+        """
+
+        if not self.count:
+            return 0.0
+
+        rank = q * (self.count - 1)
+        lower = math.floor(rank)
+        upper = math.ceil(rank)
+
+        low_value = self._value_at(lower)
+        if upper == lower:
+            return low_value
+
+        high_value = self._value_at(upper)
+        return low_value + (rank - lower) * (high_value - low_value)
+
+    def _value_at(self, rank: int) -> float:
+        """
+        Value of the `rank`-th smallest item (0-based): the midpoint,
+        in relative terms, of the bucket holding it.
+        """
+
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                break
+
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def median(self) -> float:
+        return self.quantile(0.5)
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
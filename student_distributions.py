@@ -0,0 +1,353 @@
+'''
+Distribution analytics over activity sessions:
+1. fetch_session_duration_histogram
+2. histogram_percentiles
+3. fetch_engagement_heatmap
+
+Only binned counts leave this module; raw sessions are either binned
+by the database (RPC) or fetched into a columnar SessionBatch and
+binned from its arrays. `bin_session_batch` and
+`heatmap_session_batch` take a batch the caller already holds, so one
+fetch can serve several panels.
+'''
+from datetime import date
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from database_utils import rpc_params, try_rpc
+from persistent_cache import disk_cached
+from records import SESSION_STATUSES, SessionBatch
+from students_database_fetch import (
+    fetch_activity_session_batch,
+    fetch_published_activities_by_school
+)
+
+DEFAULT_BIN_WIDTH = 5       # minutes
+DEFAULT_MAX_MINUTES = 180   # sessions longer than this share the last bin
+
+DEFAULT_PERCENTILES = (25, 50, 75, 90, 95)
+
+HISTOGRAM_COLUMNS = ["activity_id", "state", "bin_start", "bin_end", "count"]
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+# --------------------------------------------------
+# UTILITY: VECTORIZED SESSION FIELDS
+# --------------------------------------------------
+def session_durations(df: pd.DataFrame) -> pd.Series:
+    """
+    Vectorized equivalent of `_extract_durations`: minutes between the
+    time-only `start_time` and `end_time`, wrapping past midnight.
+    NaN where a field is missing or unparsable.
+    """
+
+    start = pd.to_timedelta(df["start_time"], errors="coerce")
+    end = pd.to_timedelta(df["end_time"], errors="coerce")
+
+    minutes = (end - start).dt.total_seconds() / 60
+    minutes = minutes.where(minutes >= 0, minutes + 24 * 60)
+
+    created = pd.to_datetime(df["created_at"], utc=True, errors="coerce")
+
+    return minutes.where(created.notna())
+
+
+# --------------------------------------------------
+# DURATION HISTOGRAM
+# --------------------------------------------------
+def _bin_edges(n_bins: int, bin_width: int):
+    bin_start = np.arange(n_bins + 1) * bin_width
+    bin_end = np.append(bin_start[1:n_bins + 1], np.inf)
+    return bin_start, bin_end
+
+
+def _histogram_frame(
+    counts: Dict,
+    n_bins: int,
+    bin_width: int
+) -> pd.DataFrame:
+    if not counts:
+        return pd.DataFrame(columns=HISTOGRAM_COLUMNS)
+
+    bin_start, bin_end = _bin_edges(n_bins, bin_width)
+
+    frames = []
+    for (activity_id, state), bin_counts in counts.items():
+        frames.append(pd.DataFrame({
+            "activity_id": activity_id,
+            "state": state,
+            "bin_start": bin_start,
+            "bin_end": bin_end,
+            "count": bin_counts,
+        }))
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def _batch_columns(batch: SessionBatch):
+    """
+    (activity index, completed flag, duration) arrays of a batch.
+    """
+    return (
+        np.frombuffer(batch.activity_index, dtype=np.uint32).astype(np.int64),
+        np.frombuffer(batch.status_codes, dtype=np.int8)
+        == SESSION_STATUSES.index("completed"),
+        np.frombuffer(batch.duration_minutes, dtype=np.float64),
+    )
+
+
+def bin_session_batch(
+    batch: SessionBatch,
+    bin_width: int = DEFAULT_BIN_WIDTH,
+    max_minutes: int = DEFAULT_MAX_MINUTES
+) -> pd.DataFrame:
+    """
+    Bins the timed sessions of a batch by (activity_id, state).
+    """
+
+    n_bins = max_minutes // bin_width
+
+    activity, completed, duration = _batch_columns(batch)
+    timed = ~np.isnan(duration)
+
+    # One row per (activity, state): 2 * activity + (0 completed, 1 ongoing)
+    rows = 2 * activity[timed] + (~completed[timed]).astype(np.int64)
+    bins = np.minimum((duration[timed] // bin_width).astype(np.int64), n_bins)
+
+    grid = np.zeros((2 * len(batch.activity_ids), n_bins + 1), dtype=np.int64)
+    np.add.at(grid, (rows, bins), 1)
+
+    counts = {
+        (batch.activity_ids[row // 2], "completed" if row % 2 == 0 else "ongoing"):
+            grid[row]
+        for row in np.unique(rows).tolist()
+    }
+
+    return _histogram_frame(counts, n_bins, bin_width)
+
+
+@disk_cached(ttl=300)
+def fetch_session_duration_histogram(
+    supabase,
+    school_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    bin_width: int = DEFAULT_BIN_WIDTH,
+    max_minutes: int = DEFAULT_MAX_MINUTES
+) -> pd.DataFrame:
+    """
+    Session duration histogram for published activities of a school,
+    split by activity and by completed vs ongoing.
+
+    Returns one row per (activity_id, state, bin) with columns
+    activity_id, state, bin_start, bin_end, count. The last bin is
+    open-ended (bin_end = inf).
+
+    Uses the `get_session_duration_histogram` RPC when deployed,
+    otherwise bins fetched sessions client-side.
+    """
+
+    n_bins = max_minutes // bin_width
+
+    data = try_rpc(
+        supabase,
+        "get_session_duration_histogram",
+        {
+            **rpc_params(school_id, start_date, end_date),
+            "p_bin_width": bin_width,
+            "p_max_minutes": max_minutes,
+        }
+    )
+
+    if data is not None:
+        counts: Dict = {}
+        for row in data:
+            key = (row["activity_id"], row["state"])
+            if key not in counts:
+                counts[key] = np.zeros(n_bins + 1, dtype=np.int64)
+            counts[key][min(int(row["bin_index"]), n_bins)] += row["count"]
+
+        return _histogram_frame(counts, n_bins, bin_width)
+
+    activity_ids = [
+        a["id"] for a in fetch_published_activities_by_school(
+            supabase, school_id, start_date, end_date
+        )
+    ]
+
+    batch = fetch_activity_session_batch(
+        supabase, school_id, activity_ids, start_date, end_date
+    )
+
+    return bin_session_batch(batch, bin_width, max_minutes)
+
+
+# --------------------------------------------------
+# PERCENTILES FROM BINS
+# --------------------------------------------------
+def _bin_percentiles(
+    bins: pd.DataFrame,
+    percentiles: Sequence[float]
+) -> Dict:
+    bins = bins.sort_values("bin_start")
+
+    counts = bins["count"].to_numpy(dtype=float)
+    starts = bins["bin_start"].to_numpy(dtype=float)
+    ends = bins["bin_end"].to_numpy(dtype=float)
+
+    total = counts.sum()
+    result = {"sessions": int(total)}
+
+    if total == 0:
+        for p in percentiles:
+            result[f"p{p}"] = None
+        return result
+
+    cumulative = np.cumsum(counts)
+
+    for p in percentiles:
+        target = total * p / 100
+        i = int(np.searchsorted(cumulative, target))
+        i = min(i, len(counts) - 1)
+
+        if np.isinf(ends[i]):
+            # Open-ended last bin: report its lower bound
+            result[f"p{p}"] = starts[i]
+            continue
+
+        before = cumulative[i - 1] if i > 0 else 0
+        fraction = (target - before) / counts[i] if counts[i] else 0
+        result[f"p{p}"] = starts[i] + fraction * (ends[i] - starts[i])
+
+    return result
+
+
+def histogram_percentiles(
+    histogram: pd.DataFrame,
+    by: Optional[List[str]] = None,
+    percentiles: Sequence[float] = DEFAULT_PERCENTILES
+) -> pd.DataFrame:
+    """
+    Estimates duration percentiles (minutes) from a binned histogram,
+    interpolating linearly within each bin. `by` selects grouping
+    columns, e.g. ["state"] or ["activity_id"].
+    """
+
+    by = by or []
+    columns = by + ["sessions"] + [f"p{p}" for p in percentiles]
+
+    if histogram.empty:
+        return pd.DataFrame(columns=columns)
+
+    # Merge bins across the columns we are not grouping by
+    merged = (
+        histogram
+        .groupby(by + ["bin_start", "bin_end"], as_index=False)["count"]
+        .sum()
+    )
+
+    if not by:
+        return pd.DataFrame([_bin_percentiles(merged, percentiles)])
+
+    rows = []
+    for key, group in merged.groupby(by):
+        key = key if isinstance(key, tuple) else (key,)
+        rows.append({
+            **dict(zip(by, key)),
+            **_bin_percentiles(group, percentiles)
+        })
+
+    return pd.DataFrame(rows, columns=columns)
+
+
+# --------------------------------------------------
+# WEEKDAY x HOUR ENGAGEMENT HEATMAP
+# --------------------------------------------------
+def _heatmap_frame(sessions: np.ndarray, completed: np.ndarray) -> pd.DataFrame:
+    weekday, hour = np.meshgrid(np.arange(7), np.arange(24), indexing="ij")
+
+    df = pd.DataFrame({
+        "weekday": weekday.ravel(),
+        "hour": hour.ravel(),
+        "sessions": sessions.ravel(),
+        "completed": completed.ravel(),
+    })
+
+    df["completion_rate"] = np.where(
+        df["sessions"] > 0,
+        df["completed"] / df["sessions"].where(df["sessions"] > 0, 1) * 100,
+        np.nan
+    )
+
+    return df
+
+
+def heatmap_session_batch(batch: SessionBatch) -> pd.DataFrame:
+    """
+    7 x 24 weekday/hour counts of the sessions of a batch (see
+    SessionBatch for how weekday and hour are taken).
+    """
+
+    sessions = np.zeros((7, 24), dtype=np.int64)
+    completed = np.zeros((7, 24), dtype=np.int64)
+
+    _, is_completed, _ = _batch_columns(batch)
+    weekday = np.frombuffer(batch.weekday, dtype=np.int8).astype(np.int64)
+    hour = np.frombuffer(batch.hour, dtype=np.int8).astype(np.int64)
+
+    valid = (weekday >= 0) & (hour >= 0)
+    weekday, hour = weekday[valid], hour[valid]
+
+    np.add.at(sessions, (weekday, hour), 1)
+    np.add.at(completed, (weekday, hour), is_completed[valid].astype(np.int64))
+
+    return _heatmap_frame(sessions, completed)
+
+
+@disk_cached(ttl=300)
+def fetch_engagement_heatmap(
+    supabase,
+    school_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> pd.DataFrame:
+    """
+    Session counts and completion rate by weekday (0 = Monday) and hour
+    for published activities of a school.
+
+    Returns 168 rows with columns weekday, hour, sessions, completed,
+    completion_rate. Uses the `get_session_heatmap` RPC when deployed,
+    otherwise counts fetched sessions client-side.
+    """
+
+    sessions = np.zeros((7, 24), dtype=np.int64)
+    completed = np.zeros((7, 24), dtype=np.int64)
+
+    data = try_rpc(
+        supabase,
+        "get_session_heatmap",
+        rpc_params(school_id, start_date, end_date)
+    )
+
+    if data is not None:
+        for row in data:
+            weekday, hour = int(row["weekday"]), int(row["hour"])
+            sessions[weekday, hour] += row["sessions"]
+            completed[weekday, hour] += row["completed"]
+
+        return _heatmap_frame(sessions, completed)
+
+    activity_ids = [
+        a["id"] for a in fetch_published_activities_by_school(
+            supabase, school_id, start_date, end_date
+        )
+    ]
+
+    batch = fetch_activity_session_batch(
+        supabase, school_id, activity_ids, start_date, end_date
+    )
+
+    return heatmap_session_batch(batch)
@@ -0,0 +1,464 @@
+'''
+One engine for school-level student metrics, with pluggable backends:
+1. fetch_student_metrics
+2. choose_backend / estimate_session_rows
+3. refresh_mirror
+
+Every backend returns the same metrics with the same definitions,
+over sessions of published activities in the date window:
+    published_activities   published activities created in the window
+    attempted_sessions     all sessions
+    completed_sessions     sessions with status "completed"
+    ongoing_sessions       every other status (attempted - completed)
+    completion_rate        completed / attempted, in %
+    mean_time_spent        mean duration of completed sessions (minutes)
+    median_time_spent      median duration of completed sessions (minutes)
+
+Backends:
+    rpc      Postgres functions (students_stats); cheapest for big schools.
+             All five must be deployed, else the client backend is used
+    client   raw rows paged to the app and aggregated here; cheapest
+             when only a page or two of sessions exist
+    mirror   a local SQLite copy of the school (see refresh_mirror);
+             no network at all
+
+Environment:
+    KIBU_STUDENT_BACKEND   force "rpc", "client" or "mirror" (default: auto)
+    KIBU_MIRROR_PATH       SQLite mirror file (mirror backend disabled if unset)
+    KIBU_MIRROR_MAX_AGE    seconds a mirrored school stays usable (default 3600)
+'''
+import contextlib
+import os
+import sqlite3
+import statistics
+import threading
+import time
+from datetime import date
+from typing import Callable, Dict, List, Optional
+
+from postgrest.exceptions import APIError
+
+from database_utils import (
+    DEFAULT_PAGE_SIZE,
+    MISSING_RPC_CODES,
+    count_rows,
+    iter_query_pages
+)
+from memory_accounting import prefer_streaming
+from persistent_cache import disk_cached
+from records import SessionBatch, session_duration_minutes
+from students_database_fetch import (
+    COMPLETED_STATUSES,
+    _activity_sessions_query,
+    fetch_published_activities_by_school,
+    fetch_published_activity_ids,
+    iter_activity_sessions
+)
+from students_stats import (
+    fetch_attempted_sessions_count,
+    fetch_completed_session_mean_time,
+    fetch_completed_session_median_time,
+    fetch_completed_sessions_count,
+    fetch_total_published_activities
+)
+
+FORCED_BACKEND = os.getenv("KIBU_STUDENT_BACKEND") or None
+MIRROR_PATH = os.getenv("KIBU_MIRROR_PATH") or None
+MIRROR_MAX_AGE = float(os.getenv("KIBU_MIRROR_MAX_AGE", "3600"))
+
+# Up to this many (estimated) sessions, paging the raw rows costs fewer
+# round trips than the RPC set and needs no server-side functions.
+CLIENT_MAX_ROWS = 2 * DEFAULT_PAGE_SIZE
+
+METRIC_SESSION_COLUMNS = "activity_id, status, start_time, end_time, created_at"
+
+
+class BackendUnsupported(Exception):
+    """
+    Raised by a backend that cannot serve this database (e.g. its RPCs
+    are not deployed); the engine falls back to the client backend.
+    """
+
+
+# --------------------------------------------------
+# UTILITY: METRIC DEFINITIONS
+# --------------------------------------------------
+def _metrics(
+    published: int,
+    attempted: int,
+    completed: int,
+    mean_time: float,
+    median_time: float
+) -> Dict:
+    return {
+        "published_activities": published,
+        "attempted_sessions": attempted,
+        "completed_sessions": completed,
+        "ongoing_sessions": attempted - completed,
+        "completion_rate": completed / attempted * 100 if attempted else 0,
+        "mean_time_spent": mean_time,
+        "median_time_spent": median_time,
+    }
+
+
+def _duration_stats(durations: List[float]):
+    if not durations:
+        return 0, 0
+    return statistics.mean(durations), statistics.median(durations)
+
+
+# --------------------------------------------------
+# BACKEND: RPC
+# --------------------------------------------------
+def _rpc_metrics(supabase, school_id, start_date, end_date) -> Dict:
+    try:
+        published = fetch_total_published_activities(
+            supabase, school_id, start_date, end_date
+        )
+        attempted = fetch_attempted_sessions_count(
+            supabase, school_id, start_date, end_date
+        )
+        completed = fetch_completed_sessions_count(
+            supabase, school_id, start_date, end_date
+        )
+        median_time = fetch_completed_session_median_time(
+            supabase, school_id, start_date, end_date
+        )
+        # Nothing to average: skip the mean query entirely
+        mean_time = fetch_completed_session_mean_time(
+            supabase, school_id, start_date, end_date
+        ) if completed else 0
+    except APIError as e:
+        if e.code in MISSING_RPC_CODES:
+            raise BackendUnsupported(str(e))
+        raise
+
+    return _metrics(
+        int(published),
+        int(attempted),
+        int(completed),
+        float(mean_time or 0),
+        float(median_time or 0)
+    )
+
+
+# --------------------------------------------------
+# BACKEND: CLIENT (RAW ROWS)
+# --------------------------------------------------
+def _client_metrics(supabase, school_id, start_date, end_date) -> Dict:
+    activity_ids = [
+        a["id"] for a in fetch_published_activities_by_school(
+            supabase, school_id, start_date, end_date
+        )
+    ]
+
+    batch = SessionBatch()
+
+    for rows in iter_activity_sessions(
+        supabase,
+        school_id,
+        activity_ids,
+        start_date,
+        end_date,
+        columns=METRIC_SESSION_COLUMNS
+    ):
+        batch.extend(rows)
+
+    mean_time, median_time = _duration_stats(
+        batch.durations(*COMPLETED_STATUSES)
+    )
+
+    return _metrics(
+        len(activity_ids),
+        len(batch),
+        batch.count_status(*COMPLETED_STATUSES),
+        mean_time,
+        median_time
+    )
+
+
+# --------------------------------------------------
+# BACKEND: LOCAL MIRROR
+# --------------------------------------------------
+MIRROR_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS mirror_schools (
+        school_id TEXT PRIMARY KEY,
+        synced_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS activities (
+        id TEXT PRIMARY KEY,
+        school_id TEXT NOT NULL,
+        published INTEGER NOT NULL,
+        created_at TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS activity_sessions (
+        id TEXT PRIMARY KEY,
+        school_id TEXT NOT NULL,
+        activity_id TEXT,
+        status TEXT,
+        start_time TEXT,
+        end_time TEXT,
+        created_at TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS activities_school ON activities (school_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS sessions_school ON activity_sessions (school_id, created_at)",
+]
+
+
+_mirror_lock = threading.Lock()
+_mirror_schema_ready = False
+
+
+@contextlib.contextmanager
+def _mirror_connect():
+    """
+    A connection to the mirror, used as `with _mirror_connect() as conn`.
+    The block runs in one transaction and the connection is closed
+    afterwards. The schema is created on the first connection only.
+    """
+
+    global _mirror_schema_ready
+
+    conn = sqlite3.connect(MIRROR_PATH, timeout=30)
+    try:
+        with _mirror_lock:
+            if not _mirror_schema_ready:
+                with conn:
+                    for statement in MIRROR_SCHEMA:
+                        conn.execute(statement)
+                _mirror_schema_ready = True
+
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def mirror_is_fresh(school_id) -> bool:
+    if not MIRROR_PATH or not os.path.exists(MIRROR_PATH):
+        return False
+
+    with _mirror_connect() as conn:
+        row = conn.execute(
+            "SELECT synced_at FROM mirror_schools WHERE school_id = ?",
+            (str(school_id),)
+        ).fetchone()
+
+    return row is not None and time.time() - row[0] <= MIRROR_MAX_AGE
+
+
+def _window_sql(column: str, start_date, end_date):
+    """
+    Same bounds as the PostgREST gte / lte filters on ISO strings.
+    """
+    sql, params = "", []
+    if start_date:
+        sql += f" AND {column} >= ?"
+        params.append(start_date.isoformat())
+    if end_date:
+        sql += f" AND {column} <= ?"
+        params.append(end_date.isoformat())
+    return sql, params
+
+
+def _mirror_metrics(supabase, school_id, start_date, end_date) -> Dict:
+    if not mirror_is_fresh(school_id):
+        raise BackendUnsupported(f"School {school_id} is not mirrored")
+
+    activity_window, activity_params = _window_sql(
+        "created_at", start_date, end_date
+    )
+    session_window, session_params = _window_sql(
+        "s.created_at", start_date, end_date
+    )
+
+    published_sql = (
+        "SELECT id FROM activities "
+        "WHERE school_id = ? AND published = 1" + activity_window
+    )
+    published_params = [str(school_id)] + activity_params
+
+    with _mirror_connect() as conn:
+        published = conn.execute(
+            f"SELECT COUNT(*) FROM ({published_sql})", published_params
+        ).fetchone()[0]
+
+        sessions = conn.execute(
+            "SELECT s.status, s.start_time, s.end_time, s.created_at "
+            "FROM activity_sessions s "
+            f"WHERE s.school_id = ? AND s.activity_id IN ({published_sql})"
+            + session_window,
+            [str(school_id)] + published_params + session_params
+        ).fetchall()
+
+    completed = [s for s in sessions if s[0] in COMPLETED_STATUSES]
+    durations = [
+        d for d in (session_duration_minutes(*s[1:]) for s in completed)
+        if d is not None
+    ]
+
+    mean_time, median_time = _duration_stats(durations)
+
+    return _metrics(
+        published, len(sessions), len(completed), mean_time, median_time
+    )
+
+
+def refresh_mirror(supabase, school_id) -> None:
+    """
+    Copies a school's activities and sessions into the local mirror.
+    """
+
+    if not MIRROR_PATH:
+        raise RuntimeError("KIBU_MIRROR_PATH is not set")
+
+    activities = []
+    for rows in iter_query_pages(
+        lambda: supabase
+        .table("activities")
+        .select("id, created_at")
+        .eq("school_id", school_id)
+        .order("id")
+    ):
+        activities.extend(rows)
+
+    published_ids = fetch_published_activity_ids(
+        supabase, [a["id"] for a in activities]
+    )
+
+    sessions = []
+    for rows in iter_activity_sessions(
+        supabase,
+        school_id,
+        columns="id, " + METRIC_SESSION_COLUMNS
+    ):
+        sessions.extend(
+            (
+                str(s["id"]), str(school_id), s.get("activity_id"),
+                s.get("status"), s.get("start_time"), s.get("end_time"),
+                s.get("created_at")
+            )
+            for s in rows
+        )
+
+    with _mirror_connect() as conn:
+        conn.execute("DELETE FROM activities WHERE school_id = ?", (str(school_id),))
+        conn.execute(
+            "DELETE FROM activity_sessions WHERE school_id = ?", (str(school_id),)
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO activities VALUES (?, ?, ?, ?)",
+            [
+                (
+                    a["id"], str(school_id),
+                    int(a["id"] in published_ids), a.get("created_at")
+                )
+                for a in activities
+            ]
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO activity_sessions VALUES (?, ?, ?, ?, ?, ?, ?)",
+            sessions
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO mirror_schools VALUES (?, ?)",
+            (str(school_id), time.time())
+        )
+
+
+# --------------------------------------------------
+# BACKEND SELECTION
+# --------------------------------------------------
+BACKENDS: Dict[str, Callable] = {
+    "rpc": _rpc_metrics,
+    "client": _client_metrics,
+    "mirror": _mirror_metrics,
+}
+
+
+def estimate_session_rows(
+    supabase,
+    school_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> int:
+    """
+    Planner estimate of the school's sessions in the window; a HEAD
+    request that does not scan the table.
+    """
+    return count_rows(
+        _activity_sessions_query(
+            supabase,
+            school_id,
+            start_date=start_date,
+            end_date=end_date,
+            columns="id",
+            count="planned",
+            head=True
+        )
+    )
+
+
+def choose_backend(
+    supabase,
+    school_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> str:
+    """
+    The cheapest backend for this request: a fresh local mirror first,
+    then raw rows for small schools / windows, otherwise the RPCs.
+    Sessions over their memory budget always use the RPCs.
+    """
+
+    if FORCED_BACKEND:
+        return FORCED_BACKEND
+
+    if mirror_is_fresh(school_id):
+        return "mirror"
+
+    # Sessions over their memory budget keep raw rows on the server
+    if prefer_streaming():
+        return "rpc"
+
+    rows = estimate_session_rows(supabase, school_id, start_date, end_date)
+
+    return "client" if rows <= CLIENT_MAX_ROWS else "rpc"
+
+
+# --------------------------------------------------
+# ENGINE
+# --------------------------------------------------
+@disk_cached(ttl=300)
+def fetch_student_metrics(
+    supabase,
+    school_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    backend: Optional[str] = None
+) -> Dict:
+    """
+    Student metrics for a school (see the module docstring for the
+    definitions). `backend` forces one of BACKENDS; by default the
+    cheapest is chosen. The backend used is returned under "backend".
+    """
+
+    name = backend or choose_backend(supabase, school_id, start_date, end_date)
+
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown student metrics backend: {name}")
+
+    try:
+        metrics = BACKENDS[name](supabase, school_id, start_date, end_date)
+    except BackendUnsupported:
+        name = "client"
+        metrics = _client_metrics(supabase, school_id, start_date, end_date)
+
+    metrics["backend"] = name
+    return metrics
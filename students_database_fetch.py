@@ -1,11 +1,17 @@
 from supabase import create_client, Client
-from datetime import date, datetime, time
-from typing import Optional, List, Dict
+from datetime import date
+from typing import Optional, List, Dict, Iterator, Set
+import itertools
 import statistics
 
 from dotenv import load_dotenv
 import os
 
+from database_utils import iter_query_pages, DEFAULT_PAGE_SIZE
+from persistent_cache import disk_cached
+from records import SessionBatch, session_duration_minutes
+from resilience import execute, client_options
+
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -13,12 +19,47 @@ SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
 supabase: Client = create_client(
     SUPABASE_URL,
-    SUPABASE_SERVICE_ROLE_KEY
+    SUPABASE_SERVICE_ROLE_KEY,
+    options=client_options()
 )
 
 # --------------------------------------------------
 # PUBLISHED ACTIVITIES (for dropdown)
 # --------------------------------------------------
+# Keeps `in.(...)` filters well under URL length limits
+ID_CHUNK_SIZE = 300
+
+
+def id_chunks(ids: List, chunk_size: int = ID_CHUNK_SIZE) -> Iterator[List]:
+    for i in range(0, len(ids), chunk_size):
+        yield ids[i:i + chunk_size]
+
+
+def fetch_published_activity_ids(
+    supabase,
+    activity_ids: List,
+    chunk_size: int = ID_CHUNK_SIZE
+) -> Set:
+    """
+    Returns the subset of `activity_ids` that are published.
+    """
+
+    published_ids = set()
+
+    for chunk in id_chunks(activity_ids, chunk_size):
+        published = execute(
+            supabase
+            .table("published_activities")
+            .select("activity_id")
+            .in_("activity_id", chunk)
+        ).data or []
+
+        published_ids.update(p["activity_id"] for p in published)
+
+    return published_ids
+
+
+@disk_cached(ttl=300)
 def fetch_published_activities_by_school(
     supabase,
     school_id,
@@ -43,7 +84,7 @@ def fetch_published_activities_by_school(
     if end_date:
         query = query.lte("created_at", end_date.isoformat())
 
-    activities = query.execute().data or []
+    activities = execute(query).data or []
 
     if not activities:
         return []
@@ -51,16 +92,7 @@ def fetch_published_activities_by_school(
     activity_ids = [a["id"] for a in activities]
 
     # Step 2: filter published activities
-    published = (
-        supabase
-        .table("published_activities")
-        .select("activity_id")
-        .in_("activity_id", activity_ids)
-        .execute()
-        .data or []
-    )
-
-    published_ids = {p["activity_id"] for p in published}
+    published_ids = fetch_published_activity_ids(supabase, activity_ids)
 
     return [
         a for a in activities if a["id"] in published_ids
@@ -70,103 +102,151 @@ def fetch_published_activities_by_school(
 # --------------------------------------------------
 # ACTIVITY SESSIONS FETCH
 # --------------------------------------------------
-def fetch_activity_sessions(
+SESSION_COLUMNS = "activity_id, start_time, end_time, created_at, status"
+
+COMPLETED_STATUSES = ["completed"]
+
+
+def _activity_sessions_query(
     supabase,
     school_id,
-    activity_ids: List,
+    activity_ids: Optional[List] = None,
     start_date: Optional[date] = None,
-    end_date: Optional[date] = None
-) -> List[Dict]:
-
-    if not activity_ids:
-        return []
+    end_date: Optional[date] = None,
+    columns: str = SESSION_COLUMNS,
+    count: Optional[str] = None,
+    head: Optional[bool] = None
+):
+    """
+    Builds the activity_sessions query shared by the fetch, stream
+    and export paths. `activity_ids=None` selects every activity;
+    otherwise pass at most ID_CHUNK_SIZE ids (see `id_chunks`).
+    Pass `count` and `head=True` for a count-only query.
+    """
 
     query = (
         supabase
         .table("activity_sessions")
-        .select("activity_id, start_time, end_time, created_at, status")
+        .select(columns, count=count, head=head)
         .eq("school_id", school_id)
-        .in_("activity_id", activity_ids)
     )
 
+    if activity_ids is not None:
+        query = query.in_("activity_id", activity_ids)
+
     if start_date:
         query = query.gte("created_at", start_date.isoformat())
     if end_date:
         query = query.lte("created_at", end_date.isoformat())
 
-    return query.execute().data or []
+    return query
 
 
-# --------------------------------------------------
-# UTILITY: TIME CALCULATION
-# --------------------------------------------------
-def _extract_durations(sessions):
-    durations = []
-
-    for s in sessions:
-        start_raw = s.get("start_time")
-        end_raw = s.get("end_time")
-        created_raw = s.get("created_at")
-
-        if not start_raw or not end_raw or not created_raw:
-            continue
+def fetch_activity_sessions(
+    supabase,
+    school_id,
+    activity_ids: List,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> List[Dict]:
 
-        try:
-            # Parse created_at (date source)
-            created_dt = datetime.fromisoformat(
-                created_raw.replace("Z", "+00:00")
-            )
-            base_date = created_dt.date()
+    sessions = []
 
-            # Parse time-only fields
-            start_t = time.fromisoformat(start_raw)
-            end_t = time.fromisoformat(end_raw)
+    for chunk in id_chunks(activity_ids):
+        sessions.extend(
+            execute(
+                _activity_sessions_query(
+                    supabase, school_id, chunk, start_date, end_date
+                )
+            ).data or []
+        )
 
-            # Combine date + time
-            start_dt = datetime.combine(base_date, start_t)
-            end_dt = datetime.combine(base_date, end_t)
+    return sessions
 
-        except Exception:
-            continue
 
-        # Handle cross-midnight sessions (rare but possible)
-        if end_dt < start_dt:
-            end_dt = end_dt.replace(day=end_dt.day + 1)
+def iter_activity_sessions(
+    supabase,
+    school_id,
+    activity_ids: Optional[List] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    columns: str = SESSION_COLUMNS,
+    page_size: int = DEFAULT_PAGE_SIZE
+) -> Iterator[List[Dict]]:
+    """
+    Streams activity sessions page by page, in `created_at` order
+    (per chunk of ID_CHUNK_SIZE activity ids).
+    """
 
-        durations.append((end_dt - start_dt).total_seconds() / 60)
+    if activity_ids is None:
+        return iter_query_pages(
+            lambda: _activity_sessions_query(
+                supabase, school_id, None, start_date, end_date, columns
+            ).order("created_at").order("id"),
+            page_size
+        )
 
-    return durations
+    return itertools.chain.from_iterable(
+        iter_query_pages(
+            lambda chunk=chunk: _activity_sessions_query(
+                supabase, school_id, chunk, start_date, end_date, columns
+            ).order("created_at").order("id"),
+            page_size
+        )
+        for chunk in id_chunks(activity_ids)
+    )
 
 
-# --------------------------------------------------
-# SCHOOL-LEVEL STUDENT ANALYTICS
-# --------------------------------------------------
-def fetch_school_student_stats(
+def fetch_activity_session_batch(
     supabase,
     school_id,
+    activity_ids: List,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None
-) -> Dict:
+) -> SessionBatch:
+    """
+    Fetches activity sessions into a columnar SessionBatch.
+    Rows are consumed page by page, so the full list of session
+    dicts is never held in memory.
+    """
 
-    published_activities = fetch_published_activities_by_school(
-        supabase, school_id, start_date, end_date
-    )
+    batch = SessionBatch()
 
-    activity_ids = [a["id"] for a in published_activities]
+    if not activity_ids:
+        return batch
 
-    sessions = fetch_activity_sessions(
+    for rows in iter_activity_sessions(
         supabase, school_id, activity_ids, start_date, end_date
-    )
+    ):
+        batch.extend(rows)
 
-    durations = _extract_durations(sessions)
+    return batch
 
-    total_sessions = len(sessions)
-    completed_sessions = sum(
-        1 for s in sessions if s["status"] in ("completed", "active")
-    )
+
+# --------------------------------------------------
+# UTILITY: TIME CALCULATION
+# --------------------------------------------------
+def _extract_durations(sessions):
+    durations = []
+
+    for s in sessions:
+        duration = session_duration_minutes(
+            s.get("start_time"), s.get("end_time"), s.get("created_at")
+        )
+
+        if duration is not None:
+            durations.append(duration)
+
+    return durations
+
+
+def _session_stats(batch: SessionBatch) -> Dict:
+    durations = batch.durations(*COMPLETED_STATUSES)
+
+    total_sessions = len(batch)
+    completed_sessions = batch.count_status(*COMPLETED_STATUSES)
 
     return {
-        "total_activities_posted": len(activity_ids),
         "total_sessions_attempted": total_sessions,
         "completion_rate": (
             completed_sessions / total_sessions * 100
@@ -181,9 +261,37 @@ def fetch_school_student_stats(
     }
 
 
+# --------------------------------------------------
+# SCHOOL-LEVEL STUDENT ANALYTICS
+# --------------------------------------------------
+def fetch_school_student_stats(
+    supabase,
+    school_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> Dict:
+    """
+    School-level student stats, computed (and cached) by the shared
+    student metrics engine.
+    """
+
+    from student_metrics import fetch_student_metrics
+
+    metrics = fetch_student_metrics(supabase, school_id, start_date, end_date)
+
+    return {
+        "total_activities_posted": metrics["published_activities"],
+        "total_sessions_attempted": metrics["attempted_sessions"],
+        "completion_rate": metrics["completion_rate"],
+        "mean_time_spent": metrics["mean_time_spent"],
+        "median_time_spent": metrics["median_time_spent"]
+    }
+
+
 # --------------------------------------------------
 # ACTIVITY-LEVEL STUDENT ANALYTICS
 # --------------------------------------------------
+@disk_cached(ttl=300)
 def fetch_activity_student_stats(
     supabase,
     school_id,
@@ -192,7 +300,7 @@ def fetch_activity_student_stats(
     end_date: Optional[date] = None
 ) -> Dict:
 
-    sessions = fetch_activity_sessions(
+    batch = fetch_activity_session_batch(
         supabase,
         school_id,
         [activity_id],
@@ -200,23 +308,4 @@ def fetch_activity_student_stats(
         end_date
     )
 
-    durations = _extract_durations(sessions)
-
-    total_sessions = len(sessions)
-    completed_sessions = sum(
-        1 for s in sessions if s["status"] in ("completed", "active")
-    )
-
-    return {
-        "total_sessions_attempted": total_sessions,
-        "completion_rate": (
-            completed_sessions / total_sessions * 100
-            if total_sessions else 0
-        ),
-        "mean_time_spent": (
-            statistics.mean(durations) if durations else 0
-        ),
-        "median_time_spent": (
-            statistics.median(durations) if durations else 0
-        )
-    }
\ No newline at end of file
+    return _session_stats(batch)
@@ -5,6 +5,7 @@ Database functions used to fetch various statistics from the Supabase students d
 3. get_completed_sessions_count
 4. get_ongoing_sessions_count
 5. get_completed_session_median_time
+6. get_completed_session_mean_time
 
 '''
 from supabase import create_client, Client
@@ -14,6 +15,9 @@ import statistics
 from dotenv import load_dotenv
 import os
 
+from persistent_cache import disk_cached
+from resilience import execute, client_options
+
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -21,9 +25,11 @@ SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
 supabase: Client = create_client(
     SUPABASE_URL,
-    SUPABASE_SERVICE_ROLE_KEY
+    SUPABASE_SERVICE_ROLE_KEY,
+    options=client_options()
 )
 
+@disk_cached(ttl=300)
 def fetch_attempted_sessions_count(
         supabase,
         school_id,
@@ -37,16 +43,17 @@ def fetch_attempted_sessions_count(
         "p_end_date": end_date.isoformat() if end_date else None,
     }
 
-    response = supabase.rpc(
+    response = execute(supabase.rpc(
         "get_attempted_sessions_count",
         params
-    ).execute()
+    ))
 
     if response.data is None:
         return 0
     
     return response.data
 
+@disk_cached(ttl=300)
 def fetch_total_published_activities(
         supabase,
         school_id, 
@@ -59,10 +66,10 @@ def fetch_total_published_activities(
         "p_end_date": end_date.isoformat() if end_date else None,
     }
 
-    response = supabase.rpc(
+    response = execute(supabase.rpc(
         "get_total_published_activities",
         params
-    ).execute()
+    ))
 
     if response.data is None:
         return 0
@@ -70,6 +77,7 @@ def fetch_total_published_activities(
     return response.data
 
 
+@disk_cached(ttl=300)
 def fetch_completed_sessions_count(
     supabase,
     school_id,
@@ -87,10 +95,10 @@ def fetch_completed_sessions_count(
         "p_end_date": end_date.isoformat() if end_date else None,
     }
 
-    response = supabase.rpc(
+    response = execute(supabase.rpc(
         "get_completed_sessions_count",
         params
-    ).execute()
+    ))
 
     if response.data is None:
         return 0
@@ -98,6 +106,7 @@ def fetch_completed_sessions_count(
     return response.data
 
 
+@disk_cached(ttl=300)
 def fetch_ongoing_sessions_count(
     supabase,
     school_id,
@@ -115,10 +124,10 @@ def fetch_ongoing_sessions_count(
         "p_end_date": end_date.isoformat() if end_date else None,
     }
 
-    response = supabase.rpc(
+    response = execute(supabase.rpc(
         "get_ongoing_sessions_count",
         params
-    ).execute()
+    ))
 
     if response.data is None:
         return 0
@@ -126,6 +135,7 @@ def fetch_ongoing_sessions_count(
     return response.data
 
 
+@disk_cached(ttl=300)
 def fetch_completed_session_median_time(
     supabase,
     school_id,
@@ -143,10 +153,64 @@ def fetch_completed_session_median_time(
         "p_end_date": end_date.isoformat() if end_date else None,
     }
 
-    response = supabase.rpc(
+    response = execute(supabase.rpc(
         "get_completed_session_median_time",
         params
-    ).execute()
+    ))
+
+    return float(response.data or 0)
+
+
+@disk_cached(ttl=300)
+def fetch_completed_session_mean_time(
+    supabase,
+    school_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> float:
+    """
+    Returns mean time (in minutes) for COMPLETED sessions
+    of published activities. Durations follow
+    records.session_duration_minutes (end before start wraps past
+    midnight). The database function:
+
+    create or replace function get_completed_session_mean_time(
+        p_school_id uuid,
+        p_start_date date default null,
+        p_end_date date default null
+    ) returns double precision
+    language sql stable as $$
+        select avg(extract(epoch from
+            case when s.end_time < s.start_time
+                 then s.end_time - s.start_time + interval '1 day'
+                 else s.end_time - s.start_time end
+        ) / 60)
+        from activity_sessions s
+        join activities a on a.id = s.activity_id
+        join published_activities p on p.activity_id = a.id
+        where s.school_id = p_school_id
+          and a.school_id = p_school_id
+          and s.status = 'completed'
+          and s.start_time is not null
+          and s.end_time is not null
+          and s.created_at is not null
+          and (p_start_date is null or s.created_at >= p_start_date)
+          and (p_end_date is null or s.created_at <= p_end_date)
+          and (p_start_date is null or a.created_at >= p_start_date)
+          and (p_end_date is null or a.created_at <= p_end_date)
+    $$;
+    """
+
+    params = {
+        "p_school_id": school_id,
+        "p_start_date": start_date.isoformat() if start_date else None,
+        "p_end_date": end_date.isoformat() if end_date else None,
+    }
+
+    response = execute(supabase.rpc(
+        "get_completed_session_mean_time",
+        params
+    ))
 
     return float(response.data or 0)
 
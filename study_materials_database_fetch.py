@@ -2,52 +2,118 @@ from supabase import create_client, Client
 from dotenv import load_dotenv
 import os
 from datetime import date
-from typing import Dict, Optional
+from typing import Dict, Iterator, List, Optional
+
+from database_utils import (
+    check_count_method,
+    count_many,
+    iter_query_pages,
+    DEFAULT_PAGE_SIZE
+)
+from persistent_cache import disk_cached
 
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-def fetch_study_material_stats(
+TOOL_RUN_COLUMNS = "kind,status"
+
+
+def _tool_runs_query(
         supabase,
-        school_id, 
+        school_id,
         start_date: Optional[date] = None,
-        end_date: Optional[date] = None
-) -> Dict:
-    
-    response = (
+        end_date: Optional[date] = None,
+        columns: str = TOOL_RUN_COLUMNS,
+        count: Optional[str] = None,
+        head: Optional[bool] = None
+):
+    """
+    Builds the student_tool_runs query shared by the stats, stream
+    and export paths. Pass `count` and `head=True` for a count-only
+    query.
+    """
+
+    query = (
         supabase
         .table("student_tool_runs")
-        .select("kind,status")
+        .select(columns, count=count, head=head)
         .eq("school_id", school_id)
     )
 
     if start_date:
-        response = response.gte("created_at",start_date.isoformat())
+        query = query.gte("created_at", start_date.isoformat())
 
     if end_date:
-        response = response.lte("created_at",start_date.isoformat())
+        query = query.lte("created_at", end_date.isoformat())
+
+    return query
 
-    query = response.execute()
-    data = query.data or []
 
-    flashcards_count = 0
-    quiz_count = 0
-    total_runs = len(data)
-    failed_runs = 0
+def iter_tool_runs(
+        supabase,
+        school_id,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        columns: str = TOOL_RUN_COLUMNS,
+        page_size: int = DEFAULT_PAGE_SIZE
+) -> Iterator[List[Dict]]:
+    """
+    Streams student tool runs page by page, in `created_at` order.
+    """
+
+    return iter_query_pages(
+        lambda: _tool_runs_query(
+            supabase, school_id, start_date, end_date, columns
+        ).order("created_at").order("id"),
+        page_size
+    )
+
+
+@disk_cached(ttl=300)
+def fetch_study_material_stats(
+        supabase,
+        school_id,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        count: str = "exact"
+) -> Dict:
+    """
+    Flashcard, quiz, total and failed run counts for a school.
+    Four count-only queries; no rows are transferred.
+    """
+    check_count_method(count)
 
-    for row in data:
-        kind = row.get("kind")
-        status = row.get("status")
+    def count_query(kind=None, status=None):
+        def build():
+            query = _tool_runs_query(
+                supabase,
+                school_id,
+                start_date,
+                end_date,
+                columns="kind",
+                count=count,
+                head=True
+            )
+            if kind:
+                query = query.eq("kind", kind)
+            if status:
+                query = query.eq("status", status)
+            return query
+        return build
 
-        if kind == "flashcards":
-            flashcards_count += 1
-        elif kind == "quiz":
-            quiz_count += 1
+    counts = count_many({
+        "total_runs": count_query(),
+        "flashcards_count": count_query(kind="flashcards"),
+        "quiz_count": count_query(kind="quiz"),
+        "failed_runs": count_query(status="failed"),
+    })
 
-        if status == "failed":
-            failed_runs += 1
+    flashcards_count = counts["flashcards_count"]
+    quiz_count = counts["quiz_count"]
+    total_runs = counts["total_runs"]
+    failed_runs = counts["failed_runs"]
 
     failure_percentage = (
         (failed_runs / total_runs) * 100
@@ -61,4 +127,4 @@ def fetch_study_material_stats(
         "total_runs": total_runs,
         "failed_runs": failed_runs,
         "failure_percentage": failure_percentage,
-    }
\ No newline at end of file
+    }
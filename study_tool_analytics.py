@@ -0,0 +1,254 @@
+'''
+Time-bucketed study-tool analytics:
+1. fetch_tool_run_counts
+2. tool_run_trends
+
+Counts come from a grouped RPC when deployed, from count-only (HEAD)
+queries per bucket for short ranges, and otherwise from a streamed,
+vectorized pass over (kind, status, created_at).
+'''
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from database_utils import count_many, rpc_params, try_rpc
+from persistent_cache import disk_cached
+from resilience import execute
+from study_materials_database_fetch import _tool_runs_query, iter_tool_runs
+
+TOOL_KINDS = ("flashcards", "quiz")
+OTHER = "other"
+FAILED = "failed"
+
+FREQS = {"day": "D", "week": "W"}
+
+COUNT_COLUMNS = ["period", "kind", "status", "runs"]
+
+# Above this many HEAD requests, streaming the rows is cheaper
+MAX_HEAD_COUNT_QUERIES = 120
+
+
+# --------------------------------------------------
+# UTILITY: BUCKETS
+# --------------------------------------------------
+def _bucket_start(day: date, freq: str) -> date:
+    if freq == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def _buckets(start_date: date, end_date: date, freq: str) -> List[Tuple[date, date]]:
+    """
+    [start, next_start) bucket bounds covering start_date..end_date.
+    """
+
+    step = timedelta(days=7 if freq == "week" else 1)
+    bucket = _bucket_start(start_date, freq)
+
+    buckets = []
+    while bucket <= end_date:
+        buckets.append((bucket, bucket + step))
+        bucket += step
+
+    return buckets
+
+
+def _run_date_bounds(supabase, school_id) -> Optional[Tuple[date, date]]:
+    """
+    First and last tool run dates for a school.
+    """
+
+    bounds = []
+    for desc in (False, True):
+        rows = execute(
+            _tool_runs_query(supabase, school_id, columns="created_at")
+            .order("created_at", desc=desc)
+            .limit(1)
+        ).data or []
+        if not rows:
+            return None
+        bounds.append(pd.Timestamp(rows[0]["created_at"]).date())
+
+    return bounds[0], bounds[1]
+
+
+# --------------------------------------------------
+# COUNT STRATEGIES
+# --------------------------------------------------
+def _counts_from_rpc(supabase, school_id, start_date, end_date, freq):
+    data = try_rpc(
+        supabase,
+        "get_tool_run_counts",
+        {
+            **rpc_params(school_id, start_date, end_date),
+            "p_bucket": freq,
+        }
+    )
+
+    if data is None:
+        return None
+
+    df = pd.DataFrame(data, columns=COUNT_COLUMNS)
+    df["period"] = pd.to_datetime(df["period"]).dt.tz_localize(None)
+    return df
+
+
+def _counts_from_head_queries(supabase, school_id, buckets, start_date, end_date):
+    """
+    Six HEAD requests per bucket: total, failed, and for each known
+    kind its total and failed. Unknown kinds are reported as "other".
+    """
+
+    def build(bucket, kind=None, failed=False):
+        def query():
+            q = _tool_runs_query(
+                supabase,
+                school_id,
+                start_date=max(bucket[0], start_date) if start_date else bucket[0],
+                end_date=end_date,
+                columns="kind",
+                count="exact",
+                head=True
+            ).lt("created_at", bucket[1].isoformat())
+            if kind:
+                q = q.eq("kind", kind)
+            if failed:
+                q = q.eq("status", FAILED)
+            return q
+        return query
+
+    queries = {}
+    for bucket in buckets:
+        for kind in (None,) + TOOL_KINDS:
+            queries[(bucket, kind, False)] = build(bucket, kind)
+            queries[(bucket, kind, True)] = build(bucket, kind, True)
+
+    counts = count_many(queries)
+
+    rows = []
+    for bucket in buckets:
+        other_total = counts[(bucket, None, False)]
+        other_failed = counts[(bucket, None, True)]
+
+        for kind in TOOL_KINDS:
+            total = counts[(bucket, kind, False)]
+            failed = counts[(bucket, kind, True)]
+            other_total -= total
+            other_failed -= failed
+            rows.append((bucket[0], kind, FAILED, failed))
+            rows.append((bucket[0], kind, OTHER, total - failed))
+
+        rows.append((bucket[0], OTHER, FAILED, other_failed))
+        rows.append((bucket[0], OTHER, OTHER, other_total - other_failed))
+
+    df = pd.DataFrame(rows, columns=COUNT_COLUMNS)
+    df["period"] = pd.to_datetime(df["period"])
+    return df[df["runs"] > 0].reset_index(drop=True)
+
+
+def _counts_from_stream(supabase, school_id, start_date, end_date, freq):
+    totals = []
+
+    pages = iter_tool_runs(
+        supabase,
+        school_id,
+        start_date,
+        end_date,
+        columns="kind,status,created_at"
+    )
+
+    for rows in pages:
+        df = pd.DataFrame(rows)
+        df["period"] = (
+            pd.to_datetime(df["created_at"], utc=True, errors="coerce")
+            .dt.tz_localize(None)
+            .dt.to_period(FREQS[freq])
+            .dt.start_time
+        )
+        df["kind"] = df["kind"].where(df["kind"].isin(TOOL_KINDS), OTHER)
+        df["status"] = df["status"].fillna(OTHER)
+        totals.append(df.groupby(["period", "kind", "status"]).size())
+
+    if not totals:
+        return pd.DataFrame(columns=COUNT_COLUMNS)
+
+    return (
+        pd.concat(totals)
+        .groupby(level=[0, 1, 2])
+        .sum()
+        .rename("runs")
+        .reset_index()
+    )
+
+
+# --------------------------------------------------
+# ENGINE
+# --------------------------------------------------
+@disk_cached(ttl=300)
+def fetch_tool_run_counts(
+    supabase,
+    school_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    freq: str = "day"
+) -> pd.DataFrame:
+    """
+    Tool run counts per period ("day" or "week"), kind and status.
+
+    Returns columns period, kind, status, runs. Kinds other than
+    flashcards / quiz are reported as "other". On the HEAD-count path
+    statuses are reduced to "failed" / "other".
+    """
+
+    if freq not in FREQS:
+        raise ValueError(f"Unsupported bucket: {freq}")
+
+    counts = _counts_from_rpc(supabase, school_id, start_date, end_date, freq)
+    if counts is not None:
+        return counts
+
+    first, last = start_date, end_date
+    if first is None or last is None:
+        bounds = _run_date_bounds(supabase, school_id)
+        if bounds is None:
+            return pd.DataFrame(columns=COUNT_COLUMNS)
+        first = first or bounds[0]
+        last = last or bounds[1]
+
+    buckets = _buckets(first, last, freq)
+    n_queries = len(buckets) * 2 * (len(TOOL_KINDS) + 1)
+
+    if n_queries <= MAX_HEAD_COUNT_QUERIES:
+        return _counts_from_head_queries(
+            supabase, school_id, buckets, start_date, end_date
+        )
+
+    return _counts_from_stream(supabase, school_id, start_date, end_date, freq)
+
+
+def tool_run_trends(counts: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per period and kind: runs, failed runs and failure rate (%).
+    """
+
+    if counts.empty:
+        return pd.DataFrame(
+            columns=["period", "kind", "runs", "failed", "failure_rate"]
+        )
+
+    counts = counts.assign(
+        failed=counts["runs"].where(counts["status"] == FAILED, 0)
+    )
+
+    trends = (
+        counts
+        .groupby(["period", "kind"], as_index=False)[["runs", "failed"]]
+        .sum()
+    )
+
+    trends["failure_rate"] = (
+        trends["failed"] / trends["runs"].where(trends["runs"] > 0) * 100
+    ).fillna(0)
+
+    return trends
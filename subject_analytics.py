@@ -0,0 +1,187 @@
+'''
+Subject-level breakdown of teacher activity:
+1. fetch_subject_breakdown
+
+All subjects (and teachers) are computed together from one activities
+fetch, one published-ids lookup and one streamed sessions pass; there
+is never a request per subject or per teacher.
+'''
+from datetime import date
+from typing import List, Optional
+
+import pandas as pd
+
+from database_utils import rpc_params, try_rpc
+from persistent_cache import disk_cached
+from fast_frames import fetch_school_activities_frame
+from students_database_fetch import (
+    fetch_published_activity_ids,
+    iter_activity_sessions
+)
+
+UNSPECIFIED_SUBJECT = "Unspecified"
+
+BREAKDOWN_METRICS = ["activities", "published", "published_ratio", "sessions"]
+
+# Period lengths accepted for `freq`
+PERIODS = {"day": "D", "week": "W", "month": "M"}
+
+
+# --------------------------------------------------
+# UTILITY: GROUPING KEYS
+# --------------------------------------------------
+def _period_start(timestamps: pd.Series, freq: str) -> pd.Series:
+    return (
+        pd.to_datetime(timestamps, utc=True, errors="coerce")
+        .dt.tz_localize(None)
+        .dt.to_period(PERIODS[freq])
+        .dt.start_time
+    )
+
+
+def _group_keys(by_teacher: bool, freq: Optional[str]) -> List[str]:
+    keys = ["subject"]
+    if by_teacher:
+        keys.append("creator_id")
+    if freq:
+        keys.append("period")
+    return keys
+
+
+def _empty_breakdown(keys: List[str]) -> pd.DataFrame:
+    return pd.DataFrame(columns=keys + BREAKDOWN_METRICS)
+
+
+# --------------------------------------------------
+# SESSIONS PER ACTIVITY
+# --------------------------------------------------
+def _session_counts(
+    supabase,
+    school_id,
+    activities: pd.DataFrame,
+    keys: List[str],
+    start_date: Optional[date],
+    end_date: Optional[date],
+    freq: Optional[str]
+) -> pd.Series:
+    """
+    Session counts grouped by `keys`. Sessions are attributed to their
+    activity's subject / teacher, and to the period they started in.
+    """
+
+    lookup = activities.set_index("id")[["subject", "creator_id"]]
+    totals = []
+
+    if not freq:
+        data = try_rpc(
+            supabase,
+            "get_session_counts_by_activity",
+            rpc_params(school_id, start_date, end_date)
+        )
+
+        if data is not None:
+            counts = pd.DataFrame(data, columns=["activity_id", "sessions"])
+            counts = counts.join(lookup, on="activity_id", how="inner")
+            return counts.groupby(keys)["sessions"].sum()
+
+    pages = iter_activity_sessions(
+        supabase,
+        school_id,
+        start_date=start_date,
+        end_date=end_date,
+        columns="activity_id, created_at"
+    )
+
+    for rows in pages:
+        page = pd.DataFrame(rows).join(lookup, on="activity_id", how="inner")
+
+        if page.empty:
+            continue
+
+        if freq:
+            page["period"] = _period_start(page["created_at"], freq)
+
+        totals.append(page.groupby(keys).size())
+
+    if not totals:
+        return pd.Series(dtype="int64", name="sessions")
+
+    return (
+        pd.concat(totals)
+        .groupby(level=list(range(len(keys))))
+        .sum()
+        .rename("sessions")
+    )
+
+
+# --------------------------------------------------
+# SUBJECT BREAKDOWN
+# --------------------------------------------------
+@disk_cached(ttl=300)
+def fetch_subject_breakdown(
+    supabase,
+    school_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    by_teacher: bool = False,
+    freq: Optional[str] = None
+) -> pd.DataFrame:
+    """
+    Activities, published activities, published ratio (%) and student
+    sessions per subject for a school.
+
+    by_teacher: also group by `creator_id`.
+    freq: "day", "week" or "month" to also group by `period`
+          (activity creation period / session start period).
+    """
+
+    keys = _group_keys(by_teacher, freq)
+
+    activities = fetch_school_activities_frame(
+        supabase, school_id, start_date, end_date
+    )
+
+    if activities.empty:
+        return _empty_breakdown(keys)
+
+    activities["subject"] = (
+        activities["subject"]
+        .fillna(UNSPECIFIED_SUBJECT)
+        .replace("", UNSPECIFIED_SUBJECT)
+    )
+
+    published_ids = fetch_published_activity_ids(
+        supabase, activities["id"].tolist()
+    )
+    activities["published"] = activities["id"].isin(published_ids)
+
+    if freq:
+        activities["period"] = _period_start(activities["created_at"], freq)
+
+    breakdown = activities.groupby(keys).agg(
+        activities=("id", "size"),
+        published=("published", "sum"),
+    )
+
+    sessions = _session_counts(
+        supabase,
+        school_id,
+        activities[activities["published"]],
+        keys,
+        start_date,
+        end_date,
+        freq
+    )
+
+    breakdown = breakdown.join(sessions, how="outer").fillna(0)
+    breakdown = breakdown.astype(
+        {"activities": "int64", "published": "int64", "sessions": "int64"}
+    )
+
+    breakdown["published_ratio"] = (
+        breakdown["published"]
+        / breakdown["activities"].where(breakdown["activities"] > 0)
+        * 100
+    ).fillna(0)
+
+    return breakdown.reset_index()[keys + BREAKDOWN_METRICS]
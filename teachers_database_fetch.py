@@ -3,7 +3,20 @@ from datetime import date
 from typing import Optional, Dict, List
 
 from dotenv import load_dotenv
+from collections import OrderedDict
 import os
+import re
+import threading
+import time
+
+from database_utils import (
+    count_rows,
+    fetch_grouped_counts,
+    iter_query_pages,
+    rpc_params
+)
+from persistent_cache import disk_cached
+from resilience import execute, client_options
 
 load_dotenv()
 
@@ -12,22 +25,23 @@ SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
 supabase: Client = create_client(
     SUPABASE_URL,
-    SUPABASE_SERVICE_ROLE_KEY
+    SUPABASE_SERVICE_ROLE_KEY,
+    options=client_options()
 )
 
 # --------------------------------------------------
 # SCHOOLS
 # --------------------------------------------------
+@disk_cached(ttl=300)
 def fetch_schools(supabase) -> List[Dict]:
     """
     Fetch all schools (id + name).
     """
-    response = (
+    response = execute(
         supabase
         .table("schools")
         .select("id, school_name")
         .order("school_name", desc=False)
-        .execute()
     )
 
     return response.data or []
@@ -36,40 +50,188 @@ def fetch_schools(supabase) -> List[Dict]:
 # --------------------------------------------------
 # TEACHERS
 # --------------------------------------------------
+@disk_cached(ttl=600)
 def fetch_teachers_by_school(supabase, school_id) -> List[Dict]:
     """
-    Fetch all teachers for a given school.
+    Fetch all teachers for a given school, paged past the server's
+    row limit.
     """
-    response = (
-        supabase
+    teachers = []
+
+    for rows in iter_query_pages(
+        lambda: supabase
         .table("profiles")
         .select("id, first_name, last_name, email")
         .eq("school_id", school_id)
         .eq("role", "teacher")
         .order("first_name", desc=False)
-        .execute()
+        .order("id")
+    ):
+        teachers.extend(rows)
+
+    return teachers
+
+
+# --------------------------------------------------
+# TEACHER SEARCH (TYPE-AHEAD)
+# --------------------------------------------------
+TEACHER_COLUMNS = "id, first_name, last_name, email"
+TEACHER_SEARCH_FIELDS = ("first_name", "last_name", "email")
+TEACHER_SEARCH_LIMIT = 20
+
+SEARCH_CACHE_SIZE = 256
+SEARCH_CACHE_TTL = 60  # seconds
+
+# Characters with meaning in PostgREST filter strings; dropped from terms
+_SEARCH_SPECIAL = re.compile(r'[,()"*\\:]')
+
+# LIKE wildcards; matched literally once escaped
+_LIKE_WILDCARDS = re.compile(r"([%_])")
+
+_search_lock = threading.Lock()
+_search_cache: "OrderedDict" = OrderedDict()
+
+
+def _search_terms(text: str) -> List[str]:
+    return _SEARCH_SPECIAL.sub(" ", text or "").lower().split()
+
+
+def _like_prefix(term: str) -> str:
+    """
+    ILIKE prefix pattern matching `term` literally, so "a_b" does not
+    also match "axb".
+    """
+    return _LIKE_WILDCARDS.sub(r"\\\1", term) + "*"
+
+
+def _matches(teacher: Dict, terms: List[str]) -> bool:
+    values = [(teacher.get(f) or "").lower() for f in TEACHER_SEARCH_FIELDS]
+    return all(any(v.startswith(t) for v in values) for t in terms)
+
+
+def _cached_search(key):
+    with _search_lock:
+        entry = _search_cache.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        _search_cache.move_to_end(key)
+        return entry[1]
+
+
+def _remember_search(key, result: Dict) -> None:
+    with _search_lock:
+        _search_cache[key] = (time.monotonic() + SEARCH_CACHE_TTL, result)
+        _search_cache.move_to_end(key)
+        while len(_search_cache) > SEARCH_CACHE_SIZE:
+            _search_cache.popitem(last=False)
+
+
+def _narrow_cached_search(
+    school_id,
+    terms: List[str],
+    limit: int
+) -> Optional[List[Dict]]:
+    """
+    While typing, a query that extends an earlier one matches a subset
+    of its results. If that earlier lookup was complete (one page, no
+    more rows), the new results are filtered from it locally.
+    """
+
+    text = " ".join(terms)
+
+    for cut in range(len(text) - 1, -1, -1):
+        entry = _cached_search((school_id, text[:cut], 0, limit))
+        if entry is not None and not entry["has_more"]:
+            return [t for t in entry["teachers"] if _matches(t, terms)]
+
+    return None
+
+
+def search_teachers(
+    supabase,
+    school_id,
+    text: str = "",
+    limit: int = TEACHER_SEARCH_LIMIT,
+    offset: int = 0
+) -> Dict:
+    """
+    Teachers of a school whose first name, last name or email starts
+    with every word of `text` (case-insensitive), one page at a time.
+
+    Returns {"teachers": [...], "has_more": bool}. Each word becomes one
+    prefix ILIKE filter, so trigram / lower() indexes on the three
+    columns keep this fast for schools with thousands of staff.
+    """
+
+    terms = _search_terms(text)
+    key = (school_id, " ".join(terms), offset, limit)
+
+    cached = _cached_search(key)
+    if cached is not None:
+        return cached
+
+    if offset == 0:
+        narrowed = _narrow_cached_search(school_id, terms, limit)
+        if narrowed is not None:
+            result = {"teachers": narrowed, "has_more": False}
+            _remember_search(key, result)
+            return result
+
+    query = (
+        supabase
+        .table("profiles")
+        .select(TEACHER_COLUMNS)
+        .eq("school_id", school_id)
+        .eq("role", "teacher")
     )
 
-    return response.data or []
+    for term in terms:
+        query = query.or_(
+            ",".join(
+                f"{f}.ilike.{_like_prefix(term)}" for f in TEACHER_SEARCH_FIELDS
+            )
+        )
+
+    # One extra row tells whether another page exists
+    response = execute(
+        query
+        .order("first_name", desc=False)
+        .order("last_name", desc=False)
+        .order("id", desc=False)
+        .range(offset, offset + limit)
+    )
+
+    rows = response.data or []
+    result = {"teachers": rows[:limit], "has_more": len(rows) > limit}
+
+    _remember_search(key, result)
+    return result
 
 
 # --------------------------------------------------
 # ACTIVITIES (TEACHER LEVEL)
 # --------------------------------------------------
-def fetch_activities_by_teacher(
+ACTIVITY_COLUMNS = "id, name, subject, created_at"
+
+
+def _activities_by_teacher_query(
     supabase,
     teacher_id,
     start_date: Optional[date] = None,
-    end_date: Optional[date] = None
-) -> List[Dict]:
+    end_date: Optional[date] = None,
+    columns: str = ACTIVITY_COLUMNS,
+    count: Optional[str] = None,
+    head: Optional[bool] = None
+):
     """
-    Fetch activities created by a teacher with optional date filtering.
+    Builds the activities query shared by the row and frame fetches.
+    Pass `count` and `head=True` for a count-only query.
     """
 
     query = (
         supabase
         .table("activities")
-        .select("id, name, subject, created_at")
+        .select(columns, count=count, head=head)
         .eq("creator_id", teacher_id)
     )
 
@@ -79,10 +241,24 @@ def fetch_activities_by_teacher(
     if end_date:
         query = query.lte("created_at", end_date.isoformat())
 
-    response = (
-        query
-        .order("created_at", desc=True)
-        .execute()
+    return query.order("created_at", desc=True)
+
+
+@disk_cached(ttl=300)
+def fetch_activities_by_teacher(
+    supabase,
+    teacher_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> List[Dict]:
+    """
+    Fetch activities created by a teacher with optional date filtering.
+    """
+
+    response = execute(
+        _activities_by_teacher_query(
+            supabase, teacher_id, start_date, end_date
+        )
     )
 
     return response.data or []
@@ -91,22 +267,27 @@ def fetch_activities_by_teacher(
 # --------------------------------------------------
 # SCHOOL-LEVEL ANALYTICS
 # --------------------------------------------------
-def fetch_school_activity_stats(
+SCHOOL_ACTIVITY_COLUMNS = "id, subject, creator_id, created_at"
+
+
+def _school_activities_query(
     supabase,
     school_id,
     start_date: Optional[date] = None,
-    end_date: Optional[date] = None
-) -> Dict:
+    end_date: Optional[date] = None,
+    columns: str = SCHOOL_ACTIVITY_COLUMNS,
+    count: Optional[str] = None,
+    head: Optional[bool] = None
+):
     """
-    Returns:
-    - total_activities
-    - median_activities_per_teacher
+    Builds the query for all activities of a school.
+    Pass `count` and `head=True` for a count-only query.
     """
 
     query = (
         supabase
         .table("activities")
-        .select("creator_id")
+        .select(columns, count=count, head=head)
         .eq("school_id", school_id)
     )
 
@@ -116,22 +297,72 @@ def fetch_school_activity_stats(
     if end_date:
         query = query.lte("created_at", end_date.isoformat())
 
-    response = query.execute()
+    return query
+
+
+@disk_cached(ttl=300)
+def fetch_activity_counts_by_teacher(
+    supabase,
+    school_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> Dict:
+    """
+    Returns {creator_id: number of activities} for a school.
+
+    Uses the grouped `get_activity_counts_by_creator` RPC when deployed;
+    otherwise pages through the `creator_id` column only.
+    """
+
+    teacher_counts = fetch_grouped_counts(
+        supabase,
+        "get_activity_counts_by_creator",
+        rpc_params(school_id, start_date, end_date),
+        "creator_id"
+    )
+
+    if teacher_counts is not None:
+        return teacher_counts
 
-    data = response.data or []
+    teacher_counts = {}
 
-    if not data:
+    pages = iter_query_pages(
+        lambda: _school_activities_query(
+            supabase, school_id, start_date, end_date, "creator_id"
+        ).order("id")
+    )
+
+    for rows in pages:
+        for row in rows:
+            teacher_id = row["creator_id"]
+            teacher_counts[teacher_id] = teacher_counts.get(teacher_id, 0) + 1
+
+    return teacher_counts
+
+
+@disk_cached(ttl=300)
+def fetch_school_activity_stats(
+    supabase,
+    school_id,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> Dict:
+    """
+    Returns:
+    - total_activities
+    - median_activities_per_teacher
+    """
+
+    teacher_counts = fetch_activity_counts_by_teacher(
+        supabase, school_id, start_date, end_date
+    )
+
+    if not teacher_counts:
         return {
             "total_activities": 0,
             "median_activities_per_teacher": 0
         }
 
-    # Count activities per teacher
-    teacher_counts = {}
-    for row in data:
-        teacher_id = row["creator_id"]
-        teacher_counts[teacher_id] = teacher_counts.get(teacher_id, 0) + 1
-
     counts = sorted(teacher_counts.values())
     total_activities = sum(counts)
 
@@ -150,6 +381,7 @@ def fetch_school_activity_stats(
 # --------------------------------------------------
 # TEACHER-LEVEL ANALYTICS
 # --------------------------------------------------
+@disk_cached(ttl=300)
 def fetch_teacher_activity_count(
     supabase,
     teacher_id,
@@ -160,18 +392,14 @@ def fetch_teacher_activity_count(
     Returns total number of activities created by a teacher.
     """
 
-    query = (
-        supabase
-        .table("activities")
-        .select("id", count="exact")
-        .eq("creator_id", teacher_id)
-    )
-
-    if start_date:
-        query = query.gte("created_at", start_date.isoformat())
-
-    if end_date:
-        query = query.lte("created_at", end_date.isoformat())
-
-    response = query.execute()
-    return response.count or 0
\ No newline at end of file
+    return count_rows(
+        _activities_by_teacher_query(
+            supabase,
+            teacher_id,
+            start_date,
+            end_date,
+            columns="id",
+            count="exact",
+            head=True
+        )
+    )
\ No newline at end of file
@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+import analytics_api
+from analytics_api import AnalyticsAPI
+
+
+def _request(api, raw: bytes) -> bytes:
+    async def run():
+        server = await asyncio.start_server(api.handle_connection, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(raw)
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            return response
+
+    return asyncio.run(run())
+
+
+def test_malformed_content_length_gets_400():
+    response = _request(
+        AnalyticsAPI(None),
+        b"GET /health HTTP/1.1\r\nHost: x\r\nContent-Length: abc\r\n\r\n"
+    )
+
+    assert response.startswith(b"HTTP/1.1 400 ")
+    assert b"Connection: close" in response
+
+
+def test_negative_content_length_gets_400():
+    response = _request(
+        AnalyticsAPI(None),
+        b"GET /health HTTP/1.1\r\nHost: x\r\nContent-Length: -5\r\n\r\n"
+    )
+
+    assert response.startswith(b"HTTP/1.1 400 ")
+
+
+def test_cache_key_ignores_unknown_parameters(monkeypatch):
+    calls = []
+
+    def view(supabase, school_id, params):
+        calls.append(params)
+        return {"school_id": school_id}
+
+    monkeypatch.setitem(analytics_api.VIEWS, "activity-stats", view)
+    api = AnalyticsAPI(None)
+
+    async def run():
+        first = await api.dispatch("/schools/s1/activity-stats?start=2025-01-01&x=1")
+        second = await api.dispatch("/schools/s1/activity-stats?start=2025-01-01&x=2")
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert first[0] == second[0] == 200
+    assert json.loads(first[1]) == {"school_id": "s1"}
+    assert calls == [{"start": "2025-01-01"}]
+    assert len(api.cache._entries) == 1
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from concurrency_governor import (
+    BACKGROUND,
+    EXPORT,
+    INTERACTIVE,
+    PRIORITY_AGING,
+    ConcurrencyGovernor,
+    _Waiter
+)
+
+
+def _queue_behind_held_slot(governor, priorities):
+    """
+    Queues one caller per priority, in order, while the only slot is
+    held; returns the order in which they were admitted.
+    """
+
+    admitted = []
+    threads = []
+
+    for priority in priorities:
+        def call(priority=priority):
+            governor.acquire("schools", priority)
+            admitted.append(priority)
+            governor.release("schools")
+
+        thread = threading.Thread(target=call)
+        thread.start()
+        threads.append(thread)
+
+        while len(governor.waiters) < len(threads):
+            time.sleep(0.01)
+
+    governor.release("schools")
+    for thread in threads:
+        thread.join(timeout=5)
+
+    return admitted
+
+
+def test_waiters_are_admitted_by_priority_then_age():
+    governor = ConcurrencyGovernor(max_concurrent=1)
+    governor.acquire("schools", INTERACTIVE)
+
+    admitted = _queue_behind_held_slot(
+        governor, [EXPORT, BACKGROUND, INTERACTIVE, BACKGROUND, INTERACTIVE]
+    )
+
+    assert admitted == [INTERACTIVE, INTERACTIVE, BACKGROUND, BACKGROUND, EXPORT]
+
+
+def test_long_waiting_export_overtakes_newer_interactive_call():
+    governor = ConcurrencyGovernor(max_concurrent=1)
+
+    export = _Waiter("schools", EXPORT, seq=0)
+    export.queued_at -= 2 * PRIORITY_AGING
+    interactive = _Waiter("schools", INTERACTIVE, seq=1)
+    governor.waiters = [interactive, export]
+
+    assert governor._next_waiter() is export
+
+
+def test_aging_raises_priority_one_level_per_interval():
+    background = _Waiter("schools", BACKGROUND, seq=0)
+    export = _Waiter("schools", EXPORT, seq=1)
+    export.queued_at -= PRIORITY_AGING
+
+    now = time.monotonic()
+    assert background.rank(now) < export.rank(now)
+    assert export.rank(now)[0] == BACKGROUND
+
+
+def test_table_limit_does_not_block_other_tables():
+    governor = ConcurrencyGovernor(
+        max_concurrent=4, table_limits={"activity_sessions": 1}
+    )
+    governor.acquire("activity_sessions", EXPORT)
+
+    blocked = _Waiter("activity_sessions", INTERACTIVE, seq=0)
+    other = _Waiter("schools", EXPORT, seq=1)
+    governor.waiters = [blocked, other]
+
+    assert governor._next_waiter() is other
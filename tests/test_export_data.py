@@ -0,0 +1,39 @@
+import pyarrow.parquet as pq
+
+from export_data import _limit_rows, write_parquet
+
+
+def _session(i, end_time=None):
+    return {
+        "id": i,
+        "activity_id": f"a{i % 3}",
+        "status": "completed" if end_time else "active",
+        "start_time": "10:00:00",
+        "end_time": end_time,
+        "created_at": f"2025-01-{1 + i % 28:02d}T10:00:00+00:00",
+    }
+
+
+def test_parquet_null_column_in_first_page(tmp_path):
+    # end_time is null throughout page 1 and set on page 2
+    pages = [
+        [_session(i) for i in range(3)],
+        [_session(i, end_time="10:30:00") for i in range(3, 6)],
+    ]
+    path = tmp_path / "sessions.parquet"
+
+    assert write_parquet(iter(pages), str(path)) == 6
+
+    table = pq.read_table(path)
+    assert table.num_rows == 6
+    assert table.column("end_time").to_pylist() == [None] * 3 + ["10:30:00"] * 3
+    assert str(table.schema.field("created_at").type) == "timestamp[us, tz=UTC]"
+    assert table.column("id").to_pylist() == [str(i) for i in range(6)]
+
+
+def test_limit_rows_stops_mid_page():
+    pages = [[{"id": i} for i in range(j, j + 4)] for j in (0, 4, 8)]
+
+    limited = list(_limit_rows(iter(pages), 6))
+
+    assert [len(rows) for rows in limited] == [4, 2]
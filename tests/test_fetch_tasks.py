@@ -0,0 +1,25 @@
+import time
+
+import pytest
+
+from fetch_tasks import FetchCancelled, FetchScope, POLL_INTERVAL, check_cancelled
+
+
+def test_wait_polls_until_slow_fetch_finishes():
+    scope = FetchScope("test")
+
+    def slow():
+        time.sleep(POLL_INTERVAL * 3)
+        return 42
+
+    assert scope.wait(scope.submit(slow)) == 42
+
+
+def test_cancelled_scope_stops_queued_fetch():
+    scope = FetchScope("test")
+    scope.cancel()
+
+    future = scope.submit(check_cancelled)
+
+    with pytest.raises(FetchCancelled):
+        future.result(timeout=5)
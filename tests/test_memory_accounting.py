@@ -0,0 +1,72 @@
+import threading
+
+import numpy as np
+import pytest
+import streamlit as st
+
+import memory_accounting
+from fetch_tasks import SESSION_SCOPE_KEY, FetchScope
+from memory_accounting import EVICTIONS_KEY, STREAMING_KEY, enforce_budget
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def session_state():
+    st.session_state.clear()
+    yield st.session_state
+    st.session_state.clear()
+
+
+def test_largest_entries_go_first_until_the_session_fits(session_state):
+    session_state["big"] = np.zeros(MB)
+    session_state["medium"] = np.zeros(MB // 4)
+    session_state["small"] = "kept"
+
+    sizes = memory_accounting.session_state_sizes()
+    budget = sizes["medium"] + sizes["small"]
+
+    result = enforce_budget(budget)
+
+    assert result["evicted"] == ["big"]
+    assert result["total"] <= budget
+    assert set(session_state.keys()) == {"medium", "small", STREAMING_KEY, EVICTIONS_KEY}
+    assert session_state[STREAMING_KEY]
+    assert session_state[EVICTIONS_KEY] == 1
+
+
+def test_streaming_switches_off_once_back_under_budget(session_state):
+    session_state["big"] = np.zeros(MB)
+    enforce_budget(MB)
+    assert session_state[STREAMING_KEY]
+
+    result = enforce_budget(MB)
+
+    assert result["evicted"] == []
+    assert not session_state[STREAMING_KEY]
+    assert session_state[EVICTIONS_KEY] == 1
+
+
+def test_scope_keeps_fetches_still_running(session_state):
+    scope = FetchScope("test")
+    finished = scope.submit(np.zeros, MB)
+    finished.result(timeout=5)
+
+    release = threading.Event()
+    running = scope.submit(release.wait, 5)
+
+    session_state[SESSION_SCOPE_KEY] = scope
+    try:
+        result = enforce_budget(MB)
+    finally:
+        release.set()
+
+    assert result["evicted"] == [SESSION_SCOPE_KEY]
+    assert session_state[SESSION_SCOPE_KEY] is scope
+    assert scope.futures == [running]
+
+
+def test_sizes_follow_session_state(session_state):
+    session_state["array"] = np.zeros(1000)
+
+    assert memory_accounting.session_state_sizes()["array"] >= 8000
@@ -0,0 +1,61 @@
+import os
+import pickle
+import stat
+import zlib
+
+import pytest
+
+from persistent_cache import InsecureCacheLocation, PersistentCache
+
+
+def _mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_files_are_private(tmp_path):
+    path = tmp_path / "cache" / "cache.sqlite3"
+    PersistentCache(str(path))
+
+    assert _mode(path.parent) == 0o700
+    assert _mode(path) == 0o600
+    assert _mode(path.parent / "cache.key") == 0o600
+
+
+def test_rejects_shared_directory(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir(mode=0o777)
+    os.chmod(shared, 0o777)
+
+    with pytest.raises(InsecureCacheLocation):
+        PersistentCache(str(shared / "cache.sqlite3"))
+
+
+def test_unsigned_entry_is_never_unpickled(tmp_path):
+    cache = PersistentCache(str(tmp_path / "c" / "cache.sqlite3"))
+    cache.set("k", {"a": 1})
+    assert cache.get("k") == {"a": 1}
+
+    class Boom:
+        def __reduce__(self):
+            return (pytest.fail, ("unpickled a planted entry",))
+
+    planted = b"\0" * 32 + zlib.compress(pickle.dumps(Boom()))
+    cache._connect().execute("UPDATE entries SET value = ? WHERE key = 'k'", (planted,))
+
+    assert cache.get("k", "miss") == "miss"
+
+
+def test_running_total_and_eviction(tmp_path):
+    cache = PersistentCache(str(tmp_path / "c" / "cache.sqlite3"), max_bytes=20_000)
+
+    for i in range(50):
+        cache.set(f"k{i}", os.urandom(1000))
+    cache.set("k49", os.urandom(500))
+
+    (actual,) = cache._connect().execute(
+        "SELECT COALESCE(SUM(size), 0) FROM entries"
+    ).fetchone()
+    assert cache.total_bytes() == actual
+    assert actual <= 20_000
+    assert cache.get("k0") is None
+    assert cache.get("k48") is not None
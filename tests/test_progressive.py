@@ -0,0 +1,26 @@
+import pytest
+
+from progressive import wilson_interval
+
+
+@pytest.mark.parametrize("successes, n, low, high", [
+    (5, 10, 0.2366, 0.7634),
+    (0, 10, 0.0, 0.2775),
+    (10, 10, 0.7225, 1.0),
+    (1, 20, 0.0089, 0.2361),
+    (81, 263, 0.2553, 0.3662),
+])
+def test_wilson_interval_matches_reference_values(successes, n, low, high):
+    interval = wilson_interval(successes, n)
+    assert interval == pytest.approx((low, high), abs=1e-4)
+
+
+def test_wilson_interval_contains_proportion():
+    for n in (1, 7, 50, 1000):
+        for successes in range(0, n + 1, max(1, n // 7)):
+            low, high = wilson_interval(successes, n)
+            assert 0.0 <= low <= successes / n <= high <= 1.0
+
+
+def test_wilson_interval_without_data_is_uninformative():
+    assert wilson_interval(0, 0) == (0.0, 1.0)
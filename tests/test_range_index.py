@@ -0,0 +1,165 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import range_index
+from range_index import (
+    NULL_LOWER,
+    NULL_UPPER,
+    DaySums,
+    KeyedDaySums,
+    SpanSums,
+    day_span
+)
+
+FIRST_DAY = 738000
+DAYS = 60
+
+
+def _rows(seed, n, max_span):
+    """
+    Random spans (a few without a timestamp) and value vectors.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    lower = rng.integers(FIRST_DAY, FIRST_DAY + DAYS, size=n)
+    upper = lower + rng.integers(0, max_span + 1, size=n)
+
+    null = rng.random(n) < 0.05
+    lower[null] = NULL_LOWER
+    upper[null] = NULL_UPPER
+
+    values = rng.integers(0, 5, size=(n, 3))
+    return lower.astype(np.int64), upper.astype(np.int64), values.astype(np.int64)
+
+
+def _windows():
+    yield NULL_LOWER, NULL_UPPER
+    yield NULL_LOWER, FIRST_DAY + 30
+    yield FIRST_DAY + 10, NULL_UPPER
+    yield FIRST_DAY - 5, FIRST_DAY - 1
+    yield FIRST_DAY + DAYS + 5, FIRST_DAY + DAYS + 10
+    yield FIRST_DAY + 20, FIRST_DAY + 10
+
+    rng = np.random.default_rng(0)
+    for _ in range(40):
+        start = int(rng.integers(FIRST_DAY - 3, FIRST_DAY + DAYS + 3))
+        yield start, start + int(rng.integers(0, 40))
+
+
+def _brute_force(lower, upper, values, start, end):
+    inside = (lower >= start) & (upper <= end)
+    return values[inside].sum(axis=0)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_day_sums_match_brute_force(seed):
+    lower, upper, values = _rows(seed, 500, max_span=1)
+    sums = DaySums(lower, upper, values)
+
+    for start, end in _windows():
+        assert sums.window(start, end).tolist() == (
+            _brute_force(lower, upper, values, start, end).tolist()
+        )
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_keyed_day_sums_match_brute_force(seed):
+    lower, upper, _ = _rows(seed, 500, max_span=1)
+    keys = np.random.default_rng(seed).integers(0, 7, size=len(lower))
+
+    # One column per key, as a dense matrix would hold them
+    dense = np.zeros((len(keys), 7), dtype=np.int64)
+    dense[np.arange(len(keys)), keys] = 1
+
+    sums = KeyedDaySums(lower, upper, keys, 7)
+
+    for start, end in _windows():
+        assert sums.window(start, end).tolist() == (
+            _brute_force(lower, upper, dense, start, end).tolist()
+        )
+
+
+def test_keyed_day_sums_without_rows():
+    empty = np.array([], dtype=np.int64)
+    sums = KeyedDaySums(empty, empty, empty, 3)
+
+    assert sums.window(NULL_LOWER, NULL_UPPER).tolist() == [0, 0, 0]
+    assert sums.window(FIRST_DAY, FIRST_DAY + 10).tolist() == [0, 0, 0]
+
+
+@pytest.mark.parametrize("max_cells", [range_index.MAX_GRID_CELLS, 0])
+@pytest.mark.parametrize("seed", [1, 2])
+def test_span_sums_match_brute_force(seed, max_cells, monkeypatch):
+    monkeypatch.setattr(range_index, "MAX_GRID_CELLS", max_cells)
+
+    lower, upper, values = _rows(seed, 500, max_span=20)
+    sums = SpanSums(lower, upper, values)
+    assert (sums.grid is None) == (max_cells == 0)
+
+    for start, end in _windows():
+        assert sums.window(start, end).tolist() == (
+            _brute_force(lower, upper, values, start, end).tolist()
+        )
+
+
+@pytest.mark.parametrize("raw, span", [
+    (None, (NULL_LOWER, NULL_UPPER)),
+    ("not a timestamp", (NULL_LOWER, NULL_UPPER)),
+    ("2024-03-05T00:00:00+00:00", (738950, 738950)),
+    ("2024-03-05T13:45:00+00:00", (738950, 738951)),
+    ("2024-03-05T01:00:00+02:00", (738949, 738950)),
+])
+def test_day_span(raw, span):
+    assert day_span(raw) == span
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """
+    Records the index builds started, and runs them on `builds.run()`,
+    for schools of an estimated `builds.rows` sessions.
+    """
+
+    builds = SimpleNamespace(started=[], pending=[], rows=10)
+
+    def submit(fn, *args):
+        builds.started.append(args[1])
+        builds.pending.append((fn, args))
+
+    def run():
+        while builds.pending:
+            fn, args = builds.pending.pop()
+            fn(*args)
+
+    builds.run = run
+
+    monkeypatch.setattr(range_index, "_pool", SimpleNamespace(submit=submit))
+    monkeypatch.setattr(range_index, "build_range_index", lambda supabase, school_id: None)
+    monkeypatch.setattr(
+        range_index, "estimate_session_rows", lambda supabase, school_id: builds.rows
+    )
+    range_index.clear_range_indexes()
+    yield builds
+    range_index.clear_range_indexes()
+
+
+def test_streaming_sessions_never_start_a_build(builds, monkeypatch):
+    monkeypatch.setattr(range_index, "prefer_streaming", lambda: True)
+
+    assert range_index.get_range_index(None, "s1") is None
+    assert builds.started == []
+
+
+def test_large_schools_are_not_indexed_or_rechecked(builds, monkeypatch):
+    monkeypatch.setattr(range_index, "RANGE_INDEX_MAX_ROWS", 100)
+    builds.rows = 101
+
+    assert range_index.get_range_index(None, "s1") is None
+    builds.run()
+    assert range_index.get_range_index(None, "s1") is None
+
+    assert builds.started == ["s1"]
+    assert "s1" not in range_index._indexes
@@ -0,0 +1,81 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import resilience
+from concurrency_governor import AdmissionTimeout
+from fetch_tasks import FetchCancelled
+from resilience import CircuitBreaker
+
+
+def _half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "half-open"
+    return breaker
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    """
+    A breaker for a fake endpoint whose single attempt raises
+    `endpoint.error`.
+    """
+
+    breaker = _half_open_breaker()
+    state = SimpleNamespace(breaker=breaker, error=None)
+
+    def execute_once(query, name, hedge):
+        raise state.error
+
+    monkeypatch.setattr(resilience, "endpoint_name", lambda query: "schools")
+    monkeypatch.setattr(resilience, "query_key", lambda query: ("schools",))
+    monkeypatch.setattr(resilience, "breaker_for", lambda name: breaker)
+    monkeypatch.setattr(resilience, "_execute_once", execute_once)
+
+    return state
+
+
+def _query():
+    return SimpleNamespace(request=SimpleNamespace())
+
+
+@pytest.mark.parametrize("error", [AdmissionTimeout("busy"), FetchCancelled()])
+def test_local_errors_give_back_the_half_open_trial(endpoint, error):
+    endpoint.error = error
+
+    with pytest.raises(type(error)):
+        resilience.execute(_query(), retries=0)
+
+    # Still half-open, and the next call may make the trial
+    assert endpoint.breaker.state == "half-open"
+    assert endpoint.breaker.allow()
+
+
+def test_local_non_retryable_error_does_not_close_the_breaker(endpoint):
+    endpoint.error = ValueError("bad builder")
+
+    with pytest.raises(ValueError):
+        resilience.execute(_query(), retries=0)
+
+    assert endpoint.breaker.state == "half-open"
+    assert endpoint.breaker.allow()
+
+
+def test_release_trial_only_frees_the_callers_trial():
+    breaker = _half_open_breaker()
+    assert breaker.allow()
+
+    other = SimpleNamespace(released=False)
+
+    def release_elsewhere():
+        breaker.release_trial()
+        other.released = not breaker._trial_in_flight
+
+    thread = threading.Thread(target=release_elsewhere)
+    thread.start()
+    thread.join()
+
+    assert not other.released
+    assert not breaker.allow()
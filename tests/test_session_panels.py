@@ -0,0 +1,69 @@
+import pytest
+
+from activity_analytics import activity_stats_from_batch
+from records import SessionBatch
+from student_distributions import bin_session_batch, heatmap_session_batch
+
+ROWS = [
+    # Monday 2025-01-06
+    {"activity_id": "a", "status": "completed", "created_at": "2025-01-06T09:15:00+00:00",
+     "start_time": "09:00:00", "end_time": "09:12:00"},
+    {"activity_id": "a", "status": "completed", "created_at": "2025-01-06T10:00:00+00:00",
+     "start_time": "10:00:00", "end_time": "10:30:00"},
+    {"activity_id": "a", "status": "active", "created_at": "2025-01-06T11:00:00+00:00",
+     "start_time": "11:00:00", "end_time": None},
+    # Tuesday in UTC, though Monday in its own offset; no start_time
+    {"activity_id": "b", "status": "failed", "created_at": "2025-01-06T23:30:00-02:00",
+     "start_time": None, "end_time": None},
+    {"activity_id": "b", "status": "active", "created_at": None,
+     "start_time": "08:00:00", "end_time": "08:04:00"},
+]
+
+ACTIVITIES = [
+    {"id": "a", "name": "Fractions"},
+    {"id": "b", "name": "Decimals"},
+    {"id": "c", "name": "Ratios"},
+]
+
+
+def test_activity_stats_from_batch():
+    stats = activity_stats_from_batch(SessionBatch.from_rows(ROWS), ACTIVITIES)
+    stats = stats.set_index("activity_id")
+
+    assert stats["sessions_attempted"].to_dict() == {"a": 3, "b": 2, "c": 0}
+    assert stats["sessions_completed"].to_dict() == {"a": 2, "b": 0, "c": 0}
+    assert stats.loc["a", "completion_rate"] == pytest.approx(200 / 3)
+    assert stats.loc["a", "mean_time_spent"] == 21
+    assert stats.loc["a", "median_time_spent"] == 21
+    assert stats.loc["c", "median_time_spent"] == 0
+
+
+def test_histogram_bins_timed_sessions_by_state():
+    histogram = bin_session_batch(
+        SessionBatch.from_rows(ROWS), bin_width=10, max_minutes=20
+    )
+    counts = histogram[histogram["count"] > 0]
+
+    assert sorted(
+        zip(counts["activity_id"], counts["state"], counts["bin_start"], counts["count"])
+    ) == [("a", "completed", 10, 1), ("a", "completed", 20, 1)]
+
+
+def test_heatmap_uses_utc_weekday_and_start_hour():
+    heatmap = heatmap_session_batch(SessionBatch.from_rows(ROWS))
+    cells = heatmap[heatmap["sessions"] > 0].set_index(["weekday", "hour"])
+
+    assert cells["sessions"].to_dict() == {
+        (0, 9): 1, (0, 10): 1, (0, 11): 1, (1, 1): 1
+    }
+    assert cells["completed"].to_dict() == {
+        (0, 9): 1, (0, 10): 1, (0, 11): 0, (1, 1): 0
+    }
+
+
+def test_empty_batch():
+    batch = SessionBatch()
+
+    assert bin_session_batch(batch).empty
+    assert heatmap_session_batch(batch)["sessions"].sum() == 0
+    assert activity_stats_from_batch(batch, ACTIVITIES)["sessions_attempted"].sum() == 0
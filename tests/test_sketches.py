@@ -0,0 +1,57 @@
+import random
+import statistics
+
+import pytest
+
+from sketches import DEFAULT_RELATIVE_ACCURACY, QuantileSketch
+
+
+def _sketch(values):
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+@pytest.mark.parametrize("values", [
+    [2, 3],
+    [1, 1, 5, 9],
+    [10, 20, 30, 40],
+    [7],
+    [1, 2, 3],
+    [0, 0, 4, 8],
+    [0, 6],
+    [3.5, 12.25, 40, 41, 90],
+])
+def test_median_matches_statistics_median(values):
+    expected = statistics.median(values)
+    assert _sketch(values).median() == pytest.approx(
+        expected, rel=DEFAULT_RELATIVE_ACCURACY
+    )
+
+
+@pytest.mark.parametrize("n", [100, 101])
+def test_median_of_random_values(n):
+    rng = random.Random(n)
+    values = [rng.uniform(1, 120) for _ in range(n)]
+
+    sketch = QuantileSketch()
+    sketch.add_many(values)
+
+    assert sketch.median() == pytest.approx(
+        statistics.median(values), rel=DEFAULT_RELATIVE_ACCURACY
+    )
+
+
+def test_merged_median_matches_median_of_all_values():
+    a, b = [1, 5, 9], [2, 40, 41, 100]
+    merged = _sketch(a).merge(_sketch(b))
+
+    assert merged.count == 7
+    assert merged.median() == pytest.approx(
+        statistics.median(a + b), rel=DEFAULT_RELATIVE_ACCURACY
+    )
+
+
+def test_empty_sketch():
+    assert QuantileSketch().median() == 0.0